@@ -0,0 +1,781 @@
+import argparse
+import contextlib
+import hashlib
+import importlib
+import io
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import chain
+from urllib.parse import unquote
+
+import httpCache
+import npmCalls
+import packageStore
+import typosquatIndex
+import typosquatting
+import verdictCache
+from rateLimiter import rateLimiter
+
+'''
+Benchmarks for the tool, every benchmark runs against local fixtures so no calls are made to the real npm registry
+
+Usage: python code/benchmark.py <benchmark> [options]
+'''
+
+'''
+Builds a fake but realistically shaped full packument, large packages have hundreds of versions each carrying their own metadata plus a readme
+'''
+def makeFullPackument(packageName: str, versionCount: int, modified: str = "2024-05-01T10:00:00.000Z") -> dict:
+    versions = {}
+    times = {"created": "2015-01-01T00:00:00.000Z", "modified": modified}
+    for i in range(versionCount):
+        version = f"{i // 100}.{(i // 10) % 10}.{i % 10}"
+        versions[version] = {
+            "name": packageName,
+            "version": version,
+            "description": f"Fixture package {packageName} used for benchmarking the registry calls",
+            "main": "index.js",
+            "scripts": {"test": "node test.js", "build": "tsc -p ."},
+            "repository": {"type": "git", "url": f"git+https://github.com/example/{packageName}.git"},
+            "keywords": ["fixture", "benchmark", packageName],
+            "author": {"name": "Fixture Author", "email": "author@example.com"},
+            "license": "MIT",
+            "dependencies": {f"dep-{j}": f"^{j}.0.0" for j in range(5)},
+            "devDependencies": {f"dev-dep-{j}": f"^{j}.0.0" for j in range(8)},
+            "engines": {"node": ">=14"},
+            "dist": {
+                "shasum": "0" * 40,
+                "tarball": f"https://registry.npmjs.org/{packageName}/-/{packageName}-{version}.tgz",
+                "integrity": "sha512-" + "A" * 86 + "==",
+                "fileCount": 12,
+                "unpackedSize": 45678,
+            },
+            "maintainers": [{"name": "maintainer", "email": "maintainer@example.com"}],
+            "_npmUser": {"name": "maintainer", "email": "maintainer@example.com"},
+            "gitHead": "f" * 40,
+        }
+        times[version] = "2020-01-01T00:00:00.000Z"
+    return {
+        "_id": packageName,
+        "name": packageName,
+        "dist-tags": {"latest": version},
+        "versions": versions,
+        "time": times,
+        "maintainers": [{"name": "maintainer", "email": "maintainer@example.com"}],
+        "readme": "# " + packageName + "\n" + ("Lorem ipsum dolor sit amet. " * 400),
+        "readmeFilename": "README.md",
+    }
+
+'''
+Reduces a full packument to the abbreviated (corgi) shape the registry returns for the install-v1 Accept header
+'''
+def makeAbbreviatedPackument(full: dict) -> dict:
+    keep = ("name", "version", "dependencies", "devDependencies", "engines", "dist", "bin", "optionalDependencies", "peerDependencies")
+    return {
+        "name": full["name"],
+        "modified": full["time"]["modified"],
+        "dist-tags": full["dist-tags"],
+        "versions": {version: {key: meta[key] for key in keep if key in meta} for version, meta in full["versions"].items()},
+    }
+
+'''
+Local stand in for registry.npmjs.org and api.npmjs.org, serves packuments (full or abbreviated depending on the Accept header) and download counts
+'''
+class FixtureRegistry:
+    def __init__(self, packuments: dict, downloads: dict = None, latency: float = 0.0, rateLimit: float = None):
+        self.full = {name: json.dumps(doc).encode() for name, doc in packuments.items()}
+        self.abbreviated = {name: json.dumps(makeAbbreviatedPackument(doc)).encode() for name, doc in packuments.items()}
+        self.downloads = downloads or {}
+        self.latency = latency
+        self.rateLimit = rateLimit
+        self.requestCount = 0
+        self.notModifiedCount = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.makeHandler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def makeHandler(self):
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                registry.requestCount += 1
+                if registry.latency:
+                    time.sleep(registry.latency)
+                path = unquote(self.path)
+                if path.startswith("/downloads/point/"):
+                    body = registry.downloadsBody(path.split("/")[3], path.split("/", 4)[4])
+                else:
+                    name = path.lstrip("/")
+                    wantsAbbreviated = "application/vnd.npm.install-v1+json" in self.headers.get("Accept", "")
+                    body = (registry.abbreviated if wantsAbbreviated else registry.full).get(name)
+                if body is None:
+                    body = b'{"error":"Not found"}'
+                    self.send_response(404)
+                else:
+                    etag = '"' + hashlib.md5(body).hexdigest() + '"'
+                    if self.headers.get("If-None-Match") == etag:
+                        registry.notModifiedCount += 1
+                        self.send_response(304)
+                        self.send_header("ETag", etag)
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    self.send_response(200)
+                    self.send_header("ETag", etag)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    '''
+    Download counts are given per week, the monthly endpoint reports four times that
+    '''
+    def downloadsBody(self, period: str, names: str):
+        multiplier = 4 if period == "last-month" else 1
+        packageNames = names.split(",")
+        if len(packageNames) == 1:
+            downloads = self.downloads.get(packageNames[0])
+            if downloads is None:
+                return None
+            return json.dumps({"downloads": downloads * multiplier, "package": packageNames[0]}).encode()
+        return json.dumps({name: ({"downloads": self.downloads[name] * multiplier, "package": name} if name in self.downloads else None) for name in packageNames}).encode()
+
+    '''
+    Points npmCalls at the fixture registry and turns the on-disk cache off so fixture responses never end up in database/httpCache.db
+    The rate limiter is effectively turned off for the fixture unless a rateLimit (requests per second) is given
+    '''
+    def __enter__(self):
+        self.thread.start()
+        httpCache.setCacheEnabled(False)
+        host, port = self.server.server_address
+        rate = self.rateLimit or 1e6
+        rateLimiter.hostLimits[f"{host}:{port}"] = (rate, rate)
+        self.previousUrls = (npmCalls.REGISTRY_URL, npmCalls.DOWNLOADS_URL)
+        npmCalls.REGISTRY_URL = f"http://{host}:{port}"
+        npmCalls.DOWNLOADS_URL = f"http://{host}:{port}/downloads"
+        return self
+
+    def __exit__(self, *exc):
+        npmCalls.REGISTRY_URL, npmCalls.DOWNLOADS_URL = self.previousUrls
+        httpCache.setCacheEnabled(True)
+        self.server.shutdown()
+        self.server.server_close()
+
+def makeFixturePackuments(count: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    return {f"fixture-package-{i}": makeFullPackument(f"fixture-package-{i}", rng.choice([3, 10, 40, 150, 600])) for i in range(count)}
+
+'''
+Compares downloading the full packument against the abbreviated metadata document for the last update lookups
+'''
+def benchmarkMetadata(args):
+    packuments = makeFixturePackuments(args.packages)
+    with FixtureRegistry(packuments):
+        print(f"{'mode':<12} {'requests':>8} {'MB transferred':>15} {'parse s':>9} {'wall s':>9}")
+        for mode in ("full", "abbreviated"):
+            headers = {"Accept": npmCalls.ABBREVIATED_ACCEPT} if mode == "abbreviated" else None
+            totalBytes = 0
+            parseTime = 0.0
+            start = time.perf_counter()
+            for name in packuments:
+                response = npmCalls.httpGet(f"{npmCalls.REGISTRY_URL}/{name}", headers=headers)
+                totalBytes += len(response.content)
+                parseStart = time.perf_counter()
+                npmCalls.lastModifiedFromMetadata(json.loads(response.content))
+                parseTime += time.perf_counter() - parseStart
+            wall = time.perf_counter() - start
+            print(f"{mode:<12} {len(packuments):>8} {totalBytes / 1e6:>15.2f} {parseTime:>9.3f} {wall:>9.3f}")
+
+'''
+Runs a block of code inside a temporary working directory with an empty database/ folder, the database modules use paths relative to the working directory
+'''
+class TemporaryWorkspace:
+    def __enter__(self):
+        self.previous = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.directory.name, "database"))
+        os.chdir(self.directory.name)
+        return self.directory.name
+
+    def __exit__(self, *exc):
+        packageStore.closeStore()
+        verdictCache.closeVerdictCache()
+        os.chdir(self.previous)
+        self.directory.cleanup()
+
+def makeHighImpactNames(count: int, scopedFraction: float, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    scopes = [f"@scope{i}" for i in range(60)]
+    return [f"{rng.choice(scopes)}/pkg-{i}" if rng.random() < scopedFraction else f"pkg-{i}" for i in range(count)]
+
+'''
+Wall time to populate the legitimate database for the whole high impact set, with the scoped packages fetched one at a time (the old live path) and concurrently
+Every fixture request has an artificial latency to stand in for the round trip to the real registry
+'''
+def benchmarkPopulate(args):
+    if args.names_file:
+        with open(args.names_file) as f:
+            names = json.load(f)
+    else:
+        names = makeHighImpactNames(args.packages, args.scoped_fraction)
+    packuments = {name: makeFullPackument(name, 3) for name in names}
+    downloads = {name: 50000 for name in names}
+    scopedCount = sum(1 for name in names if name.startswith("@"))
+    print(f"{len(names)} packages ({scopedCount} scoped), {args.latency * 1000:.0f}ms simulated latency per request")
+    print(f"{'scoped concurrency':<20} {'wall s':>9} {'requests':>9} {'rows':>7}")
+
+    for concurrency in args.concurrency:
+        with TemporaryWorkspace(), FixtureRegistry(packuments, downloads, latency=args.latency) as registry:
+            import databaseSetup
+            import populateDatabase
+            importlib.reload(databaseSetup).setupDatabase() # databaseSetup connects when it is imported, reloading it creates the table in this workspace
+            npmCalls._memo.clear()
+            stdout = sys.stdout
+            sys.stdout = open(os.devnull, "w")
+            try:
+                start = time.perf_counter()
+                populateDatabase.populatePackages(names, scopedConcurrency=concurrency)
+                wall = time.perf_counter() - start
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+            rows = populateDatabase.sqlite3.connect("database/legitimate.db").execute("SELECT COUNT(*) FROM legitimate").fetchone()[0]
+            print(f"{concurrency:<20} {wall:>9.2f} {registry.requestCount:>9} {rows:>7}")
+
+'''
+The old per row writes the sweep used before PackageStore, a connection and a commit for every row, kept here as the baseline for benchmarkStore
+'''
+def legacyAddTyposquatted(packageName: str, typoSquattedFrom : str, weeklyDownloads: int, monthlyDownloads: int, lastUpdate: str, detectionMethods: str):
+    connect = sqlite3.connect("database/typosquatted.db")
+    cursor = connect.cursor()
+    cursor.execute('''
+        INSERT OR IGNORE INTO typosquatted (packageName, typosquattedFrom, weeklyDownloads, monthlyDownloads, lastUpdate, detectionMethods)
+        VALUES (?, ?, ?, ?, ?, ?)''', (packageName, typoSquattedFrom, weeklyDownloads, monthlyDownloads, lastUpdate, detectionMethods))
+    connect.commit()
+    connect.close()
+
+def legacyAddNotCreated(packageName: str):
+    connect = sqlite3.connect("database/notCreated.db")
+    cursor = connect.cursor()
+    cursor.execute('''INSERT OR IGNORE INTO notCreated (packageName) VALUES (?)''', (packageName,))
+    connect.commit()
+    connect.close()
+
+'''
+Rows per second written by the old per row helpers (one connection and commit per row) against the single connection bulk store
+'''
+def benchmarkStore(args):
+    rows = [(f"candidate-{i}", "original", 10, 40, "01-01-2024 00:00:00", "Levenshtein distance - Keyboard Proximity", [("original", "Levenshtein distance - Keyboard Proximity")]) for i in range(args.rows)]
+    print(f"{'path':<32} {'rows':>7} {'seconds':>9} {'rows/s':>11}")
+
+    with TemporaryWorkspace():
+        import typosquatting
+        typosquatting.createTyposquattingDatabase()
+        typosquatting.createNotCreatedDatabase()
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+        try:
+            timings = []
+            start = time.perf_counter()
+            for row in rows:
+                legacyAddNotCreated(row[0])
+            timings.append(("per row notCreated", time.perf_counter() - start))
+            start = time.perf_counter()
+            for row in rows:
+                legacyAddTyposquatted(*row[:6])
+            timings.append(("per row typosquatted", time.perf_counter() - start))
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    with TemporaryWorkspace():
+        store = packageStore.PackageStore()
+        start = time.perf_counter()
+        for i in range(0, len(rows), args.batch_size):
+            with store.transaction():
+                store.addNotCreated([(row[0], row[1], row[5], row[6]) for row in rows[i:i + args.batch_size]])
+        timings.append((f"bulk notCreated ({args.batch_size}/txn)", time.perf_counter() - start))
+        start = time.perf_counter()
+        for i in range(0, len(rows), args.batch_size):
+            with store.transaction():
+                store.addTyposquatted(rows[i:i + args.batch_size])
+        timings.append((f"bulk typosquatted ({args.batch_size}/txn)", time.perf_counter() - start))
+        store.close()
+
+    for path, seconds in timings:
+        print(f"{path:<32} {len(rows):>7} {seconds:>9.3f} {len(rows) / seconds:>11.0f}")
+
+'''
+The database lookups nscan install made before a name was resolved in one query, each opens its own connection like the old checkInTyposquattedDB,
+checkInLegitimateDB and calculateIndexScoreForTyposquatting did, in the same order main called them
+'''
+def legacyFetchOne(database: str, table: str, packageName: str):
+    connect = sqlite3.connect(f"database/{database}.db")
+    row = connect.execute(f"SELECT * FROM {table} WHERE packageName=?", (packageName,)).fetchone()
+    connect.close()
+    return row
+
+def legacyResolve(packageName: str):
+    typosquatted = lambda: legacyFetchOne("typosquatted", "typosquatted", packageName)
+    legitimate = lambda: legacyFetchOne("legitimate", "legitimate", packageName)
+    if not typosquatted() and not legitimate():
+        return None
+    elif typosquatted():
+        row = typosquatted()
+        return row, legacyFetchOne("legitimate", "legitimate", row[2]) # the original, fetched again inside the scoring
+    elif legitimate():
+        return legitimate()
+
+'''
+Latency of the database phase of a single package scan, the old sequence of per call connections (2 to 5 queries depending on where the name is) against
+one resolve on the shared store connection, and per name cost of resolveMany for a batch scan
+'''
+def benchmarkResolve(args):
+    rng = random.Random(2)
+    seeds = makeRealisticNames(args.packages)
+    typosquats = list(dict.fromkeys(mutateName(seed, rng) for seed in seeds))
+    typosquats = [name for name in typosquats if name not in set(seeds)]
+    unknown = [f"unknown-{i}-{rng.randrange(10 ** 6)}" for i in range(args.packages)]
+
+    with TemporaryWorkspace():
+        store = packageStore.PackageStore()
+        with store.transaction():
+            store.upsertLegitimate([(seed, rng.randrange(10 ** 6), rng.randrange(10 ** 7), "01-01-2024 00:00:00") for seed in seeds])
+            store.addTyposquatted([(name, rng.choice(seeds), 10, 40, "01-01-2023 00:00:00", "Levenshtein distance - Keyboard Proximity", []) for name in typosquats])
+        queries = [(kind, name) for kind, names in (("legitimate", seeds), ("typosquatted", typosquats), ("unknown", unknown)) for name in rng.sample(names, min(len(names), args.queries))]
+        rng.shuffle(queries)
+        print(f"{len(seeds)} legitimate, {len(typosquats)} typosquatted rows, {len(queries)} queries")
+        print(f"{'path':<28} {'names':<13} {'queries':>8} {'mean us':>9} {'p50 us':>9} {'p99 us':>9}")
+
+        for path, lookup in (("per call connections", legacyResolve), ("store.resolve", store.resolve)):
+            latencies = {}
+            for kind, name in queries:
+                start = time.perf_counter()
+                lookup(name)
+                latencies.setdefault(kind, []).append(time.perf_counter() - start)
+            latencies["all"] = list(chain.from_iterable(latencies.values()))
+            for kind in ("legitimate", "typosquatted", "unknown", "all"):
+                values = sorted(latencies[kind])
+                print(f"{path:<28} {kind:<13} {len(values):>8} {sum(values) / len(values) * 1e6:>9.1f} {values[len(values) // 2] * 1e6:>9.1f} {values[int(len(values) * 0.99)] * 1e6:>9.1f}")
+
+        names = [name for _, name in queries]
+        start = time.perf_counter()
+        store.resolveMany(names)
+        seconds = time.perf_counter() - start
+        print(f"{'store.resolveMany':<28} {'all':<13} {len(names):>8} {seconds / len(names) * 1e6:>9.1f} {'-':>9} {'-':>9}")
+
+'''
+What the nscan daemon saves: the cost of starting Python and importing nscan for every scan, the first (uncached) verdict for a name and then cached verdicts,
+all through the same client nscan install uses. Verdicts skip the install script scan so only the lookups and scoring are measured
+'''
+def benchmarkDaemon(args):
+    import nscanClient
+    import nscanDaemon
+    codeDirectory = os.path.dirname(os.path.abspath(__file__))
+    start = time.perf_counter()
+    for _ in range(args.startups):
+        subprocess.run([sys.executable, "-c", "import nscan"], cwd=codeDirectory, check=True)
+    startupSeconds = (time.perf_counter() - start) / args.startups
+
+    seeds = makeRealisticNames(args.packages)
+    rng = random.Random(3)
+    names = rng.sample(seeds, args.names // 2) + [mutateName(seed, rng) for seed in rng.sample(seeds, args.names - args.names // 2)]
+    packuments = {name: makeFullPackument(name, 3) for name in names}
+    with TemporaryWorkspace(), FixtureRegistry(packuments, {name: 1000 for name in names}, latency=args.latency):
+        store = packageStore.PackageStore()
+        with store.transaction():
+            store.upsertLegitimate([(seed, 1000, 4000, "01-01-2024 00:00:00") for seed in seeds])
+        store.close()
+        server = nscanDaemon.makeServer(port=0, quiet=True)
+        start = time.perf_counter()
+        server.service.warm()
+        warmSeconds = time.perf_counter() - start
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        nscanClient.DAEMON_URL = f"http://127.0.0.1:{server.server_address[1]}"
+        try:
+            timings = {}
+            for path in ("first verdict", "cached verdict"):
+                for name in names:
+                    start = time.perf_counter()
+                    nscanClient.fetchVerdict(name, "none")
+                    timings.setdefault(path, []).append(time.perf_counter() - start)
+            start = time.perf_counter()
+            nscanClient.fetchVerdicts(names, "none")
+            batchSeconds = time.perf_counter() - start
+        finally:
+            server.shutdown()
+            server.server_close()
+            server.service.close()
+
+    print(f"{len(seeds)} legitimate packages, {len(names)} names (half of them typos), {args.latency * 1000:.0f}ms simulated registry latency")
+    print(f"Daemon warm up (store, indexes, HTTP session) {warmSeconds * 1000:.0f} ms, paid once instead of on every scan")
+    print(f"{'path':<28} {'requests':>8} {'mean ms':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    print(f"{'python + import nscan':<28} {args.startups:>8} {startupSeconds * 1000:>9.1f} {'-':>9} {'-':>9}")
+    for path, values in timings.items():
+        values.sort()
+        print(f"{path:<28} {len(values):>8} {sum(values) / len(values) * 1000:>9.2f} {values[len(values) // 2] * 1000:>9.2f} {values[int(len(values) * 0.99)] * 1000:>9.2f}")
+    print(f"{'cached batch POST':<28} {1:>8} {batchSeconds * 1000:>9.2f} {'-':>9} {'-':>9}  ({len(names)} names)")
+
+'''
+Repeat scans of a project's dependencies with the verdict cache, against a scan that skips the cache and the first scan that fills it
+npm install is replaced by a fixture that waits --install-seconds and writes a package.json with an install script, so the script scan still runs on real files
+'''
+def benchmarkVerdict(args):
+    import nscan
+    import scanInstallScripts
+
+    def fixtureInstall(scanner, workdir):
+        time.sleep(args.install_seconds)
+        packageDirectory = os.path.join(workdir, "node_modules", scanner.packageName)
+        os.makedirs(packageDirectory)
+        with open(os.path.join(packageDirectory, "package.json"), "w") as f:
+            json.dump({"name": scanner.packageName, "scripts": {"postinstall": "node build.js"}}, f)
+
+    seeds = makeRealisticNames(args.packages)
+    rng = random.Random(5)
+    names = rng.sample(seeds, args.names // 2) + [mutateName(seed, rng) for seed in rng.sample(seeds, args.names - args.names // 2)]
+    scripted = set(rng.sample(names, args.scripted))
+    dependencies = {name: {"versions": {"1.0.0"}, "hasInstallScript": name in scripted} for name in names}
+    packuments = {name: makeFullPackument(name, 3) for name in names}
+    installPackage = scanInstallScripts.ScriptScanner.installPackage
+    scanInstallScripts.ScriptScanner.installPackage = fixtureInstall
+    try:
+        with TemporaryWorkspace(), FixtureRegistry(packuments, {name: 1000 for name in names}, latency=args.latency):
+            store = packageStore.getStore()
+            with store.transaction():
+                store.upsertLegitimate([(seed, 1000, 4000, "01-01-2024 00:00:00") for seed in seeds])
+            timings = {}
+            for path, useCache in (("no verdict cache", False), ("first scan", True), ("repeat scan", True)):
+                npmCalls.clearMemo()
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    results = nscan.scanDependencies(dependencies, "auto", useCache=useCache)
+                timings[path] = (time.perf_counter() - start, sum(result["cached"] for result in results))
+    finally:
+        scanInstallScripts.ScriptScanner.installPackage = installPackage
+
+    print(f"{len(names)} dependencies (half of them typos), {len(scripted)} with install scripts at {args.install_seconds:.1f}s per npm install, {args.latency * 1000:.0f}ms simulated registry latency")
+    print(f"{'path':<20} {'seconds':>9} {'cached verdicts':>16}")
+    for path, (seconds, cached) in timings.items():
+        print(f"{path:<20} {seconds:>9.2f} {cached:>16}")
+    print(f"Repeat scan speedup: {timings['no verdict cache'][0] / timings['repeat scan'][0]:.1f}x")
+
+SYLLABLES = ["re", "act", "lo", "dash", "ex", "press", "web", "pack", "babel", "core", "util", "type", "script", "vue", "node", "fetch", "axi", "os", "mo", "ment",
+             "chalk", "com", "mander", "yar", "gs", "glob", "rim", "raf", "debug", "semver", "uuid", "cross", "env", "jest", "mocha", "es", "lint", "pretty", "ier", "rx"]
+
+def makeRealisticNames(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < count:
+        name = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3)))
+        if rng.random() < 0.3:
+            name += "-" + "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 2)))
+        names.add(name)
+    return sorted(names)
+
+def mutateName(name: str, rng: random.Random) -> str:
+    i = rng.randrange(len(name))
+    operation = rng.choice(["delete", "insert", "replace", "swap"])
+    if operation == "delete" and len(name) > 1:
+        return name[:i] + name[i + 1:]
+    if operation == "swap" and i < len(name) - 1:
+        return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+    letter = rng.choice("abcdefghijklmnopqrstuvwxyz")
+    if operation == "insert":
+        return name[:i] + letter + name[i:]
+    return name[:i] + letter + name[i + 1:]
+
+'''
+Lookup latency of the typosquat index against the whole high impact set, every seed is queried once with a typo in it plus the same number of unrelated names,
+compared with scanning every seed with Levenshtein.distance for each query
+'''
+def benchmarkIndex(args):
+    import Levenshtein
+    if args.names_file:
+        with open(args.names_file) as f:
+            seeds = json.load(f)
+    else:
+        seeds = makeRealisticNames(args.packages)
+    rng = random.Random(1)
+    queries = [mutateName(seed, rng) for seed in seeds] + [f"unrelated-{i}-{rng.randrange(10 ** 6)}" for i in range(len(seeds))]
+    rng.shuffle(queries)
+
+    start = time.perf_counter()
+    index = typosquatIndex.TyposquatIndex([(seed, 0) for seed in seeds], args.max_distance)
+    buildSeconds = time.perf_counter() - start
+    print(f"Index over {len(seeds)} seeds built in {buildSeconds * 1000:.0f} ms, {len(index.deletes)} delete variants")
+
+    latencies = []
+    found = 0
+    for query in queries:
+        start = time.perf_counter()
+        matches = index.lookup(query)
+        latencies.append(time.perf_counter() - start)
+        found += bool(matches)
+    latencies.sort()
+
+    bruteQueries = queries[:args.brute_force_queries]
+    start = time.perf_counter()
+    for query in bruteQueries:
+        [seed for seed in seeds if seed != query and Levenshtein.distance(query, seed, score_cutoff=args.max_distance) <= args.max_distance]
+    bruteSeconds = (time.perf_counter() - start) / max(1, len(bruteQueries))
+
+    print(f"{'path':<24} {'queries':>8} {'mean us':>9} {'p50 us':>9} {'p99 us':>9}")
+    print(f"{'symmetric delete index':<24} {len(queries):>8} {sum(latencies) / len(latencies) * 1e6:>9.1f} {latencies[len(latencies) // 2] * 1e6:>9.1f} {latencies[int(len(latencies) * 0.99)] * 1e6:>9.1f}")
+    print(f"{'linear Levenshtein scan':<24} {len(bruteQueries):>8} {bruteSeconds * 1e6:>9.1f} {'-':>9} {'-':>9}")
+    print(f"{found} of {len(queries)} queries matched a seed within distance {args.max_distance}")
+
+'''
+Names per second scored against the whole high impact set by the vectorized batch scorer, compared with a Python double loop over every (name, seed) pair
+'''
+def benchmarkSimilarity(args):
+    import Levenshtein
+    from similarity import SimilarityScorer
+    if args.names_file:
+        with open(args.names_file) as f:
+            seeds = json.load(f)
+    else:
+        seeds = makeRealisticNames(args.packages)
+    rng = random.Random(2)
+    names = [mutateName(rng.choice(seeds), rng) for _ in range(args.names // 2)] + [f"{rng.choice(SYLLABLES)}-feed-{i}" for i in range(args.names - args.names // 2)]
+
+    start = time.perf_counter()
+    scorer = SimilarityScorer(seeds, args.max_distance)
+    buildSeconds = time.perf_counter() - start
+    start = time.perf_counter()
+    results = scorer.score(names)
+    vectorSeconds = time.perf_counter() - start
+
+    loopNames = names[:args.loop_names]
+    start = time.perf_counter()
+    for name in loopNames:
+        [(seed, Levenshtein.distance(name, seed), Levenshtein.jaro_winkler(name, seed)) for seed in seeds if seed != name]
+    loopSeconds = time.perf_counter() - start
+
+    print(f"Scorer over {len(seeds)} seeds built in {buildSeconds * 1000:.0f} ms")
+    print(f"{'path':<28} {'names':>7} {'seconds':>9} {'names/s':>9}")
+    print(f"{'vectorized batch scorer':<28} {len(names):>7} {vectorSeconds:>9.3f} {len(names) / vectorSeconds:>9.0f}")
+    print(f"{'python double loop':<28} {len(loopNames):>7} {loopSeconds:>9.3f} {len(loopNames) / loopSeconds:>9.0f}")
+    print(f"{sum(1 for neighbours in results.values() if neighbours)} of {len(names)} names have a seed within distance {args.max_distance}")
+
+'''
+The candidate generators as they were before their tables were hoisted to module level, every call rebuilds the tables (copied from the module tables here
+as a stand in for the dict and list literals the old functions evaluated) kept only as the baseline for benchmarkGenerate
+'''
+def legacyLevenshteinCheck(packageName: str):
+    generated = []
+    keyboardNeighbors = {letter: list(neighbours) for letter, neighbours in typosquatting.KEYBOARD_NEIGHBORS.items()}
+    generated.append((packageName + "s", packageName, "Levenshtein distance - added 's'"))
+    for i in range(len(packageName)):
+        generated.append((packageName[:i] + packageName[i] + packageName[i:], packageName, "Levenshtein distance - duplicated character"))
+    for i in range(len(packageName)):
+        generated.append((packageName[:i] + packageName[i+1:], packageName, f"Levenshtein distance - Remove character"))
+    for i in range(len(packageName) - 1):
+        if packageName[i] == packageName[i+1]:
+            continue
+        generated.append((packageName[:i] + packageName[i+1] + packageName[i] + packageName[i+2:], packageName, f"Levenshtein distance - Swap adjacent characters"))
+    for i, char in enumerate(packageName):
+        for neighbour in keyboardNeighbors.get(char, []):
+            modifiedName = packageName[:i] + neighbour + packageName[i+1:]
+            if modifiedName != packageName:
+                generated.append((modifiedName, packageName, f"Levenshtein distance - Keyboard Proximity"))
+    return generated
+
+def legacyHomographCheck(packageName: str):
+    generated = []
+    homographMap = {letter: list(homographs) for letter, homographs in typosquatting.HOMOGRAPH_MAP.items()}
+    for letter in packageName:
+        if letter in homographMap:
+            for homograph in homographMap[letter]:
+                homographStripped = homograph.split(" ")[1]
+                generated.append((packageName.replace(letter, homographStripped), packageName, f"Homograph attack - replaced {letter} with {homographStripped}"))
+    return generated
+
+def legacyCombosquattingCheck(packageName: str):
+    generated = []
+    prefixes = list(typosquatting.COMBOSQUATTING_PREFIXES)
+    suffixes = list(typosquatting.COMBOSQUATTING_SUFFIXES)
+    for prefix in prefixes:
+        generated.append((prefix + packageName, packageName, f"Combosquatting - added prefix"))
+    for suffix in suffixes:
+        generated.append((packageName + suffix, packageName, f"Combosquatting - added suffix"))
+    return generated
+
+def legacyHyphenUnderscoreCheck(packageName: str):
+    generated = []
+    if "-" in packageName:
+        generated.append((packageName.replace("-", "_"), packageName, f"Hyphen/underscore manipulation"))
+    elif "_" in packageName:
+        generated.append((packageName.replace("_", "-"), packageName, f"Hyphen/underscore manipulation"))
+    return generated
+
+def legacyMergeSeedCandidates(seed: str, generated) -> list:
+    techniquesByName = {}
+    for modifiedName, originalName, message in generated:
+        techniques = techniquesByName.setdefault(modifiedName, [])
+        if message not in techniques:
+            techniques.append(message)
+    candidates = []
+    for name, techniques in techniquesByName.items():
+        provenance = [(seed, technique) for technique in techniques]
+        candidates.append(typosquatting.Candidate(name, seed, packageStore.detectionMethodsFor(provenance), provenance))
+    return [candidate for candidate in candidates if typosquatting.isPublishableName(candidate.packageName)]
+
+'''
+Candidates per second for each generator and for the whole generation stage (generators plus the per seed merge) over the full legitimate set,
+with the old per call tables and the hoisted module level tables
+'''
+def benchmarkGenerate(args):
+    if args.names_file:
+        with open(args.names_file) as f:
+            seeds = json.load(f)
+    else:
+        seeds = makeRealisticNames(args.packages)
+    checks = [
+        ("levenshteinCheck", legacyLevenshteinCheck, typosquatting.levenshteinCheck),
+        ("homographCheck", legacyHomographCheck, typosquatting.homographCheck),
+        ("combosquattingCheck", legacyCombosquattingCheck, typosquatting.combosquattingCheck),
+        ("hyphenUnderscoreCheck", legacyHyphenUnderscoreCheck, typosquatting.hyphenUnderscoreCheck),
+    ]
+
+    def timeRun(run):
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            count = run()
+            seconds = time.perf_counter() - start
+            best = seconds if best is None else min(best, seconds)
+        return count, best
+
+    print(f"{len(seeds)} seeds, best of {args.repeat} runs")
+    print(f"{'generator':<24} {'candidates':>11} {'before/s':>11} {'after/s':>11} {'speedup':>8}")
+    for name, legacy, current in checks:
+        count, before = timeRun(lambda: sum(len(legacy(seed)) for seed in seeds))
+        _, after = timeRun(lambda: sum(len(current(seed)) for seed in seeds))
+        print(f"{name:<24} {count:>11} {count / before:>11.0f} {count / after:>11.0f} {before / after:>7.2f}x")
+
+    legacyGenerate = lambda: sum(len(legacyMergeSeedCandidates(seed, chain(*(legacy(seed) for _, legacy, _ in checks)))) for seed in seeds)
+    count, before = timeRun(legacyGenerate)
+    _, after = timeRun(lambda: sum(1 for _ in typosquatting.generateCandidates(seeds)))
+    print(f"{'generateCandidates':<24} {count:>11} {count / before:>11.0f} {count / after:>11.0f} {before / after:>7.2f}x")
+
+'''
+Candidate generation wall time over the full legitimate set in one process and in process pools of increasing size
+Also checks every worker count gives the names in the same order as the single process run
+'''
+def benchmarkParallel(args):
+    from confusables import SkeletonIndex
+    if args.names_file:
+        with open(args.names_file) as f:
+            seeds = json.load(f)
+    else:
+        seeds = makeRealisticNames(args.packages)
+    skeletonIndex = SkeletonIndex([(seed, 0) for seed in seeds])
+    print(f"{len(seeds)} seeds, {os.cpu_count()} CPUs available")
+    print(f"{'workers':>7} {'candidates':>11} {'seconds':>9} {'candidates/s':>13} {'speedup':>8} {'same order':>11}")
+
+    baselineSeconds = None
+    baselineOrder = None
+    for workers in args.workers:
+        start = time.perf_counter()
+        if workers > 1:
+            names = [candidate.packageName for candidate in typosquatting.generateCandidatesParallel(seeds, workers, skeletonIndex, args.chunk_size)]
+        else:
+            names = [candidate.packageName for candidate in typosquatting.generateCandidates(seeds, skeletonIndex)]
+        seconds = time.perf_counter() - start
+        order = list(dict.fromkeys(names))
+        if baselineSeconds is None:
+            baselineSeconds, baselineOrder = seconds, order
+        print(f"{workers:>7} {len(order):>11} {seconds:>9.2f} {len(order) / seconds:>13.0f} {baselineSeconds / seconds:>7.2f}x {str(order == baselineOrder):>11}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the npm package verifier")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    metadata = subparsers.add_parser("metadata", help="full packument vs abbreviated metadata fetches")
+    metadata.add_argument("--packages", type=int, default=200)
+    metadata.set_defaults(func=benchmarkMetadata)
+
+    populate = subparsers.add_parser("populate", help="legitimate database population for the full high impact set, scoped packages sequential vs concurrent")
+    populate.add_argument("--packages", type=int, default=5688)
+    populate.add_argument("--scoped-fraction", type=float, default=0.3)
+    populate.add_argument("--names-file", help="JSON list of package names, e.g. the output of node code/getTopPackages.js")
+    populate.add_argument("--latency", type=float, default=0.01, help="seconds added to every fixture response")
+    populate.add_argument("--concurrency", type=int, nargs="+", default=[1, 16])
+    populate.set_defaults(func=benchmarkPopulate)
+
+    store = subparsers.add_parser("store", help="per row sqlite writes vs the bulk single connection store")
+    store.add_argument("--rows", type=int, default=5000)
+    store.add_argument("--batch-size", type=int, default=128)
+    store.set_defaults(func=benchmarkStore)
+
+    index = subparsers.add_parser("index", help="typosquat index lookup latency against every seed vs a linear Levenshtein scan")
+    index.add_argument("--packages", type=int, default=5688)
+    index.add_argument("--names-file", help="JSON list of package names, e.g. the output of node code/getTopPackages.js")
+    index.add_argument("--max-distance", type=int, default=typosquatIndex.DEFAULT_MAX_DISTANCE)
+    index.add_argument("--brute-force-queries", type=int, default=500)
+    index.set_defaults(func=benchmarkIndex)
+
+    similarity = subparsers.add_parser("similarity", help="vectorized batch similarity scoring throughput vs a Python double loop")
+    similarity.add_argument("--packages", type=int, default=5688)
+    similarity.add_argument("--names", type=int, default=20000, help="number of unknown names to score, half of them typos of a seed")
+    similarity.add_argument("--names-file", help="JSON list of package names, e.g. the output of node code/getTopPackages.js")
+    similarity.add_argument("--max-distance", type=int, default=2)
+    similarity.add_argument("--loop-names", type=int, default=500)
+    similarity.set_defaults(func=benchmarkSimilarity)
+
+    generate = subparsers.add_parser("generate", help="typosquat candidates per second with the old per call tables vs the module level tables")
+    generate.add_argument("--packages", type=int, default=5688)
+    generate.add_argument("--names-file", help="JSON list of package names, e.g. the output of node code/getTopPackages.js")
+    generate.add_argument("--repeat", type=int, default=3)
+    generate.set_defaults(func=benchmarkGenerate)
+
+    parallel = subparsers.add_parser("parallel", help="candidate generation scaling from one process to a pool of N")
+    parallel.add_argument("--packages", type=int, default=5688)
+    parallel.add_argument("--names-file", help="JSON list of package names, e.g. the output of node code/getTopPackages.js")
+    parallel.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8], help="worker counts to run, the first is the baseline")
+    parallel.add_argument("--chunk-size", type=int, default=typosquatting.SEED_CHUNK_SIZE)
+    parallel.set_defaults(func=benchmarkParallel)
+
+    resolve = subparsers.add_parser("resolve", help="database phase latency of a scan, per call connections vs one resolve query on the shared store")
+    resolve.add_argument("--packages", type=int, default=5688)
+    resolve.add_argument("--queries", type=int, default=2000, help="names looked up of each kind (legitimate, typosquatted, unknown)")
+    resolve.set_defaults(func=benchmarkResolve)
+
+    daemon = subparsers.add_parser("daemon", help="interpreter start up vs first and cached verdicts from the nscan daemon")
+    daemon.add_argument("--packages", type=int, default=5688)
+    daemon.add_argument("--names", type=int, default=200)
+    daemon.add_argument("--startups", type=int, default=5, help="times python is started to import nscan")
+    daemon.add_argument("--latency", type=float, default=0.01, help="seconds added to every fixture response")
+    daemon.set_defaults(func=benchmarkDaemon)
+
+    verdict = subparsers.add_parser("verdict", help="repeat dependency scans with the verdict cache vs scanning every package again")
+    verdict.add_argument("--packages", type=int, default=5688)
+    verdict.add_argument("--names", type=int, default=200)
+    verdict.add_argument("--scripted", type=int, default=10, help="dependencies with an install script to scan")
+    verdict.add_argument("--install-seconds", type=float, default=1.0, help="seconds the fixture npm install takes")
+    verdict.add_argument("--latency", type=float, default=0.01, help="seconds added to every fixture response")
+    verdict.set_defaults(func=benchmarkVerdict)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
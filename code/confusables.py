@@ -0,0 +1,93 @@
+import unicodedata
+from packageStore import getStore
+from typosquatting import HOMOGRAPH_MAP
+
+'''
+Confusable skeletons for homograph detection, in the style of the Unicode TR #39 skeleton algorithm
+
+Every name is reduced to a "skeleton" where characters that look alike collapse to one prototype: the name is NFKD normalised, accents
+and other combining marks are dropped, every character is mapped to the prototype of its confusable class (built from HOMOGRAPH_MAP, so i, l, 1, I, ӏ... are one class)
+and the multi character look-alikes ("rn" for "m", "vv" for "w") are expanded. Two names with the same skeleton look the same, so homographs of every legitimate package
+are found with a single dictionary lookup on the skeleton instead of generating each variant and asking the registry about it.
+
+Note that npm rejects names that aren't URL safe, so non-ASCII homographs can't be published. The ASCII look-alikes (l/1/i, o/0, rn/m) are the ones that can actually be registered.
+'''
+
+SEQUENCE_CONFUSABLES = {"m": "rn", "w": "vv"} # Single letters that look like two others next to each other, expanded so either spelling gives the same skeleton
+
+'''
+Groups every character in HOMOGRAPH_MAP with the characters it is confusable with (transitively) and maps each one to a single prototype for its group,
+preferring a lowercase ASCII letter, then any ASCII character
+'''
+def buildPrototypes() -> dict:
+    parent = {}
+
+    def find(character):
+        parent.setdefault(character, character)
+        while parent[character] != character:
+            parent[character] = parent[parent[character]]
+            character = parent[character]
+        return character
+
+    for letter, homographs in HOMOGRAPH_MAP.items():
+        for homograph in homographs:
+            character = homograph.split(" ")[1]
+            parent[find(character)] = find(letter)
+
+    groups = {}
+    for character in list(parent):
+        groups.setdefault(find(character), []).append(character)
+    prototypes = {}
+    for members in groups.values():
+        prototype = min(members, key=lambda character: (not ("a" <= character <= "z"), not character.isascii(), character))
+        for character in members:
+            if character != prototype:
+                prototypes[character] = prototype
+    return prototypes
+
+PROTOTYPES = buildPrototypes()
+
+def skeleton(packageName: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", packageName)
+    characters = []
+    for character in decomposed:
+        if unicodedata.combining(character): # é -> e, ü -> u
+            continue
+        character = PROTOTYPES.get(character, character).lower()
+        character = PROTOTYPES.get(character, character)
+        characters.append(SEQUENCE_CONFUSABLES.get(character, character))
+    return "".join(characters)
+
+class SkeletonIndex:
+    '''
+    packages is a list of (packageName, weeklyDownloads), legitimate packages sharing a skeleton are kept most downloaded first
+    '''
+    def __init__(self, packages: list):
+        self.skeletons = {}
+        for packageName, weeklyDownloads in sorted(packages, key=lambda package: -(package[1] or 0)):
+            self.skeletons.setdefault(skeleton(packageName), []).append(packageName)
+
+    '''
+    Legitimate packages that look the same as the name (excluding the name itself)
+    '''
+    def lookup(self, packageName: str) -> list:
+        return [name for name in self.skeletons.get(skeleton(packageName), []) if name != packageName]
+
+    def __len__(self):
+        return len(self.skeletons)
+
+_index = None
+_indexGeneration = None
+
+'''
+Builds the skeleton index from the legitimate database the first time it is needed, and again once the legitimate database has changed (see PackageStore.generation)
+'''
+def getSkeletonIndex() -> SkeletonIndex:
+    global _index, _indexGeneration
+    store = getStore()
+    generation = store.generation()[0]
+    if _index is None or _indexGeneration != generation:
+        rows = store.connect.execute('''SELECT packageName, weeklyDownloads FROM main.legitimate''').fetchall()
+        _index = SkeletonIndex(rows)
+        _indexGeneration = generation
+    return _index
@@ -1,5 +1,5 @@
 # ...existing code...
-import sqlite3
+from packageStore import getStore
 from pathlib import Path
 from npmCalls import checkBulkPackageExists
 import subprocess
@@ -142,12 +142,7 @@ def getMetrics():
     print(f"Recall: {recall}")
 
 def package(packageName: str) -> bool:
-    connect = sqlite3.connect("database/legitimate.db")
-    cursor = connect.cursor()
-    cursor.execute('''SELECT COUNT(*) FROM legitimate WHERE packageName = ?''', (packageName,))
-    count = cursor.fetchone()[0]
-    connect.close()
-    return count > 0
+    return getStore().resolve(packageName).legitimate is not None
 
 # count = 0 
 # for pkg in legitimate:
@@ -0,0 +1,202 @@
+import argparse
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+'''
+Persistent on-disk cache for the npm API responses, stored in database/httpCache.db
+
+Each entry is keyed by URL (plus the Accept header if one was sent) and holds the response body along with the ETag and Last-Modified headers and when it was fetched.
+Fresh entries are served straight from disk, stale entries are revalidated with a conditional request so unchanged packages come back as a cheap 304.
+The cache is bounded in size and evicts the least recently used entries first.
+
+Usage: python code/httpCache.py stats || python code/httpCache.py purge [--expired] [--prefix <url prefix>] || python code/httpCache.py show <url>
+'''
+
+CACHE_PATH = "database/httpCache.db"
+MAX_CACHE_BYTES = 512 * 1024 * 1024 # Once the stored bodies go over this the least recently used entries are evicted
+EVICT_TO_FRACTION = 0.9 # Evicts down to 90% of the limit so every put after hitting the limit doesn't trigger another eviction
+
+'''
+Time to live in seconds for each endpoint, download counts change daily so are kept for a short time, packuments are kept longer as they are revalidated with a 304 anyway
+'''
+ENDPOINT_TTLS = [
+    ("/downloads/point/", 6 * 60 * 60),
+    ("/downloads/range/", 6 * 60 * 60),
+]
+PACKUMENT_TTL = 24 * 60 * 60
+
+def ttlFor(url: str) -> int:
+    for marker, ttl in ENDPOINT_TTLS:
+        if marker in url:
+            return ttl
+    return PACKUMENT_TTL
+
+class HttpCache:
+    def __init__(self, path: str = CACHE_PATH, maxBytes: int = MAX_CACHE_BYTES):
+        self.path = path
+        self.maxBytes = maxBytes
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0, "stores": 0, "evicted": 0}
+        self.connect = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connect.execute("PRAGMA journal_mode=WAL")
+        self.connect.execute("PRAGMA synchronous=NORMAL")
+        self.connect.execute('''
+        CREATE TABLE IF NOT EXISTS httpCache(
+                    cacheKey TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    body BLOB NOT NULL,
+                    etag TEXT,
+                    lastModified TEXT,
+                    fetchedAt REAL NOT NULL,
+                    lastAccessed REAL NOT NULL,
+                    size INTEGER NOT NULL)
+                    ''')
+        self.connect.execute("CREATE INDEX IF NOT EXISTS httpCacheLastAccessed ON httpCache(lastAccessed)")
+        self.totalBytes = self.connect.execute("SELECT COALESCE(SUM(size), 0) FROM httpCache").fetchone()[0]
+
+    '''
+    Returns the cached entry as a dictionary with the decompressed body and whether it is still within its TTL, or None if the key isn't cached
+    '''
+    def get(self, cacheKey: str):
+        with self.lock:
+            row = self.connect.execute("SELECT url, body, etag, lastModified, fetchedAt FROM httpCache WHERE cacheKey = ?", (cacheKey,)).fetchone()
+            if row is None:
+                return None
+            self.connect.execute("UPDATE httpCache SET lastAccessed = ? WHERE cacheKey = ?", (time.time(), cacheKey))
+        url, body, etag, lastModified, fetchedAt = row
+        return {
+            "body": zlib.decompress(body),
+            "etag": etag,
+            "lastModified": lastModified,
+            "fetchedAt": fetchedAt,
+            "fresh": time.time() - fetchedAt < ttlFor(url),
+        }
+
+    def put(self, cacheKey: str, url: str, body: bytes, etag: str = None, lastModified: str = None):
+        compressed = zlib.compress(body)
+        now = time.time()
+        with self.lock:
+            previous = self.connect.execute("SELECT size FROM httpCache WHERE cacheKey = ?", (cacheKey,)).fetchone()
+            self.connect.execute('''
+                INSERT OR REPLACE INTO httpCache (cacheKey, url, body, etag, lastModified, fetchedAt, lastAccessed, size)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', (cacheKey, url, compressed, etag, lastModified, now, now, len(compressed)))
+            self.totalBytes += len(compressed) - (previous[0] if previous else 0)
+            self.stats["stores"] += 1
+            if self.totalBytes > self.maxBytes:
+                self.evict()
+
+    '''
+    Marks a stale entry as fresh again after the server answered a conditional request with 304 Not Modified
+    '''
+    def refresh(self, cacheKey: str):
+        now = time.time()
+        with self.lock:
+            self.connect.execute("UPDATE httpCache SET fetchedAt = ?, lastAccessed = ? WHERE cacheKey = ?", (now, now, cacheKey))
+
+    '''
+    Removes least recently used entries until the cache is back under its size limit, must be called with the lock held
+    '''
+    def evict(self):
+        target = self.maxBytes * EVICT_TO_FRACTION
+        rows = self.connect.execute("SELECT cacheKey, size FROM httpCache ORDER BY lastAccessed ASC").fetchall()
+        toDelete = []
+        for cacheKey, size in rows:
+            if self.totalBytes <= target:
+                break
+            toDelete.append((cacheKey,))
+            self.totalBytes -= size
+        self.connect.executemany("DELETE FROM httpCache WHERE cacheKey = ?", toDelete)
+        self.stats["evicted"] += len(toDelete)
+
+    def purge(self, expiredOnly: bool = False, prefix: str = None) -> int:
+        with self.lock:
+            rows = self.connect.execute("SELECT cacheKey, url, fetchedAt, size FROM httpCache").fetchall()
+            now = time.time()
+            toDelete = []
+            for cacheKey, url, fetchedAt, size in rows:
+                if prefix and not url.startswith(prefix):
+                    continue
+                if expiredOnly and now - fetchedAt < ttlFor(url):
+                    continue
+                toDelete.append((cacheKey,))
+                self.totalBytes -= size
+            self.connect.executemany("DELETE FROM httpCache WHERE cacheKey = ?", toDelete)
+            self.connect.execute("VACUUM")
+        return len(toDelete)
+
+    def summary(self) -> dict:
+        with self.lock:
+            count, size, oldest, newest = self.connect.execute("SELECT COUNT(*), COALESCE(SUM(size), 0), MIN(fetchedAt), MAX(fetchedAt) FROM httpCache").fetchone()
+            rows = self.connect.execute("SELECT url, fetchedAt FROM httpCache").fetchall()
+        now = time.time()
+        expired = sum(1 for url, fetchedAt in rows if now - fetchedAt >= ttlFor(url))
+        return {"entries": count, "bytes": size, "expired": expired, "oldest": oldest, "newest": newest}
+
+    def close(self):
+        with self.lock:
+            self.connect.close()
+
+_cache = None
+_cacheLock = threading.Lock()
+_cacheDisabled = os.environ.get("NSCAN_HTTP_CACHE", "1") == "0" # NSCAN_HTTP_CACHE=0 turns the on-disk cache off
+
+'''
+Returns the shared cache, or None if caching is turned off or the cache database can't be opened (e.g. there is no database/ folder)
+'''
+def getCache():
+    global _cache, _cacheDisabled
+    if _cacheDisabled:
+        return None
+    with _cacheLock:
+        if _cache is None:
+            try:
+                _cache = HttpCache()
+            except sqlite3.Error as e:
+                print(f"httpCache: Could not open {CACHE_PATH}, caching disabled. Error is {e}")
+                _cacheDisabled = True
+                return None
+    return _cache
+
+def setCacheEnabled(enabled: bool):
+    global _cacheDisabled
+    _cacheDisabled = not enabled
+
+def formatTimestamp(timestamp):
+    return time.strftime("%d-%m-%Y %H:%M:%S", time.localtime(timestamp)) if timestamp else "-"
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or purge the on-disk npm API response cache")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("stats", help="show the number of entries, size and how many have expired")
+    purge = subparsers.add_parser("purge", help="delete cached entries (everything by default)")
+    purge.add_argument("--expired", action="store_true", help="only delete entries past their TTL")
+    purge.add_argument("--prefix", help="only delete entries whose URL starts with this prefix")
+    show = subparsers.add_parser("show", help="show the cached entries for a URL")
+    show.add_argument("url")
+    args = parser.parse_args()
+
+    cache = HttpCache()
+    if args.command == "stats":
+        summary = cache.summary()
+        print(f"Entries: {summary['entries']} ({summary['expired']} expired)")
+        print(f"Size: {summary['bytes'] / (1024 * 1024):.2f} MB of {cache.maxBytes / (1024 * 1024):.0f} MB")
+        print(f"Oldest fetch: {formatTimestamp(summary['oldest'])}")
+        print(f"Newest fetch: {formatTimestamp(summary['newest'])}")
+    elif args.command == "purge":
+        removed = cache.purge(expiredOnly=args.expired, prefix=args.prefix)
+        print(f"Removed {removed} entries")
+    elif args.command == "show":
+        rows = cache.connect.execute("SELECT cacheKey, etag, lastModified, fetchedAt, size FROM httpCache WHERE url = ?", (args.url,)).fetchall()
+        if not rows:
+            print(f"{args.url} is not cached")
+        for cacheKey, etag, lastModified, fetchedAt, size in rows:
+            print(f"Key: {cacheKey}")
+            print(f"ETag: {etag}, Last-Modified: {lastModified}")
+            print(f"Fetched: {formatTimestamp(fetchedAt)}, TTL: {ttlFor(args.url)}s, stored size: {size} bytes")
+    cache.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,13 @@
 import requests
+from requests.adapters import HTTPAdapter
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from httpCache import getCache
+from rateLimiter import rateLimiter, backoffDelay
+import json
+import os
+import threading
 import time
 
 '''
@@ -8,55 +16,262 @@ This file is used to contain all npm calls that will be made to the registry via
 There is functions for getting the downloads and update counts for a singular package as well as a batch function to reduce the number of API calls made
 '''
 
-def dataProccess(url: str, retries: int = 3, delay: float = 15.0):
+REGISTRY_URL = os.environ.get("NPM_REGISTRY_URL", "https://registry.npmjs.org").rstrip("/")
+DOWNLOADS_URL = os.environ.get("NPM_DOWNLOADS_URL", "https://api.npmjs.org/downloads").rstrip("/")
+
+POOL_CONNECTIONS = 4 # Number of hosts to keep a connection pool for (registry.npmjs.org and api.npmjs.org are the only ones used)
+POOL_MAXSIZE = 32 # Maximum number of keep-alive connections kept open per host
+POOL_BLOCK = True # Block when a host's pool is exhausted instead of opening extra throwaway connections
+REQUEST_TIMEOUT = (5.0, 30.0) # (connect, read) timeout in seconds so a stalled socket can't hang the tool
+
+_session = None
+_timeout = REQUEST_TIMEOUT
+_sessionLock = threading.Lock()
+
+'''
+Creates the shared HTTP session used by every call in this file. Connections are kept alive and reused between calls so each request doesn't pay for a new TCP + TLS handshake
+Can be called before any requests are made to change the pool sizes or the default timeout
+'''
+def configureSession(poolConnections: int = POOL_CONNECTIONS, poolMaxsize: int = POOL_MAXSIZE, timeout = REQUEST_TIMEOUT, poolBlock: bool = POOL_BLOCK):
+    global _session, _timeout
+    with _sessionLock:
+        if _session is not None:
+            _session.close()
+        _session = makeSession(poolConnections, poolMaxsize, poolBlock)
+        _timeout = timeout
+        return _session
+
+def makeSession(poolConnections: int, poolMaxsize: int, poolBlock: bool) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=poolConnections, pool_maxsize=poolMaxsize, pool_block=poolBlock)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Accept-Encoding": "gzip, deflate"})
+    return session
+
+'''
+Returns the shared session, creating it with the default settings the first time. Checked again under the lock as several threads (e.g. the nscan scan stages)
+can make their first request at the same moment, and only one of them may create it
+'''
+def getSession() -> requests.Session:
+    global _session
+    session = _session
+    if session is not None:
+        return session
+    with _sessionLock:
+        if _session is None:
+            _session = makeSession(POOL_CONNECTIONS, POOL_MAXSIZE, POOL_BLOCK)
+        return _session
+
+'''
+GET request through the shared session, always applies a timeout unless one is given
+'''
+def httpGet(url: str, **kwargs):
+    kwargs.setdefault("timeout", _timeout)
+    return getSession().get(url, **kwargs)
+
+MEMO_MAX_ENTRIES = 4096 # Successful responses remembered for the rest of the run so repeated lookups of the same URL never go back to the network
+
+_memo = OrderedDict()
+_inFlight = {}
+_dedupLock = threading.Lock()
+dedupStats = {"networkFetches": 0, "coalesced": 0, "memoHits": 0}
+
+class _PendingFetch:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+'''
+Request coalescing layer, every JSON GET in this file goes through here
+If the same URL is already being fetched by another thread, waits for that fetch and shares its result instead of making a second request
+Successful (200) responses are memoised for the rest of the run, anything else (e.g. a 429) is not so it can be retried
+With maxAge (seconds) the memo is skipped and an on-disk cache entry older than that is revalidated even if it is still within its TTL
+
+Returns a tuple of (status code, parsed JSON body or None if the status code wasn't 200)
+'''
+def fetchJson(url: str, headers: dict = None, maxAge: float = None):
+    key = (url, tuple(sorted(headers.items()))) if headers else url # the same URL with a different Accept header is a different response
+    with _dedupLock:
+        if maxAge is None and key in _memo:
+            _memo.move_to_end(key)
+            dedupStats["memoHits"] += 1
+            return 200, _memo[key]
+        pending = _inFlight.get(key)
+        isOwner = pending is None
+        if isOwner:
+            pending = _PendingFetch()
+            _inFlight[key] = pending
+            dedupStats["networkFetches"] += 1
+        else:
+            dedupStats["coalesced"] += 1
+
+    if not isOwner:
+        pending.event.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    try:
+        statusCode, data = cachedGetJson(url, headers, maxAge)
+        pending.result = (statusCode, data)
+        if statusCode == 200:
+            with _dedupLock:
+                _memo[key] = data
+                if len(_memo) > MEMO_MAX_ENTRIES:
+                    _memo.popitem(last=False)
+        return pending.result
+    except Exception as e:
+        pending.error = e
+        raise
+    finally:
+        with _dedupLock:
+            _inFlight.pop(key, None)
+        pending.event.set()
+
+RATE_LIMIT_RETRIES = 4 # How many times a request that got a 429 is retried once the rate limiter lets the host be called again
+
+'''
+Waits for the adaptive rate limiter before every request and feeds the result back into it, a 429 is retried after the backoff the limiter chose
+'''
+def rateLimitedGet(url: str, headers: dict = None):
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        rateLimiter.acquire(url)
+        response = httpGet(url, headers=headers)
+        if response.status_code != 429:
+            rateLimiter.onSuccess(url)
+            return response
+        rateLimiter.onRateLimited(url, response.headers.get("Retry-After"))
+    return response
+
+'''
+Checks the on-disk cache before going to the network, fresh entries are returned as is and stale entries are revalidated
+with If-None-Match / If-Modified-Since so an unchanged response costs a 304 instead of the whole body
+'''
+def cachedGetJson(url: str, headers: dict = None, maxAge: float = None):
+    cache = getCache()
+    cacheKey = f"{url} {headers['Accept']}" if headers and "Accept" in headers else url
+    entry = cache.get(cacheKey) if cache else None
+    if entry and entry["fresh"] and (maxAge is None or time.time() - entry["fetchedAt"] < maxAge):
+        cache.stats["hits"] += 1
+        return 200, json.loads(entry["body"])
+
+    requestHeaders = dict(headers or {})
+    if entry:
+        if entry["etag"]:
+            requestHeaders["If-None-Match"] = entry["etag"]
+        if entry["lastModified"]:
+            requestHeaders["If-Modified-Since"] = entry["lastModified"]
+    response = rateLimitedGet(url, requestHeaders or None)
+
+    if response.status_code == 304 and entry:
+        cache.refresh(cacheKey)
+        cache.stats["revalidated"] += 1
+        return 200, json.loads(entry["body"])
+    if response.status_code != 200:
+        return response.status_code, None
+    data = response.json()
+    if cache:
+        cache.stats["misses"] += 1
+        cache.put(cacheKey, url, response.content, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+    return 200, data
+
+'''
+Forgets the memoised responses, for long running processes (the nscan daemon) where "the rest of the run" would otherwise be forever
+'''
+def clearMemo():
+    with _dedupLock:
+        _memo.clear()
+
+def duplicateFetchesSaved() -> int:
+    return dedupStats["coalesced"] + dedupStats["memoHits"]
+
+def dedupSummary() -> str:
+    summary = (f"Unique fetches: {dedupStats['networkFetches']}, duplicate fetches saved: {duplicateFetchesSaved()} "
+               f"({dedupStats['coalesced']} coalesced in flight, {dedupStats['memoHits']} served from memo)")
+    cache = getCache()
+    if cache:
+        summary += (f"\nDisk cache: {cache.stats['hits']} fresh hits, {cache.stats['revalidated']} revalidated (304), "
+                    f"{cache.stats['misses']} misses, {cache.stats['evicted']} evicted")
+    summary += f"\nRate limiter: {rateLimiter.summary()}"
+    return summary
+
+ABBREVIATED_ACCEPT = "application/vnd.npm.install-v1+json; q=1.0, application/json; q=0.8, */*"
+METADATA_MODE = os.environ.get("NSCAN_METADATA_MODE", "abbreviated") # "abbreviated" asks the registry for the install-only (corgi) document, "full" downloads the whole packument
+
+'''
+Fetches the registry metadata for a package, by default the abbreviated (corgi) document is requested which is a fraction of the size of the full packument (no readme, maintainers or per-version time map)
+but still includes the top level "modified" timestamp which is all the existence and last update checks need
+maxAge is passed on to fetchJson for callers that need to see a new release sooner than the packument TTL
+'''
+def fetchPackageMetadata(packageName: str, mode: str = None, maxAge: float = None):
+    url = f"{REGISTRY_URL}/{packageName}"
+    if (mode or METADATA_MODE) == "abbreviated":
+        return fetchJson(url, headers={"Accept": ABBREVIATED_ACCEPT}, maxAge=maxAge)
+    return fetchJson(url, maxAge=maxAge)
+
+'''
+Reads the last modified time from either an abbreviated or a full packument and formats it like the rest of the tool expects
+'''
+def lastModifiedFromMetadata(data: dict) -> str:
+    date = data.get("modified") or data["time"]["modified"]
+    dt = datetime.fromisoformat(date.replace("Z", "+00:00"))
+    return dt.strftime("%d-%m-%Y %H:%M:%S")
+
+def dataProccess(url: str, retries: int = 3, delay: float = 1.0):
     attempt = 0
     while attempt < retries:
         try:
-            response = requests.get(url)
-            if response.status_code == 200:
-                return response.json()
-            elif response.status_code == 429:
-                yellowText(f"SLEEPING due to rate limiting for URL: {url}")
-                time.sleep(10.0)
-            else:
-                print(f"retryProcess: Received status code {response.status_code} for URL: {url}")
+            statusCode, data = fetchJson(url)
+            if statusCode == 200:
+                return data
+            print(f"retryProcess: Received status code {statusCode} for URL: {url}")
         except Exception as e:
             print(f"retryProcess: Error is {e} on attempt {attempt + 1} for URL: {url}")
         attempt += 1
-        time.sleep(delay)
+        if attempt < retries:
+            time.sleep(backoffDelay(attempt - 1, base=delay))
     return None
 
 def checkPackageExists(packageName : str):
     try:
-        url = f"https://registry.npmjs.org/{packageName}"
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()
-            date = data["time"]["modified"]
-            dt = datetime.fromisoformat(date.replace("Z", "+00:00"))
+        statusCode, data = fetchPackageMetadata(packageName)
+        if statusCode == 200:
+            lastUpdate = lastModifiedFromMetadata(data)
             weeklyDownloads = getWeeklyDownloads(packageName)
             monthlyDownloads = getMonthlyDownloads(packageName)
-            return weeklyDownloads, monthlyDownloads, dt.strftime("%d-%m-%Y %H:%M:%S")
+            return weeklyDownloads, monthlyDownloads, lastUpdate
         else:
             return False
     except Exception as e:
         print(f"CheckPackageExists: Error is {e}")
         return False
     
+BULK_RESERVED_NAMES = {"start", "end", "package", "downloads"} # Keys of the bulk downloads response itself, looked up on their own
+
+'''
+Whether a name can go in a bulk downloads request, the bulk endpoint doesn't accept scoped names and the reserved names clash with the keys of its response
+'''
+def isBulkName(packageName: str) -> bool:
+    return not packageName.startswith("@") and packageName not in BULK_RESERVED_NAMES
+
 def checkBulkPackageExists(packageNames : list): # Output from the fucntion is a dictionary like {'react': True, 'wvrvnwuvow': False}
     try:
         results = {}
         batchString = ",".join(packageNames)
-        url = f"https://api.npmjs.org/downloads/point/last-week/{batchString}"
-        response = requests.get(url)
+        url = f"{DOWNLOADS_URL}/point/last-week/{batchString}"
+        statusCode, data = fetchJson(url)
+
+        if len(packageNames) == 1: # A single name gets the plain point response (or a 404 if it doesn't exist) rather than a dictionary keyed by name
+            if statusCode == 404:
+                return {packageNames[0]: False}
+            data = {packageNames[0]: data}
 
-        if response.status_code != 200:
-            if response.status_code == 429:
-                yellowText(f"SLEEPING due to rate limiting for URL: {url}")
-                time.sleep(10.0)
+        if statusCode != 200:
             return {}
-    
-        data = response.json()
 
         for packageName in packageNames:
             pkg_data = data.get(packageName)
@@ -69,9 +284,7 @@ def checkBulkPackageExists(packageNames : list): # Output from the fucntion is a
 
 def getWeeklyDownloads(packageName : str):
     try:
-        url = f"https://api.npmjs.org/downloads/point/last-week/{packageName}"
-        response = requests.get(url)
-
+        url = f"{DOWNLOADS_URL}/point/last-week/{packageName}"
         data = dataProccess(url)
         return data.get("downloads")
     except Exception as e:
@@ -80,8 +293,7 @@ def getWeeklyDownloads(packageName : str):
     
 def getMonthlyDownloads(packageName : str):
     try:
-        url = f"https://api.npmjs.org/downloads/point/last-month/{packageName}"
-        response = requests.get(url)
+        url = f"{DOWNLOADS_URL}/point/last-month/{packageName}"
         data = dataProccess(url)
         downloads = data.get("downloads")
         return downloads
@@ -91,28 +303,22 @@ def getMonthlyDownloads(packageName : str):
 
 def getLastUpdate(packageName : str):
     try:
-        url = f"https://registry.npmjs.org/{packageName}"
-        response = requests.get(url)
-        data = response.json()
-        date = data["time"]["modified"]
-        dt = datetime.fromisoformat(date.replace("Z", "+00:00"))
-        return dt.strftime("%d-%m-%Y %H:%M:%S")
+        statusCode, data = fetchPackageMetadata(packageName)
+        return lastModifiedFromMetadata(data)
     except Exception as e:
         print(f"getLastUpdate: Error is {e}")
         return None
     
 def getBatchWeeklyDownloads(batchString: str):
     try:
-        url = f"https://api.npmjs.org/downloads/point/last-week/{batchString}"
-        response = requests.get(url)
+        url = f"{DOWNLOADS_URL}/point/last-week/{batchString}"
+        statusCode, data = fetchJson(url)
 
-        if response.status_code != 200:
-            if response.status_code == 429:
-                yellowText(f"SLEEPING due to rate limiting for URL: {url}")
-                time.sleep(10.0)
+        if statusCode != 200:
             return {}
+        if "," not in batchString and isinstance(data.get("downloads"), int):
+            return {batchString: data}
 
-        data = response.json()
         out = {}
         for pkg, payload in data.items():
             if pkg in ("start", "end"):
@@ -126,16 +332,14 @@ def getBatchWeeklyDownloads(batchString: str):
 
 def getBatchMonthlyDownloads(batchString: str):
     try:
-        url = f"https://api.npmjs.org/downloads/point/last-month/{batchString}"
-        response = requests.get(url)
+        url = f"{DOWNLOADS_URL}/point/last-month/{batchString}"
+        statusCode, data = fetchJson(url)
 
-        if response.status_code != 200:
-            if response.status_code == 429:
-                yellowText(f"SLEEPING due to rate limiting for URL: {url}")
-                time.sleep(10.0)
+        if statusCode != 200:
             return {}
+        if "," not in batchString and isinstance(data.get("downloads"), int):
+            return {batchString: data}
 
-        data = response.json()
         out = {}
         for pkg, payload in data.items():
             if pkg in ("start", "end"):
@@ -147,30 +351,58 @@ def getBatchMonthlyDownloads(batchString: str):
         print(f"getBatchMonthlyDownloads: Error is {e}")
         return {}
     
-def getBatchLastUpdate(packageNames: list):
+BATCH_CONCURRENCY = 16 # Maximum number of packuments fetched at the same time by getBatchLastUpdate, the rate limiter still caps the overall requests per second
+
+def fetchLastUpdate(packageName: str):
     try:
-        lastUpdates = {}
-        for packageName in packageNames:
-            url = f"https://registry.npmjs.org/{packageName}"
-            response = requests.get(url)
-            if response.status_code == 200:
-                data = response.json()
-                date = data["time"]["modified"]
-                dt = datetime.fromisoformat(date.replace("Z", "+00:00"))
-                lastUpdates[packageName] = dt.strftime("%d-%m-%Y %H:%M:%S")
-            else:
-                lastUpdates[packageName] = None
-        return lastUpdates
+        statusCode, data = fetchPackageMetadata(packageName)
+        if statusCode == 200:
+            return lastModifiedFromMetadata(data)
+    except Exception as e:
+        print(f"fetchLastUpdate: Error is {e} for package: {packageName}")
+    return None
+
+'''
+Fetches the last update time for a batch of packages concurrently, a batch takes roughly as long as its slowest request instead of the sum of them all
+Output is a dictionary like {'react': '01-01-2025 10:00:00', 'notapackage': None}
+'''
+def getBatchLastUpdate(packageNames: list, concurrency: int = BATCH_CONCURRENCY):
+    if not packageNames:
+        return {}
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(packageNames)))) as executor:
+            return dict(zip(packageNames, executor.map(fetchLastUpdate, packageNames)))
     except Exception as e:
         print(f"getBatchLastUpdate: Error is {e}")
         return {}
     
-def getWeeklyDownloadsBasic(packageName : str):
+'''
+The version npm install <package> resolves to (the latest dist-tag), None if the package doesn't exist or the registry couldn't be reached
+'''
+def getLatestVersion(packageName: str, maxAge: float = None):
     try:
-        url = f"https://api.npmjs.org/downloads/point/last-week/{packageName}"
-        response = requests.get(url)
+        statusCode, data = fetchPackageMetadata(packageName, maxAge=maxAge)
+        if statusCode == 200:
+            return data.get("dist-tags", {}).get("latest")
+    except Exception as e:
+        print(f"getLatestVersion: Error is {e} for package: {packageName}")
+    return None
 
-        data = response.json()
+'''
+getLatestVersion for a batch of packages concurrently, output is a dictionary like {'react': '18.3.1', 'notapackage': None}
+'''
+def getBatchLatestVersion(packageNames: list, maxAge: float = None, concurrency: int = BATCH_CONCURRENCY):
+    if not packageNames:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(packageNames)))) as executor:
+        return dict(zip(packageNames, executor.map(lambda packageName: getLatestVersion(packageName, maxAge), packageNames)))
+
+def getWeeklyDownloadsBasic(packageName : str):
+    try:
+        url = f"{DOWNLOADS_URL}/point/last-week/{packageName}"
+        statusCode, data = fetchJson(url)
+        if data is None:
+            return None
         return data.get("downloads")
     except Exception as e:
         print(f"getWeeklyDownloads: Error is {e}")
@@ -178,9 +410,10 @@ def getWeeklyDownloadsBasic(packageName : str):
     
 def getMonthlyDownloadsBasic(packageName : str):
     try:
-        url = f"https://api.npmjs.org/downloads/point/last-month/{packageName}"
-        response = requests.get(url)
-        data = response.json()
+        url = f"{DOWNLOADS_URL}/point/last-month/{packageName}"
+        statusCode, data = fetchJson(url)
+        if data is None:
+            return None
         downloads = data.get("downloads")
         return downloads
     except Exception as e:
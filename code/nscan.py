@@ -3,78 +3,85 @@ import sys
 import subprocess
 from datetime import datetime, timedelta
 import platform 
-from npmCalls import getWeeklyDownloads, getMonthlyDownloads, getLastUpdate, getWeeklyDownloadsBasic, getMonthlyDownloadsBasic
-import sqlite3
-from scanInstallScripts import ScriptScanner
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from npmCalls import getWeeklyDownloads, getMonthlyDownloads, getLastUpdate, fetchLastUpdate, getLatestVersion, getBatchLatestVersion, getWeeklyDownloadsBasic, getMonthlyDownloadsBasic, getBatchWeeklyDownloads, getBatchMonthlyDownloads, getBatchLastUpdate, isBulkName
+from scanInstallScripts import ScriptScanner, rulesVersion, findingsAsDicts
+from typosquatIndex import getTyposquatIndex
+from confusables import getSkeletonIndex
+from packageStore import getStore, PackageInfo, ResolvedPackage
+from nscanClient import fetchVerdict
+from verdictCache import getVerdictCache, formatTimestamp, VERSION_CHECK_MAX_AGE
 
 '''
 This file contains the bulk of the implementation of the tool, including the main method that runs the entire flow.
 '''
 
+'''
+Looks a package up in every database at once (typosquatted row, legitimate row and the legitimate row of the package it typosquats) on the shared store connection
+Takes in a package name as a string and returns a ResolvedPackage
+'''
+def resolvePackage(packageName: str) -> ResolvedPackage:
+    return getStore().resolve(packageName)
+
 '''
 Checks if a package is in the typosquatted database and if it is, it returns the package information. 
-Takes in a package name as a string and returns the row from the database if it exists
+Takes in a package name as a string and returns a TyposquatInfo if it exists
 '''
 def checkInTyposquattedDB(packageName: str):
-    connect = sqlite3.connect('database/typosquatted.db')
-    cursor = connect.cursor()
-    cursor.execute("SELECT * FROM typosquatted WHERE packageName=?", (packageName,))
-    result = cursor.fetchone()
-    connect.close()
-
-    if result:
-        return result
-    return None
+    return resolvePackage(packageName).typosquatted
 
 '''
 Checks if the package is in the legitimate database and if it is, it returns the package information.
-Takes in a package name as a string and returns the row from the database if it exists
+Takes in a package name as a string and returns a PackageInfo if it exists
 '''
 def checkInLegitimateDB(packageName: str):
-    connect = sqlite3.connect('database/legitimate.db')
-    cursor = connect.cursor()
-    cursor.execute("SELECT * FROM legitimate WHERE packageName=?", (packageName,))
-    result = cursor.fetchone()
-    connect.close()
-
-    if result:
-        return result
-    return None
+    return getStore().legitimateInfo(packageName)
 
 '''
-Takes in the typosquatted package information (row of data).
-Queries the legitimate database to get the original package information for comparison, adds index score based on:
-    The type of technique used (homograph, levenshtein, combosquatting, hyphen/underscore)
+Takes in the typosquatted package information, the original package information for comparison (both PackageInfo) and the detection message.
+Adds index score based on:
+    The type of technique used (homograph, levenshtein, combosquatting, hyphen/underscore), only the highest scoring one when a name was generated by several
     The difference in weekly and monthly downloads between the original and typosquatted package (if there are lots of downloads for the typosquatted package, this step is ignored)
     The recency of the last update of the typosquatted package compared to the original package
 
 Returns the index score as an integer
 '''
-def calculateIndexScoreForTyposquatting(originalPackage: str, weeklyDownloads: int, monthlyDownloads: int, lastUpdate: str, message : str) -> int:
+def calculateIndexScoreForTyposquatting(package: PackageInfo, original: PackageInfo, message: str) -> int:
     indexScore = 0
-    connect = sqlite3.connect('database/legitimate.db')
-    cursor = connect.cursor()
-    cursor.execute("SELECT * FROM legitimate WHERE packageName=?", (originalPackage,))
-    result = cursor.fetchone()
-    originalWeeklyDownloads = result[2]
-    originalMonthlyDownloads = result[3]
-    originalLastUpdate = result[4]
-    connect.close()
+    weeklyDownloads = package.weeklyDownloads
+    monthlyDownloads = package.monthlyDownloads
+    lastUpdate = package.lastUpdate
     msg = message.lower()
 
-    if "homograph" in msg:
+    if "homograph" in msg: # detectionMethods lists every technique that produced the name, the score is for the most suspicious one
         print("+5 index score for homograph attack")
         indexScore += 5
-    if "levenshtein" in msg:
+    elif "levenshtein" in msg:
         print("+4 index score for levenshtein distance")
         indexScore += 4
-    if "combosquatting" in msg:
+    elif "combosquatting" in msg:
         print("+3 index score for combosquatting")
         indexScore += 3
-    if "hyphen/underscore" in msg:
+    elif "hyphen/underscore" in msg:
         print("+2 index score for hyphen/underscore substitution")
         indexScore += 2
 
+    if original is None: # The original has since been removed from the legitimate database, only the technique can be scored
+        print("Original package not in legitimate database, no index score added for downloads or last update")
+        return indexScore
+    originalWeeklyDownloads = original.weeklyDownloads
+    originalMonthlyDownloads = original.monthlyDownloads
+    originalLastUpdate = original.lastUpdate
+
     downloadDifferenceWeekly = abs(originalWeeklyDownloads - weeklyDownloads)
     downloadDifferenceMonthly = abs(originalMonthlyDownloads - monthlyDownloads)
 
@@ -114,15 +121,18 @@ def calculateIndexScoreForTyposquatting(originalPackage: str, weeklyDownloads: i
 
 '''
 Calcualtes a suspicious index if the package is not in the typoquatted database (still checks this even if the package is in the legitimate database)
-Takes in the weekly downloads, monthly downloads and last update date as strings
+Takes in the package information (weekly downloads, monthly downloads and last update date) as a PackageInfo
 Assgins index score based on:
     The consistency between weekly and monthly downloads, a spike or fall in weekly downloads compared to monthly downloads could inidicate an attack
     The recency of the last update of the package
 
 Returns an index score as an integer
 '''
-def calculateSuspiciousIndexScore(weeklyDownloads: int, monthlyDownloads: int, lastUpdate: str) -> int:
+def calculateSuspiciousIndexScore(package: PackageInfo) -> int:
     indexScore = 0 
+    weeklyDownloads = package.weeklyDownloads
+    monthlyDownloads = package.monthlyDownloads
+    lastUpdate = package.lastUpdate
 
     downloadLowerBound1 = (weeklyDownloads * 4) * 0.7
     downloadUpperBound1 = (weeklyDownloads * 4) * 1.3
@@ -189,7 +199,14 @@ Takes in a package name as a string and returns the risk score as an integer
 '''
 def scanInstallScripts(packageName:str):
     scanner = ScriptScanner(packageName)
-    result = scanner.scanPackage()
+    return reportInstallScripts(scanner, scanner.scanPackage(report=False))
+
+'''
+Prints the findings of a finished install script scan and its risk score, returns the risk score as an integer
+'''
+def reportInstallScripts(scanner: ScriptScanner, result: dict) -> int:
+    packageName = scanner.packageSpec
+    scanner.printReport(result)
     if result['riskScore'] < 2:
         greenText(f"Install Script Risk Score for {packageName}: {result['riskScore']}")
     elif result['riskScore'] < 4:
@@ -199,85 +216,432 @@ def scanInstallScripts(packageName:str):
 
     return result['riskScore']
 
+STAGE_WORKERS = 4 # Weekly downloads, monthly downloads, last update and the install script scan can all be in flight at once
+
 '''
-Main method to run the entire flow for the tool
+Runs the independent stages of a single package scan (registry lookups and the install script scan) on a small thread pool so a scan takes about as long as
+its slowest stage instead of the sum of them all, and records how long every stage took
+The databases and indexes are only used from the calling thread (the store connection belongs to it) and are timed with run
+'''
+class ScanStages:
+    def __init__(self, workers: int = STAGE_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.timings = {}
+        self.started = time.perf_counter()
+
+    def timed(self, stage: str, function, *args):
+        start = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            self.timings[stage] = time.perf_counter() - start
+
+    '''
+    Starts a stage on the pool, returns a future for its result
+    '''
+    def submit(self, stage: str, function, *args):
+        return self.executor.submit(self.timed, stage, function, *args)
+
+    '''
+    Runs a stage on the calling thread while the submitted ones carry on in the background
+    '''
+    def run(self, stage: str, function, *args):
+        return self.timed(stage, function, *args)
+
+    def printTimings(self):
+        wall = time.perf_counter() - self.started
+        print("Stage timings:")
+        for stage, seconds in sorted(self.timings.items(), key=lambda item: -item[1]):
+            print(f"  {stage:<20} {seconds:>7.2f}s")
+        print(f"  {'total (wall)':<20} {wall:>7.2f}s, {sum(self.timings.values()):.2f}s if run one after another")
+
+    '''
+    Stops the pool without waiting for stages whose result is no longer needed (e.g. the package doesn't exist)
+    '''
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+SCORING_VERSION = 2 # Bump whenever the index scores or thresholds change so verdicts cached with the old scoring aren't used
+BREAKDOWN_LINE = re.compile(r"^\+(\d+) index score for (.+)$", re.MULTILINE)
 
-First checks all the parameters are correct and valid
-Extracts the type of command and the package name from the command line arguements
-Checks if the package is in a database and if not checks if the package exists (if not, it exits)
-If the package exists but in neither database it generates a general suspicious index score
-If the package is in the typosquatted database it generates a typoquatting index score
-If the package is in the legitimate database it fetches the package information and generates a suspicious index score (incase of supply chain attacks)
-Scans the installation scripts for malicious behaviour and adds to the overall index score
-Prints out a package summary containing the statistics of the package along with prompting the user if they want to continue with the installation or update 
-If yes, passes the command to npm to continue with the installation or update
-If no, aborts and outputs a print statement to verify
 '''
-def main():
-    state = ""
-    if len(sys.argv) < 3 or (sys.argv[1] != "install" and sys.argv[1] != "update"):
-        print("Usage: nscan install <package> || nscan update <package>")
-        sys.exit(1)
+The index score breakdown of a scan, every "+N index score for ..." line of its output as {"points": N, "reason": ...}
+'''
+def scoreBreakdown(output: str) -> list:
+    return [{"points": int(points), "reason": reason} for points, reason in BREAKDOWN_LINE.findall(output)]
 
-    typeOfCommand = sys.argv[1]
-    packageName = sys.argv[2]
+'''
+Writes to the terminal as usual and keeps a copy, so a scan in this process is shown as it runs and its output can still be cached with the verdict
+'''
+class TeeOutput(io.StringIO):
+    def __init__(self, stream):
+        super().__init__()
+        self.stream = stream
 
-    overallIndexScore = 0
+    def write(self, text):
+        self.stream.write(text)
+        return super().write(text)
+
+'''
+The generation of the databases as it goes in a verdict cache key, read before a package is scored so its verdict is never stored under a newer generation than
+the rows it was scored on
+'''
+def databaseGeneration() -> str:
+    return ".".join(str(generation) for generation in getStore().generation())
+
+'''
+Looks a package up in the verdict cache, see verdictCache.py. The latest version is checked with the registry first so a new release is never answered from the cache
+Returns (latest version, database generation, cached verdict or None), the version is None if the cache is off or the registry couldn't say
+'''
+def lookupCachedVerdict(packageName: str, scriptsScanned: bool = True):
+    cache = getVerdictCache()
+    if cache is None:
+        return None, None, None
+    version = getLatestVersion(packageName, VERSION_CHECK_MAX_AGE)
+    if version is None:
+        return None, None, None
+    generation = databaseGeneration()
+    return version, generation, cache.get(packageName, version, generation, rulesVersion(), SCORING_VERSION, scriptsScanned)
+
+def storeVerdict(packageName: str, version: str, generation: str, scriptsScanned: bool, verdict: dict):
+    cache = getVerdictCache()
+    if cache is None or version is None or verdict["state"] == "missing":
+        return
+    cache.put(packageName, version, generation, rulesVersion(), SCORING_VERSION, scriptsScanned, verdict)
+
+'''
+Overall index score thresholds, shared by the single package and batch scans
+'''
+def stateForScore(overallIndexScore: int) -> str:
+    if overallIndexScore >= 10:
+        return "malicious"
+    elif overallIndexScore >= 5:
+        return "suspicious"
+    return "legitimate"
+
+'''
+The versions of a dependency whose install scripts are scanned, every version the lockfile pins (or range the package.json asks for) as a compromised
+release can be pinned long after it was replaced as latest. [latest] when no version is known, where None lets npm install pick the latest
+'''
+def scannedVersions(info: dict, latest: str = None) -> list:
+    return sorted(info["versions"]) or [latest]
+
+EXACT_VERSION = re.compile(r"^\d+\.\d+\.\d+([-+][0-9A-Za-z.+-]*)?$") # A version a lockfile pins, rather than a range from a package.json
+LATEST = "latest"
+
+'''
+The version a dependency's verdict is cached under (see verdictCache.py): the versions it pins when their install scripts are scanned, LATEST when that is the
+latest version on the registry (no version is pinned, or only the live download counts are scored), None when it isn't cached as the versions are ranges that
+npm would only resolve at install time, or the package is scored from the databases alone which is quick to do again
+'''
+def cacheVersion(info: dict, scanScripts: bool, inDatabase: bool):
+    if scanScripts and info["versions"]:
+        return ",".join(sorted(info["versions"])) if all(EXACT_VERSION.match(version) for version in info["versions"]) else None
+    if scanScripts or not inDatabase:
+        return LATEST
+    return None
+
+LOCKFILE_NAMES = ("package-lock.json", "npm-shrinkwrap.json")
+BULK_DOWNLOADS_LIMIT = 128 # Most packages the downloads API accepts in one bulk request
+NON_REGISTRY_SPECS = ("file:", "link:", "workspace:", "git", "github:", "http:", "https:") # Dependencies that don't come from the registry so can't be typosquats on it
+
+'''
+Name of the package installed at a lockfile path, e.g. "node_modules/a/node_modules/@scope/b" gives "@scope/b"
+'''
+def nameFromLockfilePath(path: str) -> str:
+    return path.rsplit("node_modules/", 1)[-1]
+
+'''
+Every registry package in a package-lock.json or npm-shrinkwrap.json (lockfileVersion 1, 2 or 3), including transitive dependencies
+Returns {packageName: {"versions": set of versions, "hasInstallScript": True/False, or None if the lockfile doesn't record it}}
+'''
+def parseLockfile(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        lockfile = json.load(f)
+    dependencies = {}
+
+    def add(packageName: str, entry: dict, hasInstallScript):
+        if entry.get("link") or entry.get("bundled") or not entry.get("version"):
+            return
+        resolved = entry.get("resolved") or entry.get("version")
+        if resolved.startswith(NON_REGISTRY_SPECS) and "/-/" not in resolved: # Registry tarballs look like https://registry.npmjs.org/a/-/a-1.0.0.tgz
+            return
+        packageName = entry.get("name", packageName) # Aliased installs ("npm:real@1") record the real name
+        info = dependencies.setdefault(packageName, {"versions": set(), "hasInstallScript": hasInstallScript})
+        info["versions"].add(entry["version"])
+        if hasInstallScript:
+            info["hasInstallScript"] = True
+
+    if "packages" in lockfile: # lockfileVersion 2 and 3
+        for packagePath, entry in lockfile["packages"].items():
+            if "node_modules/" in packagePath:
+                add(nameFromLockfilePath(packagePath), entry, bool(entry.get("hasInstallScript")))
+    else: # lockfileVersion 1 nests the dependencies
+        stack = list(lockfile.get("dependencies", {}).items())
+        while stack:
+            packageName, entry = stack.pop()
+            add(packageName, entry, None)
+            stack.extend(entry.get("dependencies", {}).items())
+    return dependencies
+
+'''
+"npm:@scope/name@^1.0.0" gives ("@scope/name", "^1.0.0")
+'''
+def splitAliasSpec(spec: str):
+    target = spec[len("npm:"):]
+    versionAt = target.find("@", 1)
+    if versionAt == -1:
+        return target, ""
+    return target[:versionAt], target[versionAt + 1:]
+
+'''
+The direct dependencies of a package.json (dependencies, devDependencies, optionalDependencies and peerDependencies), in the same format as parseLockfile
+With resolve the full tree is resolved instead by having npm write a lockfile for it in a temporary directory (no packages are downloaded and no scripts are run)
+'''
+def parsePackageJson(path: str, resolve: bool = False) -> dict:
+    if resolve:
+        with tempfile.TemporaryDirectory() as workdir:
+            shutil.copy(path, os.path.join(workdir, "package.json"))
+            npm_command = "npm.cmd" if platform.system() == "Windows" else "npm"
+            resolved = subprocess.run([npm_command, "install", "--package-lock-only", "--ignore-scripts", "--no-audit", "--no-fund"], cwd=workdir, capture_output=True, text=True)
+            if resolved.returncode != 0:
+                raise RuntimeError(f"npm could not resolve the dependencies of {path}: {resolved.stderr.strip()}")
+            return parseLockfile(os.path.join(workdir, "package-lock.json"))
+
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    dependencies = {}
+    for field in ("dependencies", "devDependencies", "optionalDependencies", "peerDependencies"):
+        for packageName, spec in manifest.get(field, {}).items():
+            if spec.startswith("npm:"): # Alias, "npm:real-name@^1.0.0" installs real-name
+                packageName, spec = splitAliasSpec(spec)
+            elif spec.startswith(NON_REGISTRY_SPECS) or "/" in spec and not spec.startswith("@"): # "user/repo" is a GitHub shorthand
+                continue
+            dependencies.setdefault(packageName, {"versions": set(), "hasInstallScript": None})["versions"].add(spec)
+    return dependencies
+
+'''
+Weekly downloads, monthly downloads and last update for packages in neither database, using the bulk downloads endpoint (up to 128 unscoped names a request)
+Scoped names aren't supported by the bulk endpoint so are fetched one at a time. Returns {packageName: (weeklyDownloads, monthlyDownloads, lastUpdate)}, None where a package doesn't exist
+'''
+def fetchLiveInformation(packageNames: list) -> dict:
+    bulkNames = [name for name in packageNames if isBulkName(name)]
+    weeklyData = {}
+    monthlyData = {}
+    fetchedNames = []
+    for start in range(0, len(bulkNames), BULK_DOWNLOADS_LIMIT):
+        chunk = bulkNames[start:start + BULK_DOWNLOADS_LIMIT]
+        weekly = getBatchWeeklyDownloads(",".join(chunk))
+        monthly = getBatchMonthlyDownloads(",".join(chunk))
+        if not weekly or not monthly: # The bulk request failed, these names are looked up one at a time below
+            continue
+        weeklyData.update(weekly)
+        monthlyData.update(monthly)
+        fetchedNames.extend(chunk)
+    downloads = {name: (weeklyData.get(name, {}).get("downloads"), monthlyData.get(name, {}).get("downloads")) for name in fetchedNames}
+    for packageName in packageNames:
+        if packageName not in downloads:
+            downloads[packageName] = (getWeeklyDownloadsBasic(packageName), getMonthlyDownloadsBasic(packageName))
+
+    existing = [name for name, (weekly, monthly) in downloads.items() if weekly is not None and monthly is not None]
+    lastUpdates = getBatchLastUpdate(existing)
+    information = {}
+    for packageName in packageNames:
+        weeklyDownloads, monthlyDownloads = downloads[packageName]
+        lastUpdate = lastUpdates.get(packageName)
+        information[packageName] = (weeklyDownloads, monthlyDownloads, lastUpdate) if lastUpdate is not None else None
+    return information
 
-    if not checkInTyposquattedDB(packageName) and not checkInLegitimateDB(packageName):
-        print(f"Package not in database, getting information for {packageName}...")
-        weeklyDownloads = getWeeklyDownloadsBasic(packageName)
-        monthlyDownloads = getMonthlyDownloadsBasic(packageName)
-        if weeklyDownloads is None or monthlyDownloads is None:
-            yellowText(f"{packageName} does not exist. Exiting...")
-            sys.exit(1)
-        lastUpdate = getLastUpdate(packageName)
-        suspiciousIndexScore = calculateSuspiciousIndexScore(weeklyDownloads, monthlyDownloads, lastUpdate)
-        redText(f"Suspicious index score for {packageName}: {suspiciousIndexScore} / 15")
-        overallIndexScore += suspiciousIndexScore
-    elif checkInTyposquattedDB(packageName):
-        print(f"Fetching {packageName} information from typosquatted database...")
-        packageInfo = checkInTyposquattedDB(packageName)
-        originalPackage = packageInfo[2]
-        weeklyDownloads = packageInfo[3]
-        monthlyDownloads = packageInfo[4]
-        lastUpdate = packageInfo[5]
-        message = packageInfo[6]
-        typosquattingIndexScore = calculateIndexScoreForTyposquatting(originalPackage, weeklyDownloads, monthlyDownloads, lastUpdate, message)
-        redText(f"Typoquatting index score for {packageName}: {typosquattingIndexScore} / 15")
-        overallIndexScore += typosquattingIndexScore
-    elif checkInLegitimateDB(packageName):
-        print(f"Fetching {packageName} information from legitimate database...")
-        packageInfo = checkInLegitimateDB(packageName)
-        weeklyDownloads = packageInfo[2]
-        monthlyDownloads = packageInfo[3]
-        lastUpdate = packageInfo[4]
-        greenText(f"{packageName} found in legitimate database.")
-        suspiciousIndexScore = calculateSuspiciousIndexScore(weeklyDownloads, monthlyDownloads, lastUpdate)
-        overallIndexScore += suspiciousIndexScore
-
-    print(f"Scanning installation scripts for {packageName}...")
-    overallIndexScore += scanInstallScripts(packageName)
+'''
+Scores every dependency in one process: every database is queried in bulk on one connection (see PackageStore.resolveMany), packages in neither are fetched with the
+bulk download endpoints, then each is scored the same way main scores a single package. scripts is "all", "none" or "auto" (only the packages the lockfile
+says have an install script, or every package if it doesn't say). The install scripts of every pinned version are scanned (versionScans), the package gets the
+score of its riskiest version. The scoring output for each package is kept and only shown with verbose
+Packages that need live data or a script scan come from the verdict cache instead if the same versions were scanned before with the same databases, rules and
+scoring (unless useCache is False), see cacheVersion. Only packages cached under their latest version ask the registry for it
+With details every result also carries the scoring output and the downloads and last update it was scored on (used by the daemon to answer nscan install)
+Returns a list of result dictionaries, most suspicious first
+'''
+def scanDependencies(dependencies: dict, scripts: str = "auto", verbose: bool = False, details: bool = False, useCache: bool = True) -> list:
+    store = getStore()
+    scanScripts = {name: scripts == "all" or scripts == "auto" and info["hasInstallScript"] is not False for name, info in dependencies.items()}
+    resolved = store.resolveMany(sorted(dependencies))
+    cache = getVerdictCache() if useCache else None
+    cacheVersions = {name: cacheVersion(dependencies[name], scanScripts[name], resolved[name].inDatabase) for name in sorted(dependencies)} if cache else {}
+    latestVersions = getBatchLatestVersion([name for name, version in cacheVersions.items() if version == LATEST], VERSION_CHECK_MAX_AGE) if cache else {}
+    versionKeys = {name: latestVersions.get(name) if version == LATEST else version for name, version in cacheVersions.items()}
+    versionKeys = {name: version for name, version in versionKeys.items() if version} # Packages without a version key aren't cached
+    cachedVerdicts = {}
+    if cache:
+        generation = databaseGeneration()
+        currentRules = rulesVersion()
+        for packageName, version in versionKeys.items():
+            verdict = cache.get(packageName, version, generation, currentRules, SCORING_VERSION, scanScripts[packageName])
+            if verdict is not None:
+                cachedVerdicts[packageName] = verdict
+    packageNames = sorted(name for name in dependencies if name not in cachedVerdicts)
+    unknownNames = [name for name in packageNames if not resolved[name].inDatabase]
+    typosquattedCount = sum(1 for name in packageNames if resolved[name].typosquatted)
+    legitimateCount = len(packageNames) - typosquattedCount - len(unknownNames)
+    print(f"{len(dependencies)} dependencies: {len(cachedVerdicts)} cached verdicts, {typosquattedCount} in the typosquatted database, {legitimateCount} in the legitimate database, {len(unknownNames)} fetched from npm")
+    liveInformation = fetchLiveInformation(unknownNames) if unknownNames else {}
+
+    nearMatchesByName = {}
+    for packageName in unknownNames:
+        lookalikes = getSkeletonIndex().lookup(packageName)
+        if lookalikes:
+            nearMatchesByName[packageName] = [(lookalikes[0], 0, f"Homograph attack - same skeleton as {lookalikes[0]} (skeleton index)")]
+        else:
+            nearMatchesByName[packageName] = getTyposquatIndex().detect(packageName)
+    liveOriginals = store.resolveMany(matches[0][0] for matches in nearMatchesByName.values() if matches) # Originals of typosquatted rows already came back with resolveMany
+
+    results = []
+    for packageName, verdict in cachedVerdicts.items():
+        results.append(dict(verdict, versions=sorted(dependencies[packageName]["versions"]), cached=True))
+    for packageName in packageNames:
+        output = io.StringIO()
+        result = {"packageName": packageName, "versions": sorted(dependencies[packageName]["versions"]), "version": versionKeys.get(packageName), "source": None,
+                  "indexScore": 0, "scriptScore": 0, "typosquatOf": None, "scriptFindings": [], "versionScans": [], "cached": False}
+        packageInfo = None
+        with contextlib.redirect_stdout(output):
+            record = resolved[packageName]
+            if record.typosquatted:
+                packageInfo = record.typosquatted
+                result["source"] = "typosquatted"
+                result["typosquatOf"] = record.typosquatted.typosquattedFrom
+                result["indexScore"] = calculateIndexScoreForTyposquatting(record.typosquatted, record.original, record.typosquatted.detectionMethods)
+            elif record.legitimate:
+                packageInfo = record.legitimate
+                result["source"] = "legitimate"
+                result["indexScore"] = calculateSuspiciousIndexScore(record.legitimate)
+            elif liveInformation.get(packageName) is None:
+                result["source"] = "missing"
+                print(f"{packageName} does not exist on npm")
+            else:
+                packageInfo = PackageInfo(packageName, *liveInformation[packageName])
+                result["source"] = "npm"
+                nearMatches = nearMatchesByName[packageName]
+                if nearMatches:
+                    originalPackage, distance, message = nearMatches[0]
+                    print(f"{packageName} looks like a typosquat of {originalPackage} ({message})")
+                    result["typosquatOf"] = originalPackage
+                    result["indexScore"] = calculateIndexScoreForTyposquatting(packageInfo, liveOriginals[originalPackage].legitimate, message)
+                else:
+                    result["indexScore"] = calculateSuspiciousIndexScore(packageInfo)
+
+            if result["source"] != "missing" and scanScripts[packageName]:
+                for version in scannedVersions(dependencies[packageName], latestVersions.get(packageName)): # The latest version the verdict is cached under, not whatever is latest by the time npm runs
+                    scanner = ScriptScanner(packageName, version)
+                    scriptResult = scanner.scanPackage(report=False)
+                    result["versionScans"].append({"version": version, "scriptScore": reportInstallScripts(scanner, scriptResult),
+                                                   "scriptFindings": findingsAsDicts(scriptResult), "installFailed": scriptResult["installFailed"]})
+                worst = max(result["versionScans"], key=lambda scan: scan["scriptScore"]) # The package is scored by its riskiest version
+                result["scriptScore"] = worst["scriptScore"]
+                result["scriptFindings"] = worst["scriptFindings"]
+
+        result["overallScore"] = result["indexScore"] + result["scriptScore"]
+        result["state"] = "missing" if result["source"] == "missing" else stateForScore(result["overallScore"])
+        result["breakdown"] = scoreBreakdown(output.getvalue())
+        result["weeklyDownloads"] = packageInfo.weeklyDownloads if packageInfo else None
+        result["monthlyDownloads"] = packageInfo.monthlyDownloads if packageInfo else None
+        result["lastUpdate"] = packageInfo.lastUpdate if packageInfo else None
+        result["details"] = output.getvalue()
+        if cache and packageName in versionKeys:
+            storeVerdict(packageName, versionKeys[packageName], generation, scanScripts[packageName], result)
+        results.append(result)
+
+    for result in results:
+        if verbose:
+            print(f"--------------------------------------------\n{result['packageName']}{' (cached verdict)' if result['cached'] else ''}")
+            print(result["details"], end="")
+        if not details:
+            for key in ("weeklyDownloads", "monthlyDownloads", "lastUpdate", "details", "cachedAt"):
+                result.pop(key, None)
+    results.sort(key=lambda result: (-result["overallScore"], result["packageName"]))
+    return results
 
+'''
+Prints the consolidated report for a batch scan, one line per dependency most suspicious first and a count of each state
+'''
+def printScanReport(results: list):
+    print(f"--------------------------------------------")
+    print(f"{'package':<40} {'version':<16} {'source':<13} {'index':>5} {'scripts':>7} {'overall':>7}  state")
+    colours = {"malicious": redText, "suspicious": yellowText, "missing": yellowText, "legitimate": greenText}
+    for result in results:
+        versions = ", ".join(result["versions"])
+        line = f"{result['packageName']:<40} {versions[:16]:<16} {result['source']:<13} {result['indexScore']:>5} {result['scriptScore']:>7} {result['overallScore']:>7}  {result['state']}"
+        if result["typosquatOf"]:
+            line += f" (looks like {result['typosquatOf']})"
+        colours[result["state"]](line)
+        if len(result.get("versionScans", [])) > 1: # The scripts score above is the riskiest version's, show every version's
+            for scan in result["versionScans"]:
+                findings = ", ".join(finding["description"] for finding in scan["scriptFindings"]) or "no risky install scripts"
+                print(f"    {scan['version']:<16} scripts {scan['scriptScore']:>3}  {findings}")
+    print(f"--------------------------------------------")
+    counts = {state: sum(1 for result in results if result["state"] == state) for state in colours}
+    print(f"{len(results)} packages scanned: {counts['malicious']} malicious, {counts['suspicious']} suspicious, {counts['legitimate']} legitimate, {counts['missing']} not on npm")
+
+'''
+nscan scan --lockfile <package-lock.json> | --package-json <package.json> [--resolve]
+Exits with 1 if any dependency is malicious (or suspicious with --fail-on suspicious) so it can gate a CI job
+'''
+def scanMain(arguments: list):
+    parser = argparse.ArgumentParser(prog="nscan scan", description="Scores every dependency of a project in one run")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--lockfile", help="package-lock.json or npm-shrinkwrap.json, every installed package is scanned")
+    source.add_argument("--package-json", help="package.json, only its direct dependencies are scanned unless --resolve is given")
+    parser.add_argument("--resolve", action="store_true", help="with --package-json, resolve the full dependency tree with npm first")
+    parser.add_argument("--scripts", choices=["auto", "all", "none"], default="auto", help="which packages get their install scripts scanned (default auto: the ones the lockfile says have one)")
+    parser.add_argument("--fail-on", choices=["malicious", "suspicious"], default="malicious", help="lowest state that makes the scan exit with 1")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON instead of the report")
+    parser.add_argument("--verbose", action="store_true", help="show the scoring for every package")
+    parser.add_argument("--no-cache", action="store_true", help="scan every package again instead of using cached verdicts")
+    args = parser.parse_args(arguments)
+
+    try:
+        dependencies = parseLockfile(args.lockfile) if args.lockfile else parsePackageJson(args.package_json, args.resolve)
+    except (OSError, ValueError, RuntimeError) as e:
+        redText(f"Could not read the dependencies: {e}")
+        sys.exit(1)
+    if not dependencies:
+        greenText("No registry dependencies to scan.")
+        sys.exit()
+
+    if args.json: # Progress goes to stderr so stdout is only the JSON
+        with contextlib.redirect_stdout(sys.stderr):
+            results = scanDependencies(dependencies, args.scripts, args.verbose, useCache=not args.no_cache)
+    else:
+        results = scanDependencies(dependencies, args.scripts, args.verbose, useCache=not args.no_cache)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        printScanReport(results)
+    failing = {"malicious"} if args.fail_on == "malicious" else {"malicious", "suspicious"}
+    sys.exit(1 if any(result["state"] in failing for result in results) else 0)
+
+'''
+Prints the package summary, the statistics of the package and the overall index score coloured by its state
+'''
+def printSummary(packageName: str, packageInfo: PackageInfo, overallIndexScore: int):
     print(f"--------------------------------------------")
     print(f"Package Summary for {packageName}")
-    print(f"Weekly Downloads: {weeklyDownloads}")
-    print(f"Monthly Downloads: {monthlyDownloads}")
-    print(f"Last Update: {lastUpdate}")
-    if overallIndexScore >= 10:
+    print(f"Weekly Downloads: {packageInfo.weeklyDownloads}")
+    print(f"Monthly Downloads: {packageInfo.monthlyDownloads}")
+    print(f"Last Update: {packageInfo.lastUpdate}")
+    state = stateForScore(overallIndexScore)
+    if state == "malicious":
         redText(f"Overall Index Score: {overallIndexScore} / 20")
-        state = "malicious"
-    elif overallIndexScore >= 5 and overallIndexScore < 10:
+    elif state == "suspicious":
         yellowText(f"Overall Index Score: {overallIndexScore} / 20")
-        state = "suspicious"
     else:
         greenText(f"Overall Index Score: {overallIndexScore} / 20")
-        state = "legitimate"
-
-    print(f"--------------------------------------------")
 
     # print(state) Used for the evaluation script
 
+'''
+Asks the user if they want to go ahead and if so passes the command on to npm
+'''
+def confirmAndRun(typeOfCommand: str, packageName: str):
     if typeOfCommand == "install":
 
         continueInstallation = input("Are you sure you want to continue with the installation (y/n):").lower()
@@ -304,6 +668,154 @@ def main():
             print(f"Aborting update of {packageName}")
             sys.exit()
 
+'''
+Shows a verdict from the nscan daemon or the verdict cache the same way a scan in this process is shown, exits if the package doesn't exist
+'''
+def showVerdict(packageName: str, verdict: dict, origin: str):
+    print(f"Verdict for {packageName} {origin}")
+    print(verdict["details"], end="")
+    if verdict["state"] == "missing":
+        yellowText(f"{packageName} does not exist. Exiting...")
+        sys.exit(1)
+    packageInfo = PackageInfo(packageName, verdict["weeklyDownloads"], verdict["monthlyDownloads"], verdict["lastUpdate"])
+    printSummary(packageName, packageInfo, verdict["overallScore"])
+
+'''
+Main method to run the entire flow for the tool
+
+First checks all the parameters are correct and valid
+Extracts the type of command and the package name from the command line arguements
+If the nscan daemon is running (nscan serve) the verdict comes from it, then from the verdict cache if the latest version was scanned before,
+otherwise the package is scanned in this process (see scanPackageLocally) and the verdict is cached:
+Starts the install script scan and (for packages in neither database) the registry lookups in the background, see ScanStages
+Resolves the package against every database in one lookup and if it is in neither checks if the package exists (if not, it exits)
+If the package exists but in neither database it is looked up in the confusable skeleton index and then the typosquat index,
+if it looks like or is close to a legitimate package it generates a typosquatting index score against it
+Otherwise it generates a general suspicious index score
+If the package is in the typosquatted database it generates a typoquatting index score
+If the package is in the legitimate database it fetches the package information and generates a suspicious index score (incase of supply chain attacks)
+Scans the installation scripts for malicious behaviour and adds to the overall index score
+Prints out a package summary containing the statistics of the package along with prompting the user if they want to continue with the installation or update 
+If yes, passes the command to npm to continue with the installation or update
+If no, aborts and outputs a print statement to verify
+'''
+def main():
+    if len(sys.argv) >= 2 and sys.argv[1] == "scan":
+        scanMain(sys.argv[2:])
+        return
+    if len(sys.argv) >= 2 and sys.argv[1] == "serve":
+        from nscanDaemon import serveMain # Imported here as the daemon imports this module
+        serveMain(sys.argv[2:])
+        return
+    if len(sys.argv) < 3 or (sys.argv[1] != "install" and sys.argv[1] != "update"):
+        print("Usage: nscan install <package> || nscan update <package> || nscan scan --lockfile <package-lock.json> || nscan scan --package-json <package.json> || nscan serve [--port <port>]")
+        sys.exit(1)
+
+    typeOfCommand = sys.argv[1]
+    packageName = sys.argv[2]
+
+    verdict = fetchVerdict(packageName)
+    if verdict is not None:
+        showVerdict(packageName, verdict, f"from the nscan daemon ({'cached, ' if verdict['cached'] else ''}{verdict['elapsedMs']:.0f} ms)")
+    else:
+        version, generation, verdict = lookupCachedVerdict(packageName)
+        if verdict is not None:
+            showVerdict(packageName, verdict, f"{version} from the verdict cache (scanned {formatTimestamp(verdict['cachedAt'])})")
+        else:
+            verdict = scanPackageLocally(packageName, version)
+            storeVerdict(packageName, version, generation, True, verdict)
+    print(f"--------------------------------------------")
+
+    confirmAndRun(typeOfCommand, packageName)
+
+'''
+Scans a single package in this process, printing the scoring as it goes, and returns the verdict in the same format as scanDependencies with details
+'''
+def scanPackageLocally(packageName: str, version: str = None) -> dict:
+    overallIndexScore = 0
+    typosquatOf = None
+    stages = ScanStages()
+    scanner = ScriptScanner(packageName, version) # The version the verdict is cached under, None installs the latest
+    scriptScan = stages.submit("install scripts", scanner.scanPackage, False) # npm install is the slowest stage so it starts first
+    output = TeeOutput(sys.stdout)
+    with contextlib.redirect_stdout(output):
+        resolved = stages.run("database", resolvePackage, packageName)
+
+        if not resolved.inDatabase:
+            source = "npm"
+            print(f"Package not in database, getting information for {packageName}...")
+            weeklyLookup = stages.submit("weekly downloads", getWeeklyDownloadsBasic, packageName)
+            monthlyLookup = stages.submit("monthly downloads", getMonthlyDownloadsBasic, packageName)
+            lastUpdateLookup = stages.submit("last update", fetchLastUpdate, packageName) # Returns None quietly if the package turns out not to exist
+            lookalikes = stages.run("skeleton index", lambda: getSkeletonIndex().lookup(packageName)) # The index lookups run here while the registry lookups are in flight
+            if lookalikes:
+                nearMatches = [(lookalikes[0], 0, f"Homograph attack - same skeleton as {lookalikes[0]} (skeleton index)")]
+            else:
+                nearMatches = stages.run("typosquat index", lambda: getTyposquatIndex().detect(packageName)) # Catches squats that no sweep generated
+            weeklyDownloads = weeklyLookup.result()
+            monthlyDownloads = monthlyLookup.result()
+            if weeklyDownloads is None or monthlyDownloads is None:
+                if lookalikes:
+                    redText(f"{packageName} is a homograph of {lookalikes[0]}, double check the name you typed")
+                yellowText(f"{packageName} does not exist. Exiting...")
+                stages.close()
+                sys.exit(1)
+            packageInfo = PackageInfo(packageName, weeklyDownloads, monthlyDownloads, lastUpdateLookup.result())
+            if nearMatches:
+                originalPackage, distance, message = nearMatches[0]
+                typosquatOf = originalPackage
+                yellowText(f"{packageName} looks like a typosquat of {originalPackage} ({message})")
+                if len(nearMatches) > 1:
+                    print(f"Also close to: {', '.join(name for name, _, _ in nearMatches[1:6])}")
+                original = getStore().legitimateInfo(originalPackage)
+                typosquattingIndexScore = calculateIndexScoreForTyposquatting(packageInfo, original, message)
+                redText(f"Typoquatting index score for {packageName}: {typosquattingIndexScore} / 15")
+                overallIndexScore += typosquattingIndexScore
+            else:
+                suspiciousIndexScore = calculateSuspiciousIndexScore(packageInfo)
+                redText(f"Suspicious index score for {packageName}: {suspiciousIndexScore} / 15")
+                overallIndexScore += suspiciousIndexScore
+        elif resolved.typosquatted:
+            source = "typosquatted"
+            print(f"Fetching {packageName} information from typosquatted database...")
+            packageInfo = resolved.typosquatted
+            typosquatOf = packageInfo.typosquattedFrom
+            typosquattingIndexScore = calculateIndexScoreForTyposquatting(packageInfo, resolved.original, packageInfo.detectionMethods)
+            redText(f"Typoquatting index score for {packageName}: {typosquattingIndexScore} / 15")
+            overallIndexScore += typosquattingIndexScore
+        else:
+            source = "legitimate"
+            print(f"Fetching {packageName} information from legitimate database...")
+            packageInfo = resolved.legitimate
+            greenText(f"{packageName} found in legitimate database.")
+            suspiciousIndexScore = calculateSuspiciousIndexScore(packageInfo)
+            overallIndexScore += suspiciousIndexScore
+
+        indexScore = overallIndexScore
+        print(f"Scanning installation scripts for {packageName}...")
+        scriptResult = scriptScan.result()
+        overallIndexScore += reportInstallScripts(scanner, scriptResult)
+    stages.close()
+
+    printSummary(packageName, packageInfo, overallIndexScore)
+    stages.printTimings()
+    return {
+        "packageName": packageName,
+        "version": version,
+        "source": source,
+        "indexScore": indexScore,
+        "scriptScore": overallIndexScore - indexScore,
+        "typosquatOf": typosquatOf,
+        "scriptFindings": findingsAsDicts(scriptResult),
+        "overallScore": overallIndexScore,
+        "state": stateForScore(overallIndexScore),
+        "breakdown": scoreBreakdown(output.getvalue()),
+        "weeklyDownloads": packageInfo.weeklyDownloads,
+        "monthlyDownloads": packageInfo.monthlyDownloads,
+        "lastUpdate": packageInfo.lastUpdate,
+        "details": output.getvalue(),
+    }
+
     
 def redText(text):
     print(f"\033[31m{text}\033[0m")
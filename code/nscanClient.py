@@ -0,0 +1,57 @@
+import json
+import os
+from http.client import HTTPConnection, HTTPException
+from urllib.parse import quote, urlparse
+
+'''
+Thin client for the nscan daemon (python code/nscan.py serve), only uses the standard library so asking the daemon costs nothing on top of starting Python
+
+nscan install and update ask the daemon for a verdict first and fall back to scanning in process if it isn't running or fails.
+Set NSCAN_DAEMON=0 to always scan in process, NSCAN_DAEMON_URL points the client at a daemon on another port
+'''
+
+DEFAULT_DAEMON_PORT = 7878
+DAEMON_URL = os.environ.get("NSCAN_DAEMON_URL", f"http://127.0.0.1:{DEFAULT_DAEMON_PORT}").rstrip("/")
+DAEMON_CONNECT_TIMEOUT = 2 # A daemon on this machine accepts straight away, one that doesn't (a hung daemon, a port something else holds) falls back to scanning in process
+DAEMON_TIMEOUT = 600 # Only once connected, a verdict that isn't cached yet includes an npm install for the script scan
+_daemonDisabled = os.environ.get("NSCAN_DAEMON", "1") == "0"
+
+'''
+Sends a request to the daemon and returns the decoded JSON, or None if the daemon isn't running or the request failed
+Connecting has to happen within connectTimeout, only then is the socket given the long timeout for reading the answer
+'''
+def daemonRequest(path: str, body: dict = None, timeout: float = DAEMON_TIMEOUT, connectTimeout: float = DAEMON_CONNECT_TIMEOUT):
+    if _daemonDisabled:
+        return None
+    url = urlparse(DAEMON_URL)
+    data = json.dumps(body).encode() if body is not None else None
+    connection = HTTPConnection(url.hostname, url.port or 80, timeout=connectTimeout)
+    try:
+        connection.connect()
+        connection.sock.settimeout(timeout)
+        connection.request("POST" if data else "GET", f"{url.path}{path}", body=data, headers={"Content-Type": "application/json"} if data else {})
+        response = connection.getresponse()
+        if response.status != 200:
+            return None
+        return json.loads(response.read())
+    except (HTTPException, OSError, ValueError):
+        return None
+    finally:
+        connection.close()
+
+'''
+Verdict for one package, a result dictionary in the same format as nscan scan --json plus the scoring details, or None if the daemon can't give one
+scripts is "auto", "all" or "none" (skip the install script scan)
+'''
+def fetchVerdict(packageName: str, scripts: str = "auto"):
+    return daemonRequest(f"/verdict?name={quote(packageName, safe='@/')}&scripts={scripts}")
+
+'''
+Verdicts for many packages in one request, returns a list of result dictionaries in the same order as the names, or None
+'''
+def fetchVerdicts(packageNames: list, scripts: str = "auto"):
+    response = daemonRequest("/verdict", {"names": list(packageNames), "scripts": scripts})
+    return response["results"] if response else None
+
+def daemonHealth(timeout: float = 2):
+    return daemonRequest("/health", timeout=timeout)
@@ -0,0 +1,257 @@
+import argparse
+import contextlib
+import io
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import npmCalls
+from confusables import getSkeletonIndex
+from nscan import scanDependencies
+from nscanClient import DEFAULT_DAEMON_PORT
+from packageStore import getStore, closeStore, GenerationReader
+from typosquatIndex import getTyposquatIndex
+from verdictCache import getVerdictCache, VERSION_CHECK_MAX_AGE
+
+'''
+Long running nscan (python code/nscan.py serve) that keeps the databases, the skeleton and typosquat indexes and the HTTP connection pool warm between scans
+and answers over a localhost HTTP JSON API:
+    GET  /verdict?name=<package>[&scripts=auto|all|none] - verdict for one package, the same result dictionary as nscan scan --json plus the scoring details
+    POST /verdict {"names": [...], "scripts": "auto"}      - verdicts for many packages in one request, {"results": [...]} in the same order as the names
+    GET  /health                                           - uptime, cache size and hit counts
+
+Verdicts are cached in memory for a while so repeated questions (an IDE plugin checking the same dependency on every keystroke) come back in a millisecond or two,
+behind that scans use the persistent verdict cache (verdictCache.py) like every other nscan command. Verdicts that were scanned for a registry version are checked
+against the latest version the same way as the persistent cache, so a new release is scanned again instead of getting the old verdict, and every verdict is
+scanned again once the databases have changed since (see PackageStore.generation).
+Only requests from programs on this machine are answered: the Host header has to be the daemon's own address (so a DNS rebinding page can't reach it) and requests
+a browser sends from a web page (anything with an Origin header, or a Sec-Fetch-Site other than the user typing the URL) are refused, as a verdict can mean an npm install.
+The package store connection belongs to the thread that opened it so all the scanning happens on one worker thread, the request threads only read the cache
+'''
+
+VERDICT_TTL = 60 * 60 # Seconds a verdict is served from the cache before the package is scanned again
+SCRIPT_MODES = ("auto", "all", "none")
+
+class VerdictService:
+    def __init__(self, ttl: float = VERDICT_TTL):
+        self.ttl = ttl
+        self.cache = {} # {(packageName, scripts): (result, computedAt, database generation)}
+        self.lock = threading.Lock()
+        self.warmLock = threading.Lock()
+        self.generations = None # Reads the database generation on the request threads, opened by warm
+        self.worker = ThreadPoolExecutor(max_workers=1)
+        self.started = time.time()
+        self.hits = 0
+        self.misses = 0
+
+    '''
+    Opens the store and builds both indexes and the HTTP session on the worker thread before the first request comes in
+    '''
+    def warm(self):
+        def load():
+            store = getStore()
+            getVerdictCache()
+            getSkeletonIndex()
+            getTyposquatIndex()
+            npmCalls.getSession()
+            return store.databaseDir
+        with self.warmLock:
+            if self.generations is None:
+                self.generations = GenerationReader(self.worker.submit(load).result())
+
+    def currentGeneration(self) -> tuple:
+        if self.generations is None:
+            self.warm()
+        return self.generations.generation()
+
+    '''
+    The cached result for the key if it is within the TTL and was scanned with the databases at this generation, otherwise None
+    '''
+    def cached(self, key, generation):
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is not None and time.time() - entry[1] < self.ttl and entry[2] == generation:
+                return entry[0]
+            return None
+
+    '''
+    Drops the cached verdicts whose package has a newer latest version than the one they were scanned for, returns the names dropped
+    '''
+    def dropOutdated(self, results: dict, scripts: str) -> set:
+        versioned = [name for name, result in results.items() if result is not None and result.get("version")]
+        latestVersions = npmCalls.getBatchLatestVersion(versioned, VERSION_CHECK_MAX_AGE)
+        outdated = {name for name in versioned if latestVersions[name] is not None and latestVersions[name] != results[name]["version"]}
+        with self.lock:
+            for name in outdated:
+                self.cache.pop((name, scripts), None)
+        return outdated
+
+    '''
+    Scans the names that still aren't cached (an earlier queued request may have scanned them already), runs on the worker thread
+    '''
+    def scan(self, packageNames: list, scripts: str):
+        generation = getStore().generation() # Read before scanning, a change made during the scan has these verdicts scanned again next time
+        missing = [name for name in packageNames if self.cached((name, scripts), generation) is None]
+        if not missing:
+            return
+        npmCalls.clearMemo() # Responses are memoised for the whole run, in the daemon that would keep the first download counts and versions forever
+        with contextlib.redirect_stdout(io.StringIO()): # The progress line isn't needed, each result keeps its own scoring output
+            results = scanDependencies({name: {"versions": set(), "hasInstallScript": None} for name in missing}, scripts, details=True)
+        now = time.time()
+        with self.lock:
+            for result in results:
+                del result["versions"]
+                self.cache[(result["packageName"], scripts)] = (result, now, generation)
+
+    '''
+    Returns a result dictionary for every name, in the same order, scanning the ones that aren't cached in one batch
+    '''
+    def verdicts(self, packageNames: list, scripts: str = "auto") -> list:
+        start = time.perf_counter()
+        generation = self.currentGeneration()
+        results = {name: self.cached((name, scripts), generation) for name in packageNames}
+        outdated = self.dropOutdated(results, scripts)
+        missing = [name for name, result in results.items() if result is None or name in outdated]
+        with self.lock:
+            self.hits += len(results) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            self.worker.submit(self.scan, missing, scripts).result()
+            with self.lock:
+                for name in missing:
+                    results[name] = self.cache[(name, scripts)][0] # Just scanned, even if the databases changed while it ran
+        elapsedMs = (time.perf_counter() - start) * 1000
+        return [dict(results[name], cached=name not in missing or results[name]["cached"], elapsedMs=round(elapsedMs, 2)) for name in packageNames]
+
+    def health(self) -> dict:
+        with self.lock:
+            return {"uptime": round(time.time() - self.started), "cachedVerdicts": len(self.cache), "hits": self.hits, "misses": self.misses, "ttl": self.ttl}
+
+    '''
+    Closes the generation reader, then the store on the worker thread that opened it, and stops the worker
+    '''
+    def close(self):
+        if self.generations is not None:
+            self.generations.close()
+        self.worker.submit(closeStore).result()
+        self.worker.shutdown(cancel_futures=True)
+
+LOOPBACK_HOSTS = ("127.0.0.1", "localhost", "[::1]")
+
+'''
+Host header values the daemon answers to, the loopback names plus the address it listens on (unless that is every interface)
+'''
+def allowedHosts(host: str, port: int) -> set:
+    hosts = set(LOOPBACK_HOSTS)
+    if host not in ("", "0.0.0.0", "::"):
+        hosts.add(f"[{host}]" if ":" in host else host)
+    return {f"{name}:{port}" for name in hosts}
+
+def makeHandler(service: VerdictService, quiet: bool):
+    class VerdictHandler(BaseHTTPRequestHandler):
+        '''
+        Refuses requests that come from a web page or through a name other than the daemon's own, returns False if the request was refused
+        '''
+        def allowed(self) -> bool:
+            host, port = self.server.server_address[:2]
+            if self.headers.get("Host", "").lower() not in allowedHosts(host, port):
+                self.sendJson(403, {"error": "unknown Host"})
+                return False
+            if self.headers.get("Origin") is not None or self.headers.get("Sec-Fetch-Site", "none") != "none":
+                self.sendJson(403, {"error": "requests from web pages are not allowed"})
+                return False
+            return True
+
+        def sendJson(self, status: int, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def answer(self, packageNames: list, scripts: str, single: bool):
+            if not packageNames or not all(isinstance(name, str) and name for name in packageNames):
+                return self.sendJson(400, {"error": "no package names given"})
+            if scripts not in SCRIPT_MODES:
+                return self.sendJson(400, {"error": f"scripts must be one of {', '.join(SCRIPT_MODES)}"})
+            try:
+                results = service.verdicts(packageNames, scripts)
+            except Exception as e:
+                return self.sendJson(500, {"error": str(e)})
+            self.sendJson(200, results[0] if single else {"results": results})
+
+        def do_GET(self):
+            if not self.allowed():
+                return
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            if url.path == "/health":
+                self.sendJson(200, service.health())
+            elif url.path == "/verdict":
+                self.answer(query.get("name", [])[:1], query.get("scripts", ["auto"])[0], True)
+            else:
+                self.sendJson(404, {"error": "not found"})
+
+        def do_POST(self):
+            if not self.allowed():
+                return
+            if urlparse(self.path).path != "/verdict":
+                return self.sendJson(404, {"error": "not found"})
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            except ValueError:
+                return self.sendJson(400, {"error": "body must be JSON"})
+            if not isinstance(body, dict) or not isinstance(body.get("names"), list):
+                return self.sendJson(400, {"error": "body must be {\"names\": [...]}"})
+            self.answer(body["names"], body.get("scripts", "auto"), False)
+
+        def log_message(self, format, *args):
+            if not quiet:
+                super().log_message(format, *args)
+
+    return VerdictHandler
+
+'''
+Creates the daemon's HTTP server without starting it, port 0 picks a free port (server.server_address has the one chosen)
+'''
+def makeServer(host: str = "127.0.0.1", port: int = DEFAULT_DAEMON_PORT, ttl: float = VERDICT_TTL, quiet: bool = False):
+    service = VerdictService(ttl)
+    server = ThreadingHTTPServer((host, port), makeHandler(service, quiet))
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+'''
+nscan serve [--host <host>] [--port <port>] [--ttl <seconds>] [--quiet]
+'''
+def serveMain(arguments: list):
+    parser = argparse.ArgumentParser(prog="nscan serve", description="Keeps nscan warm and answers verdicts over a localhost HTTP JSON API")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on, keep it on localhost unless the machine is trusted")
+    parser.add_argument("--port", type=int, default=DEFAULT_DAEMON_PORT)
+    parser.add_argument("--ttl", type=float, default=VERDICT_TTL, help="seconds a verdict is cached before the package is scanned again")
+    parser.add_argument("--quiet", action="store_true", help="don't log every request")
+    args = parser.parse_args(arguments)
+
+    server = makeServer(args.host, args.port, args.ttl, args.quiet)
+    print("Loading the databases and indexes...")
+    server.service.warm()
+    host, port = server.server_address[:2]
+    greenText(f"nscan daemon listening on http://{host}:{port} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping the nscan daemon")
+    finally:
+        server.server_close()
+        server.service.close()
+
+def greenText(text):
+    print(f"\033[32m{text}\033[0m")
+
+if __name__ == "__main__":
+    serveMain(sys.argv[1:])
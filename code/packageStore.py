@@ -0,0 +1,498 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Optional
+
+'''
+Single connection database layer for the legitimate, typosquatted and notCreated databases
+
+legitimate.db is opened directly and typosquatted.db and notCreated.db are attached to the same connection, so every lookup and write goes through one connection
+instead of opening and closing one per row. Writes are done in bulk with executemany inside one transaction per batch.
+Note that in WAL mode a transaction spanning several attached databases is atomic per database file rather than across all of them.
+'''
+
+DATABASE_DIR = "database"
+
+PRAGMAS = [
+    "PRAGMA {schema}.journal_mode=WAL",
+    "PRAGMA {schema}.synchronous=NORMAL", # Safe with WAL, only the last transactions can be lost on a power cut and the database can't be corrupted
+    "PRAGMA {schema}.cache_size=-65536", # 64MB page cache
+    "PRAGMA {schema}.mmap_size=268435456",
+]
+SCHEMAS = ("main", "typosquatted", "notCreated")
+SCHEMA_VERSION = 1 # PRAGMA user_version of every database once createTables has set it up, bump it whenever createTables changes so existing databases are migrated
+GENERATION_TABLES = {"main": "legitimate", "typosquatted": "typosquatted"} # Tables the scoring reads, each database counts the changes to its own table
+
+'''
+Download counts and last update of a package, from the legitimate or typosquatted database or fetched from npm
+'''
+@dataclass
+class PackageInfo:
+    packageName: str
+    weeklyDownloads: int
+    monthlyDownloads: int
+    lastUpdate: str
+
+@dataclass
+class TyposquatInfo(PackageInfo):
+    typosquattedFrom: str
+    detectionMethods: str
+
+'''
+Everything the scanner needs from the databases for one name: its legitimate row, its typosquatted row and the legitimate row of the package it typosquats
+Fields are None when the name (or its original) isn't in that database
+'''
+@dataclass
+class ResolvedPackage:
+    packageName: str
+    legitimate: Optional[PackageInfo] = None
+    typosquatted: Optional[TyposquatInfo] = None
+    original: Optional[PackageInfo] = None
+
+    @property
+    def inDatabase(self) -> bool:
+        return self.legitimate is not None or self.typosquatted is not None
+
+RESOLVE_COLUMNS = '''
+    q.name, t.typosquattedFrom, t.weeklyDownloads, t.monthlyDownloads, t.lastUpdate, t.detectionMethods,
+    o.packageName, o.weeklyDownloads, o.monthlyDownloads, o.lastUpdate,
+    l.packageName, l.weeklyDownloads, l.monthlyDownloads, l.lastUpdate'''
+RESOLVE_JOINS = '''
+    LEFT JOIN typosquatted.typosquatted t ON t.packageName = q.name
+    LEFT JOIN main.legitimate o ON o.packageName = t.typosquattedFrom
+    LEFT JOIN main.legitimate l ON l.packageName = q.name'''
+
+def resolvedFromRow(row) -> ResolvedPackage:
+    name, typosquattedFrom, weekly, monthly, lastUpdate, detectionMethods = row[:6]
+    resolved = ResolvedPackage(name)
+    if typosquattedFrom is not None:
+        resolved.typosquatted = TyposquatInfo(name, weekly, monthly, lastUpdate, typosquattedFrom, detectionMethods)
+    if row[6] is not None:
+        resolved.original = PackageInfo(*row[6:10])
+    if row[10] is not None:
+        resolved.legitimate = PackageInfo(*row[10:14])
+    return resolved
+
+class PackageStore:
+    def __init__(self, databaseDir: str = DATABASE_DIR):
+        self.databaseDir = databaseDir
+        self.connect = sqlite3.connect(os.path.join(databaseDir, "legitimate.db"))
+        self.connect.execute("ATTACH DATABASE ? AS typosquatted", (os.path.join(databaseDir, "typosquatted.db"),))
+        self.connect.execute("ATTACH DATABASE ? AS notCreated", (os.path.join(databaseDir, "notCreated.db"),))
+        for schema in SCHEMAS:
+            for pragma in PRAGMAS:
+                self.connect.execute(pragma.format(schema=schema))
+        self.createTables()
+
+    '''
+    Creates the tables and migrates databases made by older versions, skipped when every database is already at SCHEMA_VERSION so opening the store doesn't
+    probe every table for missing columns. Databases created by the legacy setup scripts are at version 0 and get migrated
+    '''
+    def createTables(self):
+        outdated = [schema for schema in SCHEMAS if self.connect.execute(f"PRAGMA {schema}.user_version").fetchone()[0] < SCHEMA_VERSION]
+        if not outdated:
+            return
+        self.connect.execute('''
+        CREATE TABLE IF NOT EXISTS main.legitimate(
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    packageName TEXT UNIQUE NOT NULL,
+                    weeklyDownloads INTEGER NOT NULL,
+                    monthlyDownloads INTEGER NOT NULL,
+                    lastUpdate TIMESTAMP NOT NULL)
+                    ''')
+        self.connect.execute('''
+        CREATE TABLE IF NOT EXISTS typosquatted.typosquatted(
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    packageName TEXT UNIQUE NOT NULL,
+                    typosquattedFrom TEXT NOT NULL,
+                    weeklyDownloads INTEGER NOT NULL,
+                    monthlyDownloads INTEGER NOT NULL,
+                    lastUpdate TIMESTAMP NOT NULL,
+                    detectionMethods TEXT NOT NULL)
+                    ''')
+        self.addColumnIfMissing("typosquatted", "typosquatted", "provenance", "TEXT") # JSON list of every {"seed", "technique"} the name was generated from
+        self.connect.execute('''
+        CREATE TABLE IF NOT EXISTS typosquatted.sweepCheckpoint(
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    seedName TEXT,
+                    seedId INTEGER,
+                    candidateOffset INTEGER NOT NULL,
+                    batchNumber INTEGER NOT NULL,
+                    processedPackages INTEGER NOT NULL,
+                    retryQueue TEXT NOT NULL,
+                    options TEXT NOT NULL,
+                    updatedAt TIMESTAMP NOT NULL)
+                    ''') # Only ever holds one row, where the last typosquatting sweep got to
+        self.addColumnIfMissing("typosquatted", "sweepCheckpoint", "previous", "TEXT") # JSON of the checkpoint this one replaced, where a resumed sweep starts from
+        self.connect.execute('''
+        CREATE TABLE IF NOT EXISTS typosquatted.sweepSeeds(
+                    packageName TEXT PRIMARY KEY,
+                    sweptAt TIMESTAMP NOT NULL)
+                    ''') # Legitimate packages a finished sweep generated candidates for, the incremental sweep only covers seeds missing from here
+        self.connect.execute('''
+        CREATE TABLE IF NOT EXISTS notCreated.notCreated(
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    packageName TEXT UNIQUE NOT NULL)
+                    ''')
+        if self.addColumnIfMissing("notCreated", "notCreated", "checkedAt", "TIMESTAMP"):
+            self.connect.execute('''UPDATE notCreated.notCreated SET checkedAt = datetime('now') WHERE checkedAt IS NULL''') # Existing names count as checked now rather than all being rechecked at once
+        self.addColumnIfMissing("notCreated", "notCreated", "typosquattedFrom", "TEXT") # Kept so a name that gets registered later can be added to typosquatted.db without regenerating it
+        self.addColumnIfMissing("notCreated", "notCreated", "detectionMethods", "TEXT")
+        self.addColumnIfMissing("notCreated", "notCreated", "provenance", "TEXT")
+        self.connect.execute('''CREATE INDEX IF NOT EXISTS notCreated.notCreatedCheckedAt ON notCreated(checkedAt)''')
+        self.connect.execute('''
+        CREATE TABLE IF NOT EXISTS notCreated.recheckBudget(
+                    day TEXT PRIMARY KEY,
+                    requests INTEGER NOT NULL)
+                    ''') # Registry requests spent rechecking notCreated names each day
+        for schema, table in GENERATION_TABLES.items():
+            self.connect.execute(f'''
+            CREATE TABLE IF NOT EXISTS {schema}.storeGeneration(
+                        id INTEGER PRIMARY KEY CHECK (id = 1),
+                        generation INTEGER NOT NULL)
+                        ''') # Only ever holds one row, counted up by the triggers below
+            self.connect.execute(f'''INSERT OR IGNORE INTO {schema}.storeGeneration (id, generation) VALUES (1, 0)''')
+            for event in ("INSERT", "UPDATE", "DELETE"): # The triggers are stored in the database file so writers that open it directly (populateDatabase, databaseSetup) are counted too
+                self.connect.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {schema}.{table}{event.title()}Generation AFTER {event} ON {table}
+                BEGIN UPDATE storeGeneration SET generation = generation + 1; END''')
+        self.connect.commit()
+        for schema in outdated:
+            self.connect.execute(f"PRAGMA {schema}.user_version = {SCHEMA_VERSION}")
+
+    '''
+    Adds a column to an existing database created before the column was introduced
+    '''
+    def addColumnIfMissing(self, schema: str, table: str, column: str, definition: str) -> bool:
+        columns = [row[1] for row in self.connect.execute(f"PRAGMA {schema}.table_info({table})")]
+        if column not in columns:
+            self.connect.execute(f"ALTER TABLE {schema}.{table} ADD COLUMN {column} {definition}")
+            return True
+        return False
+
+    '''
+    Everything written inside the block is committed together, or rolled back if an exception is raised
+    '''
+    @contextmanager
+    def transaction(self):
+        try:
+            yield self
+            self.connect.commit()
+        except Exception:
+            self.connect.rollback()
+            raise
+
+    '''
+    rows are (packageName, weeklyDownloads, monthlyDownloads, lastUpdate), existing packages have their information updated
+    '''
+    def upsertLegitimate(self, rows: list):
+        self.connect.executemany('''
+            INSERT INTO main.legitimate (packageName, weeklyDownloads, monthlyDownloads, lastUpdate) VALUES (?, ?, ?, ?)
+            ON CONFLICT(packageName) DO UPDATE SET weeklyDownloads = excluded.weeklyDownloads, monthlyDownloads = excluded.monthlyDownloads, lastUpdate = excluded.lastUpdate''', rows)
+
+    '''
+    rows are (packageName, typosquattedFrom, weeklyDownloads, monthlyDownloads, lastUpdate, detectionMethods, provenance) where provenance is a list of (seed, technique)
+    '''
+    def addTyposquatted(self, rows: list):
+        self.connect.executemany('''
+            INSERT OR IGNORE INTO typosquatted.typosquatted (packageName, typosquattedFrom, weeklyDownloads, monthlyDownloads, lastUpdate, detectionMethods, provenance)
+            VALUES (?, ?, ?, ?, ?, ?, ?)''', ((*row[:6], dumpProvenance(row[6])) for row in rows))
+
+    '''
+    Adds extra (seed, technique) provenance to names already in the typosquatted database, names that aren't in it are ignored
+    Takes a dictionary of {packageName: [(seed, technique), ...]} and returns the number of rows updated
+    '''
+    def mergeProvenance(self, extraProvenance: dict, chunkSize: int = 500) -> int:
+        with self.transaction():
+            return self.applyProvenance(extraProvenance, chunkSize)
+
+    '''
+    mergeProvenance without committing, for when the update has to be part of a bigger transaction
+    '''
+    def applyProvenance(self, extraProvenance: dict, chunkSize: int = 500) -> int:
+        names = list(extraProvenance)
+        updates = []
+        for start in range(0, len(names), chunkSize):
+            chunk = names[start:start + chunkSize]
+            placeholders = ",".join("?" * len(chunk))
+            for packageName, typosquattedFrom, detectionMethods, provenance in self.connect.execute(
+                    f'''SELECT packageName, typosquattedFrom, detectionMethods, provenance FROM typosquatted.typosquatted WHERE packageName IN ({placeholders})''', chunk):
+                existing = loadProvenance(provenance) or [(typosquattedFrom, method) for method in detectionMethods.split("; ")]
+                merged = mergeProvenanceLists(existing, extraProvenance[packageName])
+                if merged != existing:
+                    updates.append((detectionMethodsFor(merged), dumpProvenance(merged), packageName))
+        self.connect.executemany('''UPDATE typosquatted.typosquatted SET detectionMethods = ?, provenance = ? WHERE packageName = ?''', updates)
+        return len(updates)
+
+    '''
+    Which of the names have already been checked, returns (names in the typosquatted database, names in the notCreated database)
+    '''
+    def checkedNames(self, packageNames: list, chunkSize: int = 500):
+        typosquattedNames = set()
+        notCreatedNames = set()
+        for start in range(0, len(packageNames), chunkSize):
+            chunk = packageNames[start:start + chunkSize]
+            placeholders = ",".join("?" * len(chunk))
+            typosquattedNames.update(row[0] for row in self.connect.execute(f'''SELECT packageName FROM typosquatted.typosquatted WHERE packageName IN ({placeholders})''', chunk))
+            notCreatedNames.update(row[0] for row in self.connect.execute(f'''SELECT packageName FROM notCreated.notCreated WHERE packageName IN ({placeholders})''', chunk))
+        return typosquattedNames, notCreatedNames
+
+    '''
+    Sweep checkpoint, written in the same transaction as the batch results it covers
+    The checkpoint is in typosquatted.db but the batch's notCreated rows are in notCreated.db, and with WAL a crash can commit one file and not the other.
+    So the checkpoint it replaces (the start of the sweep for the first one) is kept with it, every batch before that one was fully committed
+    '''
+    def saveCheckpoint(self, seedName: str, seedId: int, candidateOffset: int, batchNumber: int, processedPackages: int, retryQueue: list, options: dict):
+        previous = self.loadCheckpoint(rewind=False)
+        if previous is None:
+            previous = {"seedName": None, "seedId": None, "candidateOffset": 0, "batchNumber": 0, "processedPackages": 0, "retryQueue": []}
+        previous = {key: previous[key] for key in ("seedName", "seedId", "candidateOffset", "batchNumber", "processedPackages", "retryQueue")}
+        self.connect.execute('''
+            INSERT OR REPLACE INTO typosquatted.sweepCheckpoint (id, seedName, seedId, candidateOffset, batchNumber, processedPackages, retryQueue, options, updatedAt, previous)
+            VALUES (1, ?, ?, ?, ?, ?, ?, ?, datetime('now'), ?)''',
+            (seedName, seedId, candidateOffset, batchNumber, processedPackages, json.dumps(retryQueue), json.dumps(options), json.dumps(previous)))
+
+    '''
+    Returns the checkpoint as a dictionary, or None if there isn't one
+    By default this is the checkpoint before the last one (see saveCheckpoint), so a resumed sweep checks the last batch again in case its notCreated rows were lost.
+    Names from it that were stored are dropped by the known name filter
+    '''
+    def loadCheckpoint(self, rewind: bool = True):
+        row = self.connect.execute('''
+            SELECT seedName, seedId, candidateOffset, batchNumber, processedPackages, retryQueue, options, updatedAt, previous FROM typosquatted.sweepCheckpoint WHERE id = 1''').fetchone()
+        if row is None:
+            return None
+        seedName, seedId, candidateOffset, batchNumber, processedPackages, retryQueue, options, updatedAt, previous = row
+        checkpoint = {"seedName": seedName, "seedId": seedId, "candidateOffset": candidateOffset, "batchNumber": batchNumber, "processedPackages": processedPackages,
+                      "retryQueue": json.loads(retryQueue), "options": json.loads(options), "updatedAt": updatedAt}
+        if rewind and previous: # Checkpoints saved before previous was added are used as they are
+            checkpoint.update(json.loads(previous))
+        return checkpoint
+
+    def clearCheckpoint(self):
+        with self.transaction():
+            self.connect.execute('''DELETE FROM typosquatted.sweepCheckpoint''')
+
+    '''
+    rows are (packageName, typosquattedFrom, detectionMethods, provenance), names already in the database have checkedAt moved to now
+    '''
+    def addNotCreated(self, rows: list):
+        self.connect.executemany('''
+            INSERT INTO notCreated.notCreated (packageName, typosquattedFrom, detectionMethods, provenance, checkedAt) VALUES (?, ?, ?, ?, datetime('now'))
+            ON CONFLICT(packageName) DO UPDATE SET checkedAt = excluded.checkedAt,
+                typosquattedFrom = COALESCE(notCreated.typosquattedFrom, excluded.typosquattedFrom),
+                detectionMethods = COALESCE(notCreated.detectionMethods, excluded.detectionMethods),
+                provenance = COALESCE(notCreated.provenance, excluded.provenance)''',
+            ((name, typosquattedFrom, detectionMethods, dumpProvenance(provenance)) for name, typosquattedFrom, detectionMethods, provenance in rows))
+
+    def removeNotCreated(self, packageNames: list):
+        self.connect.executemany('''DELETE FROM notCreated.notCreated WHERE packageName = ?''', ((name,) for name in packageNames))
+
+    '''
+    notCreated names last checked more than ttlDays ago (or never timestamped), oldest first
+    priority orders them instead if given, it is called as priority(seed weeklyDownloads, detectionMethods, age in days) and the highest go first,
+    names never timestamped count as twice ttlDays old
+    Returns (packageName, typosquattedFrom, detectionMethods, provenance) rows, the last three are None for names stored before they were kept
+    '''
+    def staleNotCreated(self, ttlDays: float, limit: int = None, priority=None) -> list:
+        order = "n.checkedAt"
+        parameters = [f"-{ttlDays} days"]
+        if priority is not None:
+            self.connect.create_function("recheckPriority", 3, priority, deterministic=True)
+            order = "recheckPriority(l.weeklyDownloads, n.detectionMethods, COALESCE(julianday('now') - julianday(n.checkedAt), ?)) DESC"
+            parameters.append(ttlDays * 2)
+        parameters.append(-1 if limit is None else limit)
+        rows = self.connect.execute(f'''
+            SELECT n.packageName, n.typosquattedFrom, n.detectionMethods, n.provenance FROM notCreated.notCreated n
+            LEFT JOIN main.legitimate l ON l.packageName = n.typosquattedFrom
+            WHERE n.checkedAt IS NULL OR n.checkedAt < datetime('now', ?) ORDER BY {order} LIMIT ?''', parameters).fetchall()
+        return [(name, typosquattedFrom, detectionMethods, loadProvenance(provenance)) for name, typosquattedFrom, detectionMethods, provenance in rows]
+
+    '''
+    Registry requests the notCreated recheck has spent on a day (a UTC YYYY-MM-DD date)
+    '''
+    def recheckRequestsUsed(self, day: str) -> int:
+        row = self.connect.execute('''SELECT requests FROM notCreated.recheckBudget WHERE day = ?''', (day,)).fetchone()
+        return row[0] if row else 0
+
+    '''
+    Not committed, so it goes in the same transaction as the results the requests were spent on
+    '''
+    def addRecheckRequests(self, day: str, requests: int):
+        self.connect.execute('''
+            INSERT INTO notCreated.recheckBudget (day, requests) VALUES (?, ?)
+            ON CONFLICT(day) DO UPDATE SET requests = requests + excluded.requests''', (day, requests))
+
+    '''
+    Records every legitimate package from firstSeedId on as swept, called once a sweep over them has finished
+    '''
+    def recordSweptSeeds(self, firstSeedId: int = None):
+        with self.transaction():
+            self.connect.execute('''
+                INSERT OR REPLACE INTO typosquatted.sweepSeeds (packageName, sweptAt)
+                SELECT packageName, datetime('now') FROM main.legitimate WHERE id >= ?''', (firstSeedId or 0,))
+
+    '''
+    Number of legitimate packages no finished sweep has generated candidates for
+    '''
+    def unsweptSeedCount(self) -> int:
+        return self.connect.execute('''
+            SELECT COUNT(*) FROM main.legitimate WHERE packageName NOT IN (SELECT packageName FROM typosquatted.sweepSeeds)''').fetchone()[0]
+
+    def getLegitimate(self, packageName: str):
+        return self.connect.execute('''SELECT * FROM main.legitimate WHERE packageName = ?''', (packageName,)).fetchone()
+
+    def legitimateId(self, packageName: str):
+        row = self.connect.execute('''SELECT id FROM main.legitimate WHERE packageName = ?''', (packageName,)).fetchone()
+        return row[0] if row else None
+
+    '''
+    Looks a name up in every database with one query, see ResolvedPackage
+    '''
+    def resolve(self, packageName: str) -> ResolvedPackage:
+        row = self.connect.execute(f'''SELECT {RESOLVE_COLUMNS} FROM (SELECT ? AS name) q {RESOLVE_JOINS}''', (packageName,)).fetchone()
+        return resolvedFromRow(row)
+
+    '''
+    resolve for many names at once, returns {packageName: ResolvedPackage}
+    '''
+    def resolveMany(self, packageNames, chunkSize: int = 500) -> dict:
+        packageNames = list(dict.fromkeys(packageNames))
+        resolved = {}
+        for start in range(0, len(packageNames), chunkSize):
+            chunk = packageNames[start:start + chunkSize]
+            values = ",".join(["(?)"] * len(chunk))
+            for row in self.connect.execute(f'''WITH q(name) AS (VALUES {values}) SELECT {RESOLVE_COLUMNS} FROM q {RESOLVE_JOINS}''', chunk):
+                resolved[row[0]] = resolvedFromRow(row)
+        return resolved
+
+    '''
+    The legitimate row for a name as a PackageInfo, or None
+    '''
+    def legitimateInfo(self, packageName: str) -> Optional[PackageInfo]:
+        row = self.connect.execute('''SELECT packageName, weeklyDownloads, monthlyDownloads, lastUpdate FROM main.legitimate WHERE packageName = ?''', (packageName,)).fetchone()
+        return PackageInfo(*row) if row else None
+
+    def getTyposquatted(self, packageName: str):
+        return self.connect.execute('''SELECT * FROM typosquatted.typosquatted WHERE packageName = ?''', (packageName,)).fetchone()
+
+    def isInNotCreated(self, packageName: str) -> bool:
+        return self.connect.execute('''SELECT 1 FROM notCreated.notCreated WHERE packageName = ?''', (packageName,)).fetchone() is not None
+
+    '''
+    Number of names already checked (typosquatted + notCreated) and their total length, used to estimate how much memory loading them into a set would take
+    '''
+    def knownNamesSize(self):
+        return self.connect.execute('''
+            SELECT COUNT(*), COALESCE(SUM(LENGTH(packageName)), 0) FROM (
+                SELECT packageName FROM typosquatted.typosquatted UNION ALL SELECT packageName FROM notCreated.notCreated)''').fetchone()
+
+    '''
+    Every name that has already been checked, in either the typosquatted or notCreated database
+    '''
+    def knownNames(self) -> set:
+        known = {row[0] for row in self.connect.execute('''SELECT packageName FROM typosquatted.typosquatted''')}
+        known.update(row[0] for row in self.connect.execute('''SELECT packageName FROM notCreated.notCreated'''))
+        return known
+
+    '''
+    Anti join alternative to knownNames for when the known names are too big to hold in memory, the candidate names are streamed into a temporary table
+    and the positions of the ones in neither database are returned in order
+    The temporary table is emptied rather than dropped, dropping a table fails while another statement (e.g. a seed cursor) is still reading on the connection
+    '''
+    def unknownPositions(self, packageNames: list, chunkSize: int = 50000) -> list:
+        self.connect.execute('''CREATE TEMP TABLE IF NOT EXISTS candidateNames(position INTEGER PRIMARY KEY, packageName TEXT NOT NULL)''')
+        self.connect.execute('''DELETE FROM temp.candidateNames''')
+        for start in range(0, len(packageNames), chunkSize):
+            self.connect.executemany('''INSERT INTO temp.candidateNames (position, packageName) VALUES (?, ?)''',
+                                     ((start + i, name) for i, name in enumerate(packageNames[start:start + chunkSize])))
+        positions = [row[0] for row in self.connect.execute('''
+            SELECT c.position FROM temp.candidateNames c
+            WHERE NOT EXISTS (SELECT 1 FROM typosquatted.typosquatted t WHERE t.packageName = c.packageName)
+            AND NOT EXISTS (SELECT 1 FROM notCreated.notCreated n WHERE n.packageName = c.packageName)
+            ORDER BY c.position''')]
+        self.connect.execute('''DELETE FROM temp.candidateNames''')
+        self.connect.commit()
+        return positions
+
+    '''
+    (legitimate generation, typosquatted generation), each goes up whenever a row of that database is added, updated or removed so anything worked out from
+    the rows (cached verdicts, the skeleton and typosquat indexes) can tell it is out of date
+    '''
+    def generation(self) -> tuple:
+        return readGeneration(self.connect)
+
+    def legitimateNames(self) -> list:
+        return [row[0] for row in self.connect.execute('''SELECT packageName FROM main.legitimate''')]
+
+    def close(self):
+        self.connect.close()
+
+def readGeneration(connect) -> tuple:
+    return tuple(connect.execute(f'''SELECT generation FROM {schema}.storeGeneration''').fetchone()[0] for schema in GENERATION_TABLES)
+
+'''
+Reads the generation over a connection of its own that any thread can use, the store's connection belongs to the thread that opened it
+'''
+class GenerationReader:
+    def __init__(self, databaseDir: str = DATABASE_DIR):
+        self.lock = threading.Lock()
+        self.connect = sqlite3.connect(os.path.join(databaseDir, "legitimate.db"), check_same_thread=False)
+        self.connect.execute("ATTACH DATABASE ? AS typosquatted", (os.path.join(databaseDir, "typosquatted.db"),))
+
+    def generation(self) -> tuple:
+        with self.lock:
+            return readGeneration(self.connect)
+
+    def close(self):
+        with self.lock:
+            self.connect.close()
+
+def dumpProvenance(provenance) -> str:
+    if provenance is None:
+        return None
+    return json.dumps([{"seed": seed, "technique": technique} for seed, technique in provenance])
+
+def loadProvenance(value: str) -> list:
+    if not value:
+        return []
+    return [(entry["seed"], entry["technique"]) for entry in json.loads(value)]
+
+def mergeProvenanceLists(existing: list, extra: list) -> list:
+    merged = list(existing)
+    seen = set(merged)
+    for entry in extra:
+        if entry not in seen:
+            seen.add(entry)
+            merged.append(entry)
+    return merged
+
+'''
+The detectionMethods column keeps every distinct technique joined with "; ", the scoring in nscan only counts the highest scoring technique in it
+'''
+def detectionMethodsFor(provenance: list) -> str:
+    techniques = []
+    for seed, technique in provenance:
+        if technique not in techniques:
+            techniques.append(technique)
+    return "; ".join(techniques)
+
+_store = None
+
+'''
+Shared store for the scripts that only ever need one connection
+'''
+def getStore() -> PackageStore:
+    global _store
+    if _store is None:
+        _store = PackageStore()
+    return _store
+
+def closeStore():
+    global _store
+    if _store is not None:
+        _store.close()
+        _store = None
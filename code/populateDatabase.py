@@ -1,9 +1,10 @@
 import subprocess
 import json
-from databaseSetup import setupDatabase, addPackageToDatabase
-from npmCalls import getBatchWeeklyDownloads, getBatchMonthlyDownloads, getBatchLastUpdate, getWeeklyDownloads, getMonthlyDownloads, getLastUpdate
+from databaseSetup import setupDatabase
+from npmCalls import getBatchWeeklyDownloads, getBatchMonthlyDownloads, getBatchLastUpdate, getWeeklyDownloads, getMonthlyDownloads, fetchLastUpdate, dedupSummary
+from concurrent.futures import ThreadPoolExecutor
+from packageStore import getStore
 import sqlite3
-import time
 
 '''
 File used to populate the legitimate database with packages 
@@ -17,10 +18,13 @@ def isPackageInLegimateDatabase(packageName: str) -> bool:
     connect.close()
     return count > 0
 
+MIN_WEEKLY_DOWNLOADS = 10000 # Downloads a package needs to count as high impact, packages below either are never added and are pruned by removeLowDownloads
+MIN_MONTHLY_DOWNLOADS = 100000
+
 '''
 Removes any heavily depended on packages with low download counts from the database
 '''
-def removeLowDownloads(minWeekly: int = 10000, minMonthly: int = 100000):
+def removeLowDownloads(minWeekly: int = MIN_WEEKLY_DOWNLOADS, minMonthly: int = MIN_MONTHLY_DOWNLOADS):
     connect = sqlite3.connect("database/legitimate.db")
     cursor = connect.cursor()
     cursor.execute('''DELETE FROM legitimate WHERE weeklyDownloads < ? OR monthlyDownloads < ?''', (minWeekly, minMonthly))
@@ -28,18 +32,27 @@ def removeLowDownloads(minWeekly: int = 10000, minMonthly: int = 100000):
     connect.close()
 
 
+SCOPED_CONCURRENCY = 16 # Scoped packages can't be chained in the bulk downloads URL so they are fetched one at a time, this many at once (the shared rate limiter still caps requests per second)
+
 '''
-Batches and populates the legitimate database with the package information from the api calls
+Returns the row to add to the legitimate database if all of the package information was retrieved and it has enough downloads, used for both the batched and the scoped packages
 '''
-def main():
-    setupDatabase()
+def highImpactRow(packageName: str, weeklyDownloads, monthlyDownloads, lastUpdate):
+    if weeklyDownloads and monthlyDownloads and lastUpdate and weeklyDownloads >= MIN_WEEKLY_DOWNLOADS and monthlyDownloads >= MIN_MONTHLY_DOWNLOADS:
+        print(f"Added package: {packageName}")
+        return (packageName, weeklyDownloads, monthlyDownloads, lastUpdate)
+    print(f"Failed to retrieve data for package: {packageName}")
+    return None
 
-    result = subprocess.run(["node", "code/getTopPackages.js"], capture_output=True, text=True)
-    topPackages = json.loads(result.stdout)
-    packagesToAdd = [pkg for pkg in topPackages if not isPackageInLegimateDatabase(pkg)]
-    nonScopedPackages = [pkg for pkg in packagesToAdd if not pkg.startswith('@')]
-    scopedPackages = [pkg for pkg in packagesToAdd if pkg.startswith('@')]
+def upsertRows(rows: list):
+    store = getStore()
+    with store.transaction():
+        store.upsertLegitimate([row for row in rows if row is not None])
 
+'''
+Batches the non scoped packages into 128 package chunks so the download counts can be fetched with the bulk endpoint, each batch is written in one transaction
+'''
+def processNonScopedPackages(nonScopedPackages: list):
     maxPackageSize = 128
 
     for i in range(0, len(nonScopedPackages), maxPackageSize):
@@ -52,34 +65,58 @@ def main():
         monthlyData = getBatchMonthlyDownloads(batchString)
         lastUpdateData = getBatchLastUpdate(batch)
 
+        rows = []
         for packageName in batch:
             weeklyDownloads = weeklyData.get(packageName, {}).get("downloads") if packageName in weeklyData else None
             monthlyDownloads = monthlyData.get(packageName, {}).get("downloads") if packageName in monthlyData else None
             lastUpdate = lastUpdateData.get(packageName)
-            
-            if weeklyDownloads and monthlyDownloads and lastUpdate and weeklyDownloads <= 10000 and monthlyDownloads <= 100000:
-                addPackageToDatabase(packageName, weeklyDownloads, monthlyDownloads, lastUpdate)
-                print(f"Added package: {packageName}")
-            else:
-                print(f"Failed to retrieve data for package: {packageName}")
-    removeLowDownloads() # fallback pruning case for low downloads
+            rows.append(highImpactRow(packageName, weeklyDownloads, monthlyDownloads, lastUpdate))
+        upsertRows(rows)
+
+def fetchScopedPackage(packageName: str):
+    return packageName, getWeeklyDownloads(packageName), getMonthlyDownloads(packageName), fetchLastUpdate(packageName)
 
-    # print(f"Processing {len(scopedPackages)} scoped packages") SCOPED PACKAGES CAUSE RATE LIMITING ISSUES, CANT CHAIN THEM IN URL
-    # for scopedPackageName in scopedPackages:
-    #     print(f"Testing scoped package: {scopedPackageName}")
-    #     weeklyDownload = getWeeklyDownloads(scopedPackageName)
-    #     monthlyDownload = getMonthlyDownloads(scopedPackageName)
-    #     lastUpdate = getLastUpdate(scopedPackageName)
+'''
+Scoped packages have to be fetched individually, instead of doing that one after another they are fetched concurrently under the shared rate limiter
+Results are written in 128 row transactions like the batched packages
+'''
+def processScopedPackages(scopedPackages: list, concurrency: int = SCOPED_CONCURRENCY):
+    if not scopedPackages:
+        return
+    print("-----------------------------------------")
+    print(f"Processing {len(scopedPackages)} scoped packages")
+    print("-----------------------------------------")
+    rows = []
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(scopedPackages)))) as executor:
+        for packageName, weeklyDownloads, monthlyDownloads, lastUpdate in executor.map(fetchScopedPackage, scopedPackages):
+            rows.append(highImpactRow(packageName, weeklyDownloads, monthlyDownloads, lastUpdate))
+            if len(rows) >= 128:
+                upsertRows(rows)
+                rows = []
+    upsertRows(rows)
 
-    #     if weeklyDownload and monthlyDownload and lastUpdate:
-    #         addPackageToDatabase(scopedPackageName, weeklyDownload, monthlyDownload, lastUpdate)
-    #         print(f"Added scoped package: {scopedPackageName}")
-    #     else:
-    #         print(f"Failed to retrieve data for scoped package: {scopedPackageName}")
+def populatePackages(topPackages: list, scopedConcurrency: int = SCOPED_CONCURRENCY):
+    existingPackages = set(getStore().legitimateNames())
+    packagesToAdd = [pkg for pkg in topPackages if pkg not in existingPackages]
+    nonScopedPackages = [pkg for pkg in packagesToAdd if not pkg.startswith('@')]
+    scopedPackages = [pkg for pkg in packagesToAdd if pkg.startswith('@')]
 
-    # print(f"Database population complete for {len(nonScopedPackages)} packages")
+    processNonScopedPackages(nonScopedPackages)
+    processScopedPackages(scopedPackages, scopedConcurrency)
+    print(f"Database population complete for {len(nonScopedPackages)} packages and {len(scopedPackages)} scoped packages")
 
+'''
+Batches and populates the legitimate database with the package information from the api calls
+'''
+def main():
+    setupDatabase()
+
+    result = subprocess.run(["node", "code/getTopPackages.js"], capture_output=True, text=True)
+    topPackages = json.loads(result.stdout)
+    populatePackages(topPackages)
+    removeLowDownloads() # fallback pruning case for low downloads
+    print(dedupSummary())
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,146 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+'''
+Adaptive rate limiter shared by every npm API call
+
+Each host (registry.npmjs.org and api.npmjs.org) gets its own token bucket whose rate is tuned with AIMD:
+every successful response adds a little to the allowed requests per second and a 429 halves it.
+A 429 also blocks the host for the Retry-After time the server asked for, or a jittered exponential backoff if it didn't send one,
+so the sweeps run as close to the allowed throughput as possible without sleeping for fixed intervals.
+'''
+
+'''
+(starting requests per second, maximum requests per second) for each host, anything not listed uses DEFAULT_HOST_LIMITS
+'''
+HOST_LIMITS = {
+    "registry.npmjs.org": (20.0, 100.0),
+    "api.npmjs.org": (5.0, 30.0),
+}
+DEFAULT_HOST_LIMITS = (10.0, 50.0)
+MIN_RATE = 0.5 # Requests per second never drops below this
+ADDITIVE_INCREASE = 0.1 # Requests per second added after every successful response
+MULTIPLICATIVE_DECREASE = 0.5 # Rate is multiplied by this after a 429
+DECREASE_WINDOW = 1.0 # A burst of 429s from requests already in flight only halves the rate once per window
+BACKOFF_BASE = 1.0 # Seconds, doubled for each consecutive 429 from the same host
+BACKOFF_CAP = 60.0
+
+'''
+Exponential backoff with "equal jitter", half the delay is fixed and half is random so concurrent workers don't retry in lockstep
+'''
+def backoffDelay(attempt: int, base: float = BACKOFF_BASE, cap: float = BACKOFF_CAP) -> float:
+    delay = min(cap, base * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+'''
+Retry-After can either be a number of seconds or an HTTP date, returns the number of seconds to wait or None if it can't be read
+'''
+def parseRetryAfter(value: str):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retryAt = parsedate_to_datetime(value)
+        if retryAt.tzinfo is None:
+            retryAt = retryAt.replace(tzinfo=timezone.utc)
+        return max(0.0, (retryAt - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+class HostBucket:
+    def __init__(self, host: str, rate: float, maxRate: float):
+        self.host = host
+        self.rate = rate
+        self.maxRate = maxRate
+        self.tokens = 1.0
+        self.lastRefill = time.monotonic()
+        self.blockedUntil = 0.0
+        self.lastDecrease = 0.0
+        self.consecutiveLimits = 0
+        self.requests = 0
+        self.rateLimited = 0
+        self.lock = threading.Lock()
+
+    def refill(self, now: float):
+        capacity = max(1.0, self.rate)
+        self.tokens = min(capacity, self.tokens + (now - self.lastRefill) * self.rate)
+        self.lastRefill = now
+
+class AdaptiveRateLimiter:
+    def __init__(self, hostLimits: dict = None):
+        self.hostLimits = HOST_LIMITS if hostLimits is None else hostLimits
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def bucketFor(self, url: str) -> HostBucket:
+        host = urlparse(url).netloc
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                rate, maxRate = self.hostLimits.get(host, DEFAULT_HOST_LIMITS)
+                bucket = HostBucket(host, rate, maxRate)
+                self.buckets[host] = bucket
+            return bucket
+
+    '''
+    Blocks until the host for this URL is allowed another request
+    '''
+    def acquire(self, url: str):
+        bucket = self.bucketFor(url)
+        while True:
+            with bucket.lock:
+                now = time.monotonic()
+                wait = bucket.blockedUntil - now
+                if wait <= 0:
+                    bucket.refill(now)
+                    if bucket.tokens >= 1.0:
+                        bucket.tokens -= 1.0
+                        bucket.requests += 1
+                        return
+                    wait = (1.0 - bucket.tokens) / bucket.rate
+            time.sleep(wait)
+
+    def onSuccess(self, url: str):
+        bucket = self.bucketFor(url)
+        with bucket.lock:
+            bucket.consecutiveLimits = 0
+            bucket.rate = min(bucket.maxRate, bucket.rate + ADDITIVE_INCREASE)
+
+    '''
+    Called when the host returns a 429, halves the rate and blocks the host until the Retry-After time (or a jittered backoff)
+    Returns the number of seconds the host is blocked for
+    '''
+    def onRateLimited(self, url: str, retryAfter: str = None) -> float:
+        bucket = self.bucketFor(url)
+        with bucket.lock:
+            now = time.monotonic()
+            bucket.rateLimited += 1
+            if now - bucket.lastDecrease >= DECREASE_WINDOW:
+                bucket.rate = max(MIN_RATE, bucket.rate * MULTIPLICATIVE_DECREASE)
+                bucket.lastDecrease = now
+                bucket.consecutiveLimits += 1
+            delay = parseRetryAfter(retryAfter)
+            if delay is None:
+                delay = backoffDelay(bucket.consecutiveLimits - 1)
+            bucket.blockedUntil = max(bucket.blockedUntil, now + delay)
+            bucket.tokens = 0.0
+            rate = bucket.rate
+        yellowText(f"Rate limited by {bucket.host}, backing off {delay:.1f}s, rate now {rate:.1f} req/s")
+        return delay
+
+    def summary(self) -> str:
+        with self.lock:
+            buckets = list(self.buckets.values())
+        return ", ".join(f"{b.host} {b.rate:.1f} req/s ({b.requests} requests, {b.rateLimited} x 429)" for b in buckets)
+
+rateLimiter = AdaptiveRateLimiter()
+
+def yellowText(text: str):
+    print(f"\033[93m{text}\033[0m")
@@ -1,10 +1,11 @@
+import hashlib
 import json
 import os
 import re
 import subprocess
 import tempfile
 import platform
-from dataclasses import dataclass
+from dataclasses import dataclass, asdict
 from typing import List, Dict
 
 '''
@@ -25,9 +26,11 @@ class ScriptScanner:
     INSTALL_SCRIPTS = {"preinstall", "install", "postinstall"}
 
 
-    def __init__(self, packageName: str):
+    def __init__(self, packageName: str, version: str = None):
         self.rules = self.loadRules()
         self.packageName = packageName
+        self.version = version # Version or range to install (e.g. the one pinned in a lockfile), None installs the latest
+        self.packageSpec = f"{packageName}@{version}" if version else packageName
 
     def loadRules(self):
         """
@@ -97,7 +100,7 @@ class ScriptScanner:
 
         if platform.system() == "Windows":
             subprocess.run(
-                ["npm.cmd", "install", self.packageName, "--ignore-scripts"],
+                ["npm.cmd", "install", self.packageSpec, "--ignore-scripts"],
                 cwd=workdir,
                 stdout=subprocess.DEVNULL,
                 stderr=subprocess.DEVNULL,
@@ -105,7 +108,7 @@ class ScriptScanner:
             )
         else:
             subprocess.run(
-                ["npm", "install", self.packageName, "--ignore-scripts"],
+                ["npm", "install", self.packageSpec, "--ignore-scripts"],
                 cwd=workdir,
                 stdout=subprocess.DEVNULL,
                 stderr=subprocess.DEVNULL,
@@ -147,7 +150,11 @@ class ScriptScanner:
     
         return findings
     
-    def scanPackage(self):
+    '''
+    Installs the package without running its scripts and checks the install hooks against the rules
+    With report=False nothing is printed, so the scan can run on another thread and be reported with printReport once it finishes
+    '''
+    def scanPackage(self, report: bool = True):
         with tempfile.TemporaryDirectory() as tmpdir:
             try:
                 self.installPackage(tmpdir)
@@ -160,31 +167,53 @@ class ScriptScanner:
                             description="Package failed to install without executing scripts",
                             severity=5,
                         )
-                print(f"Installation failed for package {self.packageName}, marking as risky.")
-                return {
+                result = {
                     "package": self.packageName,
+                    "version": self.version,
                     "scriptsFound": [],
                     "findings": [info],
                     "riskScore": 5,
+                    "installFailed": True,
                 }
+                if report:
+                    self.printReport(result)
+                return result
         
         riskScore = sum(f.severity for f in findings)
+        result = {
+            "package": self.packageName,
+            "version": self.version,
+            "scriptsFound": list(scripts.keys()),
+            "findings": findings,
+            "riskScore": riskScore,
+            "installFailed": False,
+        }
+        if report:
+            self.printReport(result)
+        return result
 
-        if riskScore > 0:
-            print(f"Installation Scripts found for package {self.packageName}:")
-            for finding in findings:
+    def printReport(self, result: dict):
+        if result["installFailed"]:
+            print(f"Installation failed for package {self.packageSpec}, marking as risky.")
+        elif result["riskScore"] > 0:
+            print(f"Installation Scripts found for package {self.packageSpec}:")
+            for finding in result["findings"]:
                 print(
                     f"- Script: {finding.scriptName}, pattern: {finding.pattern}, "
                     f"description: {finding.description}, severity: {finding.severity}"
                 )
         else:
-            print(f"No risky installation scripts found for package {self.packageName}.")
-        
-        return {
-            "package": self.packageName,
-            "scriptsFound": list(scripts.keys()),
-            "findings": findings,
-            "riskScore": riskScore,
-        }
+            print(f"No risky installation scripts found for package {self.packageSpec}.")
 
+'''
+Short hash of the rule set in ScriptScanner.loadRules, it changes whenever a rule is added, removed or edited so cached verdicts made with other rules are never reused
+'''
+def rulesVersion() -> str:
+    rules = ScriptScanner("").rules
+    return hashlib.sha256(json.dumps(rules, sort_keys=True).encode()).hexdigest()[:16]
 
+'''
+The findings of a scan as plain dictionaries, ready to be written out as JSON
+'''
+def findingsAsDicts(result: dict) -> list:
+    return [asdict(finding) for finding in result["findings"]]
@@ -0,0 +1,229 @@
+import numpy as np
+from collections import namedtuple
+from typosquatting import KEYBOARD_NEIGHBORS, HOMOGRAPH_MAP
+
+'''
+Batch similarity scoring of package names against the whole legitimate set
+
+Takes thousands of unknown names at once (e.g. a day of the npm changes feed) and returns the nearest legitimate packages for each one,
+with the Levenshtein, Damerau (optimal string alignment), Jaro-Winkler and keyboard weighted distances to each of them.
+Instead of a Python double loop over every (name, legitimate package) pair:
+    The legitimate names are sorted by length so only the slice within maxDistance characters of a name's length is looked at
+    A character bigram inverted index drops every legitimate name that doesn't share enough bigrams with the name to possibly be within maxDistance
+    Character count histograms then drop the ones whose letters differ too much (a substitution changes two counts, an insertion or deletion one and a swap none)
+    The pairs that are left are scored together, one NumPy operation covers a whole row of the dynamic programming table for every pair at once
+'''
+
+DEFAULT_MAX_DISTANCE = 2
+NGRAM_SIZE = 2
+TRANSPOSITION_NGRAMS_LOST = 3 # A single edit (a swap of two adjacent characters at worst) destroys at most 3 of the bigrams in a name
+HISTOGRAM_CHANGE_PER_EDIT = 2 # A single edit (a substitution at worst) changes the character counts of a name by at most 2 in total
+KEYBOARD_COST = 0.5 # Substitution cost for a key next to the intended one in the keyboard weighted distance
+HOMOGRAPH_COST = 0.25 # Substitution cost for a character that looks the same (from HOMOGRAPH_MAP)
+WINKLER_PREFIX = 4
+WINKLER_SCALE = 0.1
+WINKLER_THRESHOLD = 0.7 # The common prefix boost is only applied to pairs already this similar, as in Winkler's original definition
+CHUNK_CELLS = 4_000_000 # Maximum number of (pair, column) cells in one row of the distance tables, keeps a chunk to a few tens of MB
+PADDING = -2 # Code used past the end of shorter legitimate names, never equal to a real character
+
+Neighbour = namedtuple("Neighbour", ["packageName", "levenshtein", "damerau", "jaroWinkler", "keyboard"])
+
+def ngrams(name: str, size: int = NGRAM_SIZE) -> set:
+    return {name[i:i + size] for i in range(len(name) - size + 1)}
+
+'''
+Cheaper substitutions for the keyboard weighted distance, taken from the same tables the typosquat generators use
+'''
+def substitutionCosts() -> dict:
+    costs = {}
+    for letter, neighbours in KEYBOARD_NEIGHBORS.items():
+        for neighbour in neighbours:
+            costs[(letter, neighbour)] = costs[(neighbour, letter)] = KEYBOARD_COST
+    for letter, homographs in HOMOGRAPH_MAP.items():
+        for homograph in homographs:
+            character = homograph.split(" ")[1]
+            if character != letter:
+                costs[(letter, character)] = costs[(character, letter)] = HOMOGRAPH_COST
+    return costs
+
+class SimilarityScorer:
+    def __init__(self, legitimateNames: list, maxDistance: int = DEFAULT_MAX_DISTANCE):
+        self.maxDistance = maxDistance
+        self.names = sorted(set(legitimateNames), key=lambda name: (len(name), name))
+        self.positions = {name: i for i, name in enumerate(self.names)}
+        self.lengths = np.array([len(name) for name in self.names], dtype=np.int32)
+
+        costs = substitutionCosts()
+        alphabet = {character for pair in costs for character in pair}
+        for name in self.names:
+            alphabet.update(name)
+        self.alphabet = {character: i + 1 for i, character in enumerate(sorted(alphabet))} # 0 is kept for characters never seen before
+        self.costMatrix = np.ones((len(self.alphabet) + 1, len(self.alphabet) + 1), dtype=np.float32)
+        for (first, second), cost in costs.items():
+            self.costMatrix[self.alphabet[first], self.alphabet[second]] = cost
+
+        characters = sorted({character for name in self.names for character in name})
+        self.histogramColumns = {character: i for i, character in enumerate(characters)}
+        self.histograms = np.zeros((len(self.names), len(characters)), dtype=np.int16)
+
+        width = int(self.lengths.max()) if self.names else 0
+        self.codes = np.full((len(self.names), width), PADDING, dtype=np.int32)
+        self.ids = np.zeros((len(self.names), width), dtype=np.int32)
+        postings = {}
+        for i, name in enumerate(self.names):
+            self.codes[i, :len(name)] = [ord(character) for character in name]
+            self.ids[i, :len(name)] = [self.alphabet[character] for character in name]
+            for character in name:
+                self.histograms[i, self.histogramColumns[character]] += 1
+            for gram in ngrams(name):
+                postings.setdefault(gram, []).append(i)
+        self.postings = {gram: np.array(indices, dtype=np.int32) for gram, indices in postings.items()}
+
+    '''
+    Indices of the legitimate names that could be within maxDistance of the name, from the length slice, the bigram prefilter and the character histograms
+    '''
+    def candidates(self, name: str) -> np.ndarray:
+        low = np.searchsorted(self.lengths, len(name) - self.maxDistance, side="left")
+        high = np.searchsorted(self.lengths, len(name) + self.maxDistance, side="right")
+        grams = ngrams(name)
+        needed = len(grams) - TRANSPOSITION_NGRAMS_LOST * self.maxDistance
+        if needed <= 0: # Short names can't be filtered on bigrams, everything of a similar length is a candidate
+            indices = np.arange(low, high, dtype=np.int32)
+        else:
+            lists = [self.postings[gram] for gram in grams if gram in self.postings]
+            if not lists:
+                return np.empty(0, dtype=np.int32)
+            shared = np.bincount(np.concatenate(lists), minlength=len(self.names))[low:high]
+            indices = (low + np.nonzero(shared >= needed)[0]).astype(np.int32)
+        own = self.positions.get(name)
+        if own is not None:
+            indices = indices[indices != own]
+
+        histogram = np.zeros(self.histograms.shape[1], dtype=np.int16)
+        unseen = 0 # Characters no legitimate name uses always count as a difference
+        for character in name:
+            column = self.histogramColumns.get(character)
+            if column is None:
+                unseen += 1
+            else:
+                histogram[column] += 1
+        difference = np.abs(self.histograms[indices] - histogram).sum(axis=1) + unseen
+        return indices[difference <= HISTOGRAM_CHANGE_PER_EDIT * self.maxDistance]
+
+    '''
+    Scores every pair of (query, legitimate name) where all the queries are the same length
+    queryCodes and queryIds are (pairs, queryLength) arrays, legitimate is the index of the legitimate name for each pair
+    Returns the Levenshtein, Damerau, keyboard weighted and Jaro-Winkler arrays, one value per pair
+    '''
+    def scorePairs(self, queryCodes: np.ndarray, queryIds: np.ndarray, legitimate: np.ndarray):
+        pairs, queryLength = queryCodes.shape
+        legitimateLengths = self.lengths[legitimate]
+        width = int(legitimateLengths.max())
+        A = queryCodes.T
+        B = self.codes[legitimate, :width].T # (width, pairs) so every row operation below is on contiguous memory
+        Bids = self.ids[legitimate, :width].T
+        columns = np.arange(width + 1, dtype=np.float32)[:, None]
+
+        # Each row of the tables is the distance from the first i characters of the query to every prefix of the legitimate name.
+        # Deletions and substitutions only depend on the previous row, insertions are then applied to the whole row at once with a running minimum
+        levenshtein = np.repeat(columns, pairs, axis=1)
+        damerau = levenshtein.copy()
+        keyboard = levenshtein.copy()
+        twoRowsBack = None
+        previousEqual = None
+        for i in range(1, queryLength + 1):
+            equal = B == A[i - 1]
+            substitution = (~equal).astype(np.float32)
+            weighted = np.where(equal, 0.0, self.costMatrix[queryIds[:, i - 1][None, :], Bids]).astype(np.float32)
+
+            rowLevenshtein = np.minimum(levenshtein[1:] + 1, levenshtein[:-1] + substitution)
+            rowDamerau = np.minimum(damerau[1:] + 1, damerau[:-1] + substitution)
+            rowKeyboard = np.minimum(keyboard[1:] + 1, keyboard[:-1] + weighted)
+            if previousEqual is not None and width > 1:
+                swapped = equal[:-1] & previousEqual[1:] # query[i-1] == name[j-2] and query[i-2] == name[j-1]
+                rowDamerau[1:] = np.where(swapped, np.minimum(rowDamerau[1:], twoRowsBack[:-2] + 1), rowDamerau[1:])
+
+            twoRowsBack = damerau
+            levenshtein = self.withInsertions(rowLevenshtein, i, columns)
+            damerau = self.withInsertions(rowDamerau, i, columns)
+            keyboard = self.withInsertions(rowKeyboard, i, columns)
+            previousEqual = equal
+
+        pairIndex = np.arange(pairs)
+        jaroWinkler = self.jaroWinkler(A, B, legitimateLengths)
+        return levenshtein[legitimateLengths, pairIndex], damerau[legitimateLengths, pairIndex], keyboard[legitimateLengths, pairIndex], jaroWinkler
+
+    @staticmethod
+    def withInsertions(row: np.ndarray, i: int, columns: np.ndarray) -> np.ndarray:
+        full = np.empty((row.shape[0] + 1, row.shape[1]), dtype=np.float32)
+        full[0] = i
+        full[1:] = row
+        return np.minimum.accumulate(full - columns, axis=0) + columns
+
+    '''
+    Jaro-Winkler similarity for every pair, A is (queryLength, pairs) and B is (width, pairs) padded past each legitimate name's length
+    '''
+    @staticmethod
+    def jaroWinkler(A: np.ndarray, B: np.ndarray, legitimateLengths: np.ndarray) -> np.ndarray:
+        queryLength, pairs = A.shape
+        width = B.shape[0]
+        window = np.maximum(np.maximum(queryLength, legitimateLengths) // 2 - 1, 0)[None, :]
+        positions = np.arange(width)[:, None]
+        inName = positions < legitimateLengths[None, :]
+        matchedA = np.zeros((queryLength, pairs), dtype=bool)
+        matchedB = np.zeros((width, pairs), dtype=bool)
+        for i in range(queryLength):
+            available = (B == A[i]) & ~matchedB & inName & (np.abs(positions - i) <= window)
+            found = available.any(axis=0)
+            first = available.argmax(axis=0)
+            matchedA[i] = found
+            matchedB[first[found], np.nonzero(found)[0]] = True
+
+        matches = matchedA.sum(axis=0)
+        # The matched characters of each side in order, compared position by position to count the transpositions
+        orderA = np.take_along_axis(A, np.argsort(~matchedA, axis=0, kind="stable"), axis=0)
+        orderB = np.take_along_axis(B, np.argsort(~matchedB, axis=0, kind="stable"), axis=0)
+        common = min(queryLength, width)
+        rank = np.arange(common)[:, None]
+        transpositions = ((orderA[:common] != orderB[:common]) & (rank < matches[None, :])).sum(axis=0) / 2
+
+        safeMatches = np.maximum(matches, 1)
+        jaro = np.where(matches > 0, (matches / queryLength + matches / legitimateLengths + (matches - transpositions) / safeMatches) / 3, 0.0)
+        prefixLength = min(WINKLER_PREFIX, queryLength, width)
+        prefix = np.cumprod(A[:prefixLength] == B[:prefixLength], axis=0).sum(axis=0)
+        return np.where(jaro > WINKLER_THRESHOLD, jaro + prefix * WINKLER_SCALE * (1 - jaro), jaro).astype(np.float32)
+
+    '''
+    Scores every name against the legitimate set and returns {name: [Neighbour, ...]} with up to topK legitimate packages within maxDistance (Damerau) of it,
+    closest first (by Damerau, then keyboard weighted distance, then highest Jaro-Winkler)
+    '''
+    def score(self, names: list, topK: int = 3) -> dict:
+        results = {}
+        byLength = {}
+        for name in dict.fromkeys(names):
+            results[name] = []
+            if name:
+                byLength.setdefault(len(name), []).append(name)
+
+        for queryLength, group in byLength.items():
+            queryCodes = np.array([[ord(character) for character in name] for name in group], dtype=np.int32)
+            queryIds = np.array([[self.alphabet.get(character, 0) for character in name] for name in group], dtype=np.int32)
+            candidateLists = [self.candidates(name) for name in group]
+            pairQuery = np.repeat(np.arange(len(group)), [len(c) for c in candidateLists])
+            if len(pairQuery) == 0:
+                continue
+            pairLegitimate = np.concatenate(candidateLists)
+
+            chunkSize = max(1, CHUNK_CELLS // (queryLength + self.maxDistance + 1))
+            scores = [self.scorePairs(queryCodes[pairQuery[start:start + chunkSize]], queryIds[pairQuery[start:start + chunkSize]], pairLegitimate[start:start + chunkSize])
+                      for start in range(0, len(pairQuery), chunkSize)]
+            levenshtein, damerau, keyboard, jaroWinkler = (np.concatenate(column) for column in zip(*scores))
+
+            close = damerau <= self.maxDistance
+            order = np.lexsort((-jaroWinkler[close], keyboard[close], damerau[close], pairQuery[close]))
+            indices = np.nonzero(close)[0][order]
+            for index in indices:
+                neighbours = results[group[pairQuery[index]]]
+                if len(neighbours) < topK:
+                    neighbours.append(Neighbour(self.names[pairLegitimate[index]], int(levenshtein[index]), int(damerau[index]), round(float(jaroWinkler[index]), 4), float(keyboard[index])))
+        return results
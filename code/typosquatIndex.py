@@ -0,0 +1,169 @@
+import re
+import Levenshtein
+from packageStore import getStore
+
+'''
+Reverse lookup index for typosquatting, answers "which legitimate packages is this name within edit distance k of?" for any name,
+including squats that were never generated by a sweep and so aren't in typosquatted.db
+
+Uses the symmetric delete approach (as in SymSpell): every string reachable by deleting up to k characters from a legitimate name is stored
+in a dictionary pointing back at that name. Two names within edit distance k always share at least one such delete variant,
+so a lookup only has to generate the query's own delete variants, look each one up, and confirm the few candidates found with a real Levenshtein distance
+'''
+
+DEFAULT_MAX_DISTANCE = 2
+MIN_FUZZY_LENGTH = 4 # Names shorter than this are within distance 2 of far too many short legitimate names, so only exact matches count
+LONG_NAME_LENGTH = 8 # Names at least this long allow the full distance of 2, shorter ones only allow 1 (or a swap of two adjacent characters)
+SEPARATORS = re.compile(r"([-_./])")
+
+'''
+Edit distance allowed for a name of this length, so short names don't match half of the legitimate set
+'''
+def maxDistanceFor(name: str, maxDistance: int) -> int:
+    if len(name) < MIN_FUZZY_LENGTH:
+        return 0
+    if len(name) < LONG_NAME_LENGTH:
+        return min(1, maxDistance)
+    return maxDistance
+
+'''
+Swapping two adjacent characters is a distance of 2 in Levenshtein, but is one of the most common typos so is still let through for short names
+'''
+def isAdjacentSwap(first: str, second: str) -> bool:
+    if len(first) != len(second):
+        return False
+    differences = [i for i in range(len(first)) if first[i] != second[i]]
+    return len(differences) == 2 and differences[1] == differences[0] + 1 and first[differences[0]] == second[differences[1]] and first[differences[1]] == second[differences[0]]
+
+'''
+Every run of consecutive parts of a name split on - _ . and /, apart from the whole name itself
+e.g. "reqeusts-lite-x" gives "reqeusts", "lite", "x", "reqeusts-lite" and "lite-x"
+'''
+def nameSpans(packageName: str) -> list:
+    pieces = SEPARATORS.split(packageName)
+    parts = pieces[0::2]
+    spans = []
+    for start in range(len(parts)):
+        for end in range(start + 1, len(parts) + 1):
+            if start == 0 and end == len(parts):
+                continue
+            span = "".join(pieces[start * 2:end * 2 - 1])
+            if span:
+                spans.append(span)
+    return spans
+
+'''
+Every string made by deleting up to maxDistance characters from the name (including the name itself)
+'''
+def deleteVariants(name: str, maxDistance: int) -> set:
+    variants = {name}
+    frontier = variants
+    for _ in range(maxDistance):
+        frontier = {word[:i] + word[i + 1:] for word in frontier for i in range(len(word))} # each round is one character shorter so never overlaps the earlier rounds
+        variants |= frontier
+    return variants
+
+class TyposquatIndex:
+    '''
+    packages is a list of (packageName, weeklyDownloads), the downloads are used to order matches at the same distance
+    '''
+    def __init__(self, packages: list, maxDistance: int = DEFAULT_MAX_DISTANCE):
+        self.maxDistance = maxDistance
+        self.names = [name for name, _ in packages]
+        self.downloads = [downloads or 0 for _, downloads in packages]
+        self.positions = {name: i for i, name in enumerate(self.names)}
+        self.deletes = {}
+        for i, name in enumerate(self.names):
+            for variant in deleteVariants(name, maxDistance):
+                entry = self.deletes.get(variant)
+                if entry is None:
+                    self.deletes[variant] = i
+                elif isinstance(entry, int): # most variants only point at one package, only use a list when there are several
+                    if entry != i:
+                        self.deletes[variant] = [entry, i]
+                elif i not in entry:
+                    entry.append(i)
+
+    '''
+    Returns [(legitimatePackage, distance), ...] for every legitimate package within maxDistance of the name, closest first and then most downloaded first
+    The name itself is never returned as a match of itself
+    '''
+    def lookup(self, packageName: str, maxDistance: int = None) -> list:
+        maxDistance = self.maxDistance if maxDistance is None else min(maxDistance, self.maxDistance)
+        candidates = set()
+        for variant in deleteVariants(packageName, maxDistance):
+            entry = self.deletes.get(variant)
+            if entry is None:
+                continue
+            if isinstance(entry, int):
+                candidates.add(entry)
+            else:
+                candidates.update(entry)
+
+        matches = []
+        for i in candidates:
+            name = self.names[i]
+            if name == packageName or abs(len(name) - len(packageName)) > maxDistance:
+                continue
+            distance = Levenshtein.distance(packageName, name, score_cutoff=maxDistance)
+            if distance <= maxDistance:
+                matches.append((distance, -self.downloads[i], name))
+        matches.sort()
+        return [(name, distance) for distance, _, name in matches]
+
+    '''
+    lookup with the allowed distance scaled to the length of the name
+    '''
+    def nearby(self, packageName: str) -> list:
+        allowed = maxDistanceFor(packageName, self.maxDistance)
+        if allowed == 0:
+            return []
+        return [(name, distance) for name, distance in self.lookup(packageName) if distance <= allowed or isAdjacentSwap(packageName, name)]
+
+    '''
+    Finds the legitimate packages a name is likely typosquatting, returns [(legitimatePackage, distance, detectionMethods), ...] best match first
+    The whole name is looked up first, if nothing is close the parts of the name are looked up to catch combosquats of a misspelt name like "reqeusts-lite"
+    Parts spelt exactly like a legitimate package are skipped, plugins and add-ons such as "eslint-plugin-x", "@types/x" or "express-session" are named after the package they extend
+    detectionMethods uses the same technique names as the sweep so the typosquatting score in nscan applies to it unchanged
+    '''
+    def detect(self, packageName: str) -> list:
+        if self.isLegitimate(packageName):
+            return []
+        matches = [(name, distance, f"Levenshtein distance - edit distance {distance} (live index)")
+                   for name, distance in self.nearby(packageName)]
+        if matches:
+            return matches
+
+        found = {}
+        for span in nameSpans(packageName):
+            if len(span) < MIN_FUZZY_LENGTH or self.isLegitimate(span): # Parts like "js" or "cli" would match too many short names
+                continue
+            for name, distance in self.nearby(span):
+                if name not in found or distance < found[name]:
+                    found[name] = distance
+        ranked = sorted(found.items(), key=lambda item: (item[1], -self.downloads[self.positions[item[0]]], item[0]))
+        for name, distance in ranked:
+            matches.append((name, distance, f"Combosquatting - contains {name} misspelt; Levenshtein distance - edit distance {distance} (live index)"))
+        return matches
+
+    def isLegitimate(self, packageName: str) -> bool:
+        return packageName in self.positions
+
+    def __len__(self):
+        return len(self.names)
+
+_index = None
+_indexGeneration = None
+
+'''
+Builds the index from the legitimate database the first time it is needed, and again once the legitimate database has changed (see PackageStore.generation)
+'''
+def getTyposquatIndex(maxDistance: int = DEFAULT_MAX_DISTANCE) -> TyposquatIndex:
+    global _index, _indexGeneration
+    store = getStore()
+    generation = store.generation()[0]
+    if _index is None or _index.maxDistance != maxDistance or _indexGeneration != generation:
+        rows = store.connect.execute('''SELECT packageName, weeklyDownloads FROM main.legitimate''').fetchall()
+        _index = TyposquatIndex(rows, maxDistance)
+        _indexGeneration = generation
+    return _index
@@ -1,7 +1,18 @@
 import Levenshtein
+import argparse
+import hashlib
+import math
+import multiprocessing
+import re
 import sqlite3
-from npmCalls import checkPackageExists, checkBulkPackageExists, getBatchWeeklyDownloads, getBatchMonthlyDownloads, getBatchLastUpdate, getWeeklyDownloads, getMonthlyDownloads
-import time 
+import sys
+import time
+from collections import deque, namedtuple
+from itertools import chain, islice
+from npmCalls import checkPackageExists, checkBulkPackageExists, getBatchWeeklyDownloads, getBatchMonthlyDownloads, getBatchLastUpdate, getWeeklyDownloads, getMonthlyDownloads, dedupSummary, isBulkName
+from rateLimiter import backoffDelay
+from packageStore import getStore, detectionMethodsFor, mergeProvenanceLists
+from typosquatIndex import getTyposquatIndex
 
 '''
 File used to generate possible typosquatted package name variations and checks if they exist before adding them to a database
@@ -37,335 +48,826 @@ def createNotCreatedDatabase():
     print("NotCreated database setup complete.")
 
 
-def packageNamesFromDatabase():
+RECHECK_TTL_DAYS = 30 # notCreated names are checked again once they are this old, so squats registered after the sweep are caught
+RECHECK_DAILY_BUDGET = 2000 # Registry requests a day the notCreated recheck may spend, the most important names go first and the rest wait
+RECHECK_SLICES_PER_DAY = 24 # The recheck scheduler wakes this often a day and spends at most this share of the budget each time
+
+'''
+workers above 1 generates the candidates in a pool of processes, see generateCandidatesParallel
+The sweep is checkpointed after every batch: resume carries on from the last checkpoint, fromSeed starts a new sweep at that legitimate package
+and techniques (names from TECHNIQUE_CHECKS) only generates the candidates for those techniques
+incremental only sweeps the legitimate packages no finished sweep has covered yet (new or renamed seeds), then rechecks the notCreated names older than recheckDays
+'''
+def packageNamesFromDatabase(workers: int = 1, resume: bool = False, fromSeed: str = None, techniques: list = None, incremental: bool = False,
+                             recheckDays: float = RECHECK_TTL_DAYS, dailyBudget: int = RECHECK_DAILY_BUDGET):
     createTyposquattingDatabase()
     createNotCreatedDatabase()
-    connect = sqlite3.connect("database/legitimate.db")
-    cursor = connect.cursor()
-    cursor.execute('''SELECT packageName FROM legitimate''')
-    rows = cursor.fetchall()
-    packageNames = [row[0] for row in rows]
+    store = getStore()
+    start = sweepStart(store, resume, fromSeed, techniques, incremental)
+    if start is None:
+        return store.legitimateNames()
+    firstSeedId, skipCandidates, checkpoint, options = start
+
+    if options.get("incremental"):
+        seedCount = store.unsweptSeedCount()
+        blueText(f"Incremental sweep: {seedCount} legitimate packages haven't been swept yet")
+    else:
+        seedCount = store.connect.execute('''SELECT COUNT(*) FROM main.legitimate''').fetchone()[0]
+    from confusables import getSkeletonIndex # Imported here as confusables imports HOMOGRAPH_MAP from this file
+    seeds = seedNames(store, firstSeedId, options.get("incremental", False))
+    if workers > 1:
+        candidates = generateCandidatesParallel(seeds, workers, getSkeletonIndex(), techniques=options["techniques"], skipCandidates=skipCandidates)
+    else:
+        candidates = generateCandidates(seeds, getSkeletonIndex(), options["techniques"], skipCandidates)
+    processBatches(candidates, expectedCandidates=seedCount * AVERAGE_CANDIDATES_PER_SEED, checkpoint=checkpoint, options=options)
+    if not options["techniques"]: # A sweep limited to some techniques hasn't covered its seeds
+        store.recordSweptSeeds(options.get("firstSeedId"))
+    if options.get("incremental"):
+        recheckNotCreated(recheckDays, dailyBudget)
+    return store.legitimateNames()
 
-    possibleTyposquatting = []
-    
-    for package in packageNames:
-        possibleTyposquatting.extend(levenshteinCheck(package))
-        possibleTyposquatting.extend(homographCheck(package))
-        possibleTyposquatting.extend(combosquattingCheck(package))
-        possibleTyposquatting.extend(hyphenUnderscoreCheck(package))
+'''
+Works out where the sweep starts, returns (first seed id, candidates of the first seed to skip, checkpoint to restore or None, sweep options) or None if it can't start
+Resuming starts again at the seed of the last candidate batched before the checkpoint it loads (the one before the last, see PackageStore.saveCheckpoint)
+and skips the candidates up to and including it, anything after it that was already checked is dropped by the known name filter
+'''
+def sweepStart(store, resume: bool, fromSeed: str, techniques: list, incremental: bool = False):
+    options = {"techniques": sorted(techniques) if techniques else None, "incremental": incremental, "firstSeedId": None}
+    if resume:
+        checkpoint = store.loadCheckpoint()
+        if checkpoint is None:
+            yellowText("No sweep checkpoint found, starting a new sweep")
+        else:
+            if techniques and checkpoint["options"]["techniques"] != options["techniques"]:
+                yellowText(f"Resuming with the techniques the sweep was started with: {', '.join(checkpoint['options']['techniques'] or TECHNIQUE_CHECKS)}")
+            blueText(f"Resuming the sweep from {checkpoint['seedName']} (checkpoint from {checkpoint['updatedAt']}, {checkpoint['processedPackages']} packages processed, {len(checkpoint['retryQueue'])} batches to retry)")
+            if checkpoint["seedId"] is None: # No batch was fully checked yet, start where the sweep started
+                return checkpoint["options"].get("firstSeedId"), 0, checkpoint, checkpoint["options"]
+            if store.legitimateId(checkpoint["seedName"]) == checkpoint["seedId"]:
+                return checkpoint["seedId"], checkpoint["candidateOffset"] + 1, checkpoint, checkpoint["options"]
+            return checkpoint["seedId"] + 1, 0, checkpoint, checkpoint["options"] # The seed has since been removed from the legitimate database
+    store.clearCheckpoint()
+    if fromSeed is None:
+        return None, 0, None, options
+    seedId = store.legitimateId(fromSeed)
+    if seedId is None:
+        redText(f"{fromSeed} is not in the legitimate database, can't start the sweep from it")
+        return None
+    options["firstSeedId"] = seedId
+    return seedId, 0, None, options
+
+KNOWN_NAMES_MEMORY_LIMIT = 512 * 1024 * 1024 # Above this the known names are filtered with an anti join in sqlite instead of being loaded into a set
+ANTI_JOIN_CHUNK_SIZE = 10000 # Candidates anti joined in sqlite at a time when the known names don't fit in memory
 
-    processBatches(possibleTyposquatting)
+'''
+Rough size in bytes of a set of count strings with totalChars characters between them (ASCII str header + characters, and the set's hash table slots)
+'''
+def estimateSetBytes(count: int, totalChars: int) -> int:
+    return count * (sys.getsizeof("") + 16 * 2) + totalChars
 
-    connect.close()
-    return packageNames
+'''
+Pipeline stage 1: streams the legitimate package names out of the database in id order, which is the order the sweep checkpoints follow
+unsweptOnly leaves out the seeds a finished sweep has already covered
+The names are read a page at a time so no cursor is left open on the store while the later stages write to it
+'''
+SEED_PAGE_SIZE = 1000
+
+def seedNames(store, firstSeedId: int = None, unsweptOnly: bool = False):
+    query = '''SELECT id, packageName FROM main.legitimate WHERE id >= ?'''
+    if unsweptOnly:
+        query += ''' AND packageName NOT IN (SELECT packageName FROM typosquatted.sweepSeeds)'''
+    query += f''' ORDER BY id LIMIT {SEED_PAGE_SIZE}'''
+    nextId = firstSeedId or 0
+    while True:
+        rows = store.connect.execute(query, (nextId,)).fetchall()
+        for _, packageName in rows:
+            yield packageName
+        if len(rows) < SEED_PAGE_SIZE:
+            return
+        nextId = rows[-1][0] + 1
 
-def addPackageToTyposqauttedDatabase(packageName: str, typoSquattedFrom : str, weeklyDownloads: int, monthlyDownloads: int, lastUpdate: str, detectionMethods: str):
-    connect = sqlite3.connect("database/typosquatted.db")
-    cursor = connect.cursor()
-    cursor.execute('''
-        INSERT OR IGNORE INTO typosquatted (packageName, typosquattedFrom, weeklyDownloads, monthlyDownloads, lastUpdate, detectionMethods)
-        VALUES (?, ?, ?, ?, ?, ?)''', (packageName, typoSquattedFrom, weeklyDownloads, monthlyDownloads, lastUpdate, detectionMethods))
-    connect.commit()
-    connect.close()
+'''
+A generated name after merging, provenance holds every (seed, technique) that produced it
+offset is its position among the candidates of typosquattedFrom, together they are the sweep's cursor when checkpointing
+'''
+Candidate = namedtuple("Candidate", ["packageName", "typosquattedFrom", "detectionMethods", "provenance", "offset"], defaults=(0,))
 
-def addPackageToNotCreatedDatabase(packageName: str):
-    connect = sqlite3.connect("database/notCreated.db")
-    cursor = connect.cursor()
-    cursor.execute('''INSERT OR IGNORE INTO notCreated (packageName) VALUES (?)''', (packageName,))
-    connect.commit()
-    connect.close()
+'''
+npm only accepts URL safe, lowercase names for new packages (so no homoglyphs outside ASCII and none of the homograph map's capitals like O for 0),
+that don't start with . or _ and are at most 214 characters. Candidates failing this can never be published so are never checked
+'''
+NPM_NAME_PATTERN = re.compile(r"^(@[a-z0-9~-][a-z0-9._~-]*/)?[a-z0-9~-][a-z0-9._~-]*$")
+NPM_NAME_MAX_LENGTH = 214
 
-def isPackageInTyposquattedDatabase(packageName: str) -> bool:
-    connect = sqlite3.connect("database/typosquatted.db")
-    cursor = connect.cursor()
-    cursor.execute('''SELECT COUNT(*) FROM typosquatted WHERE packageName = ?''', (packageName,))
-    count = cursor.fetchone()[0]
-    connect.close()
-    return count > 0
+def isPublishableName(packageName: str) -> bool:
+    return len(packageName) <= NPM_NAME_MAX_LENGTH and NPM_NAME_PATTERN.match(packageName) is not None
 
-def isPackageInNotCreatedDatabase(packageName: str) -> bool:
-    connect = sqlite3.connect("database/notCreated.db")
-    cursor = connect.cursor()
-    cursor.execute('''SELECT COUNT(*) FROM notCreated WHERE packageName = ?''', (packageName,))
-    count = cursor.fetchone()[0]
-    connect.close()
-    return count > 0
+'''
+Merges the candidates generated for one seed so a name produced by several techniques (or several times by the same one, e.g. duplicating either of two repeated letters) is emitted once
+Names npm would reject (including every non-ASCII homograph) are dropped here rather than sent to the registry
+If a skeleton index is given, names that look the same as a legitimate package (e.g. "l0dash" from a keyboard neighbour) also get a homograph provenance entry for it
+'''
+def mergeSeedCandidates(seed: str, generated, skeletonIndex=None) -> list:
+    techniquesByName = {}
+    for modifiedName, originalName, technique in generated:
+        existing = techniquesByName.get(modifiedName)
+        if existing is None: # Most names are only generated once, so a single technique is kept as a plain string until a second one turns up
+            techniquesByName[modifiedName] = technique
+        elif type(existing) is str:
+            if existing != technique:
+                techniquesByName[modifiedName] = [existing, technique]
+        elif technique not in existing:
+            existing.append(technique)
+
+    candidates = []
+    for name, techniques in techniquesByName.items():
+        if not isPublishableName(name):
+            continue
+        lookalikes = skeletonIndex.lookup(name) if skeletonIndex is not None else None
+        if type(techniques) is str and not lookalikes:
+            candidates.append(Candidate(name, seed, techniques, [(seed, techniques)], len(candidates)))
+            continue
+        provenance = [(seed, techniques)] if type(techniques) is str else [(seed, technique) for technique in techniques]
+        if lookalikes:
+            provenance.extend((legitimate, f"Homograph attack - same skeleton as {legitimate}") for legitimate in lookalikes)
+        candidates.append(Candidate(name, seed, detectionMethodsFor(provenance), provenance, len(candidates)))
+    return candidates
 
 '''
-After generating a full list of possible typosquatetd names, they are filtered down and then batched into 128 package chunks to be processed faster and less likely to hit rate limits
+Pipeline stage 2: lazily generates the typosquatting candidates for each seed, nothing is held beyond the current seed's candidates
+techniques limits the checks run to those names from TECHNIQUE_CHECKS (they always run in TECHNIQUE_CHECKS order so the candidate offsets don't depend on how they were given)
+skipCandidates drops that many candidates from the first seed, for resuming part way through it
 '''
-def processBatches(generatedList : list):
-    batchSize = 128
-    filteredPackages = [package for package in generatedList if not isPackageInTyposquattedDatabase(package[0]) and not isPackageInNotCreatedDatabase(package[0])]
-    totalPackages = len(filteredPackages)
-    totalBatches = (totalPackages + batchSize - 1) // batchSize
-    print(f"Total packages to check: {totalPackages}")
-    print(f"Total Batches: {totalBatches}")
+def generateCandidates(seeds, skeletonIndex=None, techniques: list = None, skipCandidates: int = 0):
+    checks = [check for technique, check in TECHNIQUE_CHECKS.items() if not techniques or technique in techniques]
+    for package in seeds:
+        candidates = mergeSeedCandidates(package, chain.from_iterable(check(package) for check in checks), skeletonIndex)
+        if skipCandidates:
+            candidates = candidates[skipCandidates:]
+            skipCandidates = 0
+        yield from candidates
+
+SEED_CHUNK_SIZE = 64 # Seeds handed to a worker process at a time
+CHUNKS_IN_FLIGHT_PER_WORKER = 2 # Workers only run this far ahead of the registry checks, so the candidates still stream instead of piling up in memory
+
+_workerSkeletonIndex = None
+_workerTechniques = None
+
+def initGenerationWorker(skeletonIndex, techniques=None):
+    global _workerSkeletonIndex, _workerTechniques
+    _workerSkeletonIndex = skeletonIndex
+    _workerTechniques = techniques
 
-    reservedNames = {"start", "end", "package", "downloads"}
+'''
+Runs in a worker process: generates the candidates for a chunk of seeds and merges the names generated from more than one seed in the chunk,
+so each name is only sent back once per chunk. Names keep the position they were first generated at.
 
-    for i in range(0, totalPackages, batchSize):
-        batchNumber = (i // batchSize) + 1
-        batch = filteredPackages[i:i+batchSize]
-        typosquattedNames = [item[0] for item in batch]
-        results = checkBulkPackageExists(typosquattedNames)
+Pickling a million Candidate tuples each holding a provenance list costs the parent about as much as generating them, so the chunk is sent back packed:
+every seed and technique string is sent once in strings, and each candidate is (packageName, typosquattedFrom, detectionMethods, flat provenance, offset)
+with the strings replaced by their position in strings. unpackCandidateChunk turns it back into Candidates.
+'''
+def generateCandidateChunk(seeds: list, skipCandidates: int = 0):
+    merged = {}
+    for candidate in generateCandidates(seeds, _workerSkeletonIndex, _workerTechniques, skipCandidates):
+        existing = merged.get(candidate.packageName)
+        if existing is None:
+            merged[candidate.packageName] = candidate
+        else:
+            provenance = mergeProvenanceLists(existing.provenance, candidate.provenance)
+            merged[candidate.packageName] = existing._replace(detectionMethods=detectionMethodsFor(provenance), provenance=provenance)
+
+    strings = {}
+    packed = []
+    for candidate in merged.values():
+        provenance = []
+        for seed, technique in candidate.provenance:
+            provenance.append(strings.setdefault(seed, len(strings)))
+            provenance.append(strings.setdefault(technique, len(strings)))
+        packed.append((candidate.packageName, strings.setdefault(candidate.typosquattedFrom, len(strings)),
+                       strings.setdefault(candidate.detectionMethods, len(strings)), tuple(provenance), candidate.offset))
+    return list(strings), packed
+
+def unpackCandidateChunk(chunk) -> list:
+    strings, packed = chunk
+    candidates = []
+    for packageName, typosquattedFrom, detectionMethods, provenance, offset in packed:
+        if len(provenance) == 2:
+            pairs = [(strings[provenance[0]], strings[provenance[1]])]
+        else:
+            pairs = [(strings[provenance[i]], strings[provenance[i + 1]]) for i in range(0, len(provenance), 2)]
+        candidates.append(Candidate(packageName, strings[typosquattedFrom], strings[detectionMethods], pairs, offset))
+    return candidates
 
-        if results == {}:
-            print("Status code not 200, skipping...")
-            continue
+'''
+Pipeline stage 2 across several processes: the seeds are split into chunks of SEED_CHUNK_SIZE that are generated in a process pool
+Results are yielded in seed order whatever order the workers finish in, so a run gives the same candidates in the same order as the single process generateCandidates
+'''
+def generateCandidatesParallel(seeds, workers: int, skeletonIndex=None, chunkSize: int = SEED_CHUNK_SIZE, techniques: list = None, skipCandidates: int = 0):
+    chunks = batched(list(seeds), chunkSize) # The seeds are read up front as the cursor behind them can't be used from the pool's threads
+    pending = deque()
+    with multiprocessing.Pool(workers, initializer=initGenerationWorker, initargs=(skeletonIndex, techniques)) as pool:
+        for chunk in islice(chunks, workers * CHUNKS_IN_FLIGHT_PER_WORKER):
+            pending.append(pool.apply_async(generateCandidateChunk, (chunk, skipCandidates)))
+            skipCandidates = 0 # Only the first seed of the first chunk is resumed part way through
+        while pending:
+            chunk = pending.popleft().get()
+            nextChunk = next(chunks, None)
+            if nextChunk is not None:
+                pending.append(pool.apply_async(generateCandidateChunk, (nextChunk,)))
+            yield from unpackCandidateChunk(chunk)
 
-        existingPackages = [name for name in typosquattedNames if results.get(name)]
+'''
+Fixed size probabilistic set for very large runs, never gives a false negative and gives false positives at roughly errorRate once capacity items have been added
+'''
+class BloomFilter:
+    def __init__(self, capacity: int, errorRate: float = 1e-6):
+        self.size = max(8, int(-capacity * math.log(errorRate) / (math.log(2) ** 2)))
+        self.hashCount = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def positions(self, item: str):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hashCount))
+
+    def add(self, item: str):
+        for position in self.positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(item))
+
+BLOOM_THRESHOLD = 5000000 # Expected candidates above which the global dedup uses a Bloom filter instead of a set of names
+BLOOM_ERROR_RATE = 1e-6
+AVERAGE_CANDIDATES_PER_SEED = 200
+
+'''
+Pipeline stage 3: global dedup, a name generated again from another seed is not checked again but the (seed, technique) it came from is kept
+so it can be merged into the typosquatted row (when the first copy is written, or at the end of the sweep if that has already happened)
+'''
+class CandidateDeduper:
+    def __init__(self, expectedCandidates: int = 0):
+        if expectedCandidates > BLOOM_THRESHOLD:
+            self.seen = BloomFilter(expectedCandidates, BLOOM_ERROR_RATE)
+        else:
+            self.seen = set()
+        self.lateProvenance = {}
+        self.unsettled = set() # Names given late provenance since the last checkpoint
+        self.duplicates = 0
+
+    def dedupe(self, candidates):
+        for candidate in candidates:
+            if candidate.packageName in self.seen:
+                self.duplicates += 1
+                self.lateProvenance.setdefault(candidate.packageName, []).extend(candidate.provenance)
+                self.unsettled.add(candidate.packageName)
+                continue
+            self.seen.add(candidate.packageName)
+            yield candidate
+
+    '''
+    Returns the candidate with any provenance from duplicates seen so far merged in
+    '''
+    def merged(self, candidate: Candidate) -> Candidate:
+        merged = self.withLateProvenance(candidate)
+        self.lateProvenance.pop(candidate.packageName, None)
+        return merged
+
+    '''
+    Keeps the provenance of a candidate that was already checked, so it's merged into its typosquatted row at the next checkpoint
+    Only used on a resumed sweep, where names generated before the checkpoint aren't in seen and so turn up again as known names instead of duplicates
+    '''
+    def known(self, candidate: Candidate):
+        self.duplicates += 1
+        self.lateProvenance.setdefault(candidate.packageName, []).extend(candidate.provenance)
+        self.unsettled.add(candidate.packageName)
+
+    '''
+    merged without using up the late provenance, for saving a candidate that hasn't been checked yet
+    '''
+    def withLateProvenance(self, candidate: Candidate) -> Candidate:
+        extra = self.lateProvenance.get(candidate.packageName)
+        if not extra:
+            return candidate
+        provenance = mergeProvenanceLists(candidate.provenance, extra)
+        return candidate._replace(detectionMethods=detectionMethodsFor(provenance), provenance=provenance)
+
+    '''
+    Writes the late provenance of names that have already been checked into the typosquatted database (without committing, so it goes in the checkpoint's transaction)
+    so a resumed sweep doesn't lose it. Names not checked yet keep theirs until they are
+    '''
+    def settleLateProvenance(self, store):
+        typosquattedNames, notCreatedNames = store.checkedNames([name for name in self.unsettled if name in self.lateProvenance])
+        self.unsettled = set()
+        store.applyProvenance({name: self.lateProvenance.pop(name) for name in typosquattedNames})
+        for name in notCreatedNames:
+            del self.lateProvenance[name]
+
+'''
+Pipeline stage 4: removes candidates that are already in the typosquatted or notCreated databases
+The known names are loaded once into a set, if that set would go over KNOWN_NAMES_MEMORY_LIMIT the candidates are anti joined against the databases in sqlite a chunk at a time instead
+onKnown is called with every candidate that is dropped
+'''
+def filterKnownCandidates(store, candidates, report: dict, onKnown=None):
+    start = time.perf_counter()
+    count, totalChars = store.knownNamesSize()
+    estimate = estimateSetBytes(count, totalChars)
+    if estimate <= KNOWN_NAMES_MEMORY_LIMIT:
+        known = store.knownNames()
+        memoryUsed = sys.getsizeof(known) + sum(sys.getsizeof(name) for name in known)
+        blueText(f"Loaded {count} known names in {time.perf_counter() - start:.2f}s (known name set: {memoryUsed / (1024 * 1024):.1f} MB)")
+        for candidate in candidates:
+            if candidate[0] in known:
+                report["known"] += 1
+                if onKnown is not None:
+                    onKnown(candidate)
+            else:
+                yield candidate
+    else:
+        blueText(f"{count} known names would need ~{estimate / (1024 * 1024):.0f} MB as a set, anti joining in sqlite instead")
+        for chunk in batched(candidates, ANTI_JOIN_CHUNK_SIZE):
+            positions = store.unknownPositions([candidate[0] for candidate in chunk])
+            report["known"] += len(chunk) - len(positions)
+            if onKnown is not None:
+                unknown = set(positions)
+                for position, candidate in enumerate(chunk):
+                    if position not in unknown:
+                        onKnown(candidate)
+            for position in positions:
+                yield chunk[position]
+
+'''
+Pipeline stage 5: groups the candidates into lists of batchSize for the bulk API calls
+'''
+def batched(iterable, batchSize: int):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == batchSize:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+MAX_BATCH_ATTEMPTS = 3 # A failed batch is retried this many times before it is split in half
 
-        weeklyData = {}
-        monthlyData = {}
-        lastUpdateData = {}
-        typosquattedCount = 0
-        notCreatedCount = 0
+'''
+Puts a batch that failed the bulk existence check back on the retry queue, after MAX_BATCH_ATTEMPTS failures it is split in half (recursively, as the halves go through the same queue and split again on their next failure)
+so a single name that breaks the bulk request (reserved words, odd unicode, over long URLs) only costs itself. A single name that keeps failing is recorded as permanently failed
+'''
+def requeueFailedBatch(retryQueue: deque, batch: list, attempts: int, report: dict):
+    attempts += 1
+    if attempts < MAX_BATCH_ATTEMPTS:
+        report["retries"] += 1
+        yellowText(f"Bulk check failed for a batch of {len(batch)}, retrying later (attempt {attempts + 1}/{MAX_BATCH_ATTEMPTS})")
+        retryQueue.append((batch, attempts))
+    elif len(batch) > 1:
+        report["splits"] += 1
+        middle = len(batch) // 2
+        yellowText(f"Bulk check failed {attempts} times for a batch of {len(batch)}, splitting into {middle} and {len(batch) - middle}")
+        for half in (batch[:middle], batch[middle:]):
+            retryQueue.append((half, 0 if len(half) == 1 else MAX_BATCH_ATTEMPTS - 1)) # halves are split again on their first failure, single names get the full retries
+    else:
+        redText(f"Giving up on {batch[0][0]} after {attempts} failed checks")
+        report["failed"].append(batch[0][0])
+        return # Nothing was requeued so there is nothing to back off for
+    time.sleep(backoffDelay(attempts - 1))
 
-        if existingPackages:
-            batchable = [name for name in existingPackages if name not in reservedNames]
+'''
+Pipeline stage 6: checks which names in the batch exist, existing ones get their information fetched and are added to the typosquatted database and the rest to the notCreated database
+Returns the number of (typosquatted, notCreated) names added, or None if the bulk existence check failed
+onCommit is called inside the transaction that writes the results, so the sweep checkpoint is only saved along with them
+'''
+def checkBatch(store, batch: list, deduper: CandidateDeduper, onCommit=None):
+    typosquattedNames = [item[0] for item in batch]
+    bulkNames = [name for name in typosquattedNames if isBulkName(name)]
+    results = checkBulkPackageExists(bulkNames) if bulkNames else {}
+
+    if bulkNames and results == {}:
+        return None
+    for packageName in typosquattedNames:
+        if not isBulkName(packageName): # Scoped candidates (from scoped seeds) and reserved names would fail the whole bulk request, so each is checked on its own
+            single = checkBulkPackageExists([packageName])
+            if single == {}:
+                return None
+            results.update(single)
+
+    existingPackages = [name for name in typosquattedNames if results.get(name)]
+
+    weeklyData = {}
+    monthlyData = {}
+    lastUpdateData = {}
+    typosquattedRows = []
+    notCreatedRows = []
+
+    if existingPackages:
+        batchable = [name for name in existingPackages if isBulkName(name)]
+        if batchable:
             batchString = ",".join(batchable)
             weeklyData = getBatchWeeklyDownloads(batchString)
             monthlyData = getBatchMonthlyDownloads(batchString)
+    
+        for single in existingPackages:
+            if not isBulkName(single):
+                singleWeeklyDownloads = getWeeklyDownloads(single)
+                singleMonthlyDownloads = getMonthlyDownloads(single)
+                if isinstance(singleWeeklyDownloads, int) and isinstance(singleMonthlyDownloads, int):
+                    weeklyData[single] = {"downloads": singleWeeklyDownloads}
+                    monthlyData[single] = {"downloads": singleMonthlyDownloads}
         
-            for reserved in existingPackages:
-                if reserved in reservedNames:
-                    reservedWeeklyDownloads = getWeeklyDownloads(reserved)
-                    reservedMonthlyDownloads = getMonthlyDownloads(reserved)
-                    if isinstance(reservedWeeklyDownloads, int) and isinstance(reservedMonthlyDownloads, int):
-                        weeklyData[reserved] = {"downloads": reservedWeeklyDownloads}
-                        monthlyData[reserved] = {"downloads": reservedMonthlyDownloads}
-            
-            lastUpdateData = getBatchLastUpdate(existingPackages)
-
-        for modifiedName, originalName, message in batch:
-            if results.get(modifiedName, False):
-                weeklyPayload = weeklyData.get(modifiedName)
-                monthlyPayload = monthlyData.get(modifiedName)
-                weeklyDownloads = weeklyPayload.get("downloads") if isinstance(weeklyPayload, dict) else None
-                monthlyDownloads = monthlyPayload.get("downloads") if isinstance(monthlyPayload, dict) else None
-                lastUpdate = lastUpdateData.get(modifiedName)
-
-                # if weeklyDownloads is None: # Specific hardcoding if the download data is missing - Hashed this out due to bringing up rate liiting issues too quickly
-                #     print(f"Weekly downloads missing for {modifiedName}, fetching specifically...")
-                #     specificWeeklyDownloads = getWeeklyDownloads(modifiedName)
-                #     if isinstance(specificWeeklyDownloads, int):
-                #         weeklyDownloads = specificWeeklyDownloads
-                # if monthlyDownloads is None:
-                #     print(f"Monthly downloads missing for {modifiedName}, fetching specifically...")
-                #     specificMonthlyDownloads = getMonthlyDownloads(modifiedName)
-                #     if isinstance(specificMonthlyDownloads, int):
-                #         monthlyDownloads = specificMonthlyDownloads
-
-                if weeklyDownloads is None or monthlyDownloads is None or lastUpdate is None:
-                    yellowText(f"Package missing is {modifiedName}")
-                    yellowText(f"Weekly payload: {weeklyPayload}, Monthly payload: {monthlyPayload}, Last update data: {lastUpdateData}")
-                    continue
-                addPackageToTyposqauttedDatabase(modifiedName, originalName, weeklyDownloads, monthlyDownloads, lastUpdate, message)
-                typosquattedCount += 1
-                redText(f"Added {modifiedName} to typosquatted database, detected via {message}")
-            else:
-                addPackageToNotCreatedDatabase(modifiedName)
-                notCreatedCount += 1
-        
-        processedPackages = min(i + len(batch), totalPackages)
-
-        print("-----------------------------------------")
-        greenText(f"Not created added: {notCreatedCount}")
-        redText(f"Typosquatted added: {typosquattedCount}")
-        blueText(f"Batch {batchNumber}/{totalBatches} processed.")
-        blueText(f"Packages {processedPackages}/{totalPackages} processed.")
-        print("-----------------------------------------")
-
-        time.sleep(1)
-
-# def placeholder(modifiedName : str, packageName : str, message : str):
-#     if not isPackageInTyposquattedDatabase(modifiedName) and not isPackageInNotCreatedDatabase(modifiedName):
-#         print(f"Checking {modifiedName}...")
-#         call = checkPackageExists(modifiedName)
-#         if call is not False:
-#             weeklyDownloads, monthlyDownloads, lastUpdate = call
-#             addPackageToTyposqauttedDatabase(modifiedName, packageName, weeklyDownloads, monthlyDownloads, lastUpdate, message)
-#             redText(f"Added {modifiedName} to typosquatted database, detected via {message}")
-#         else:
-#             addPackageToNotCreatedDatabase(modifiedName)
-#     else:
-#         greenText(f"{modifiedName} already in a database, skipping check.")
+        lastUpdateData = getBatchLastUpdate(existingPackages)
+
+    for candidate in batch:
+        modifiedName = candidate.packageName
+        if results.get(modifiedName, False):
+            weeklyPayload = weeklyData.get(modifiedName)
+            monthlyPayload = monthlyData.get(modifiedName)
+            weeklyDownloads = weeklyPayload.get("downloads") if isinstance(weeklyPayload, dict) else None
+            monthlyDownloads = monthlyPayload.get("downloads") if isinstance(monthlyPayload, dict) else None
+            lastUpdate = lastUpdateData.get(modifiedName)
+
+            if weeklyDownloads is None or monthlyDownloads is None or lastUpdate is None:
+                yellowText(f"Package missing is {modifiedName}")
+                yellowText(f"Weekly payload: {weeklyPayload}, Monthly payload: {monthlyPayload}, Last update data: {lastUpdateData}")
+                continue
+            candidate = deduper.merged(candidate)
+            typosquattedRows.append((modifiedName, candidate.typosquattedFrom, weeklyDownloads, monthlyDownloads, lastUpdate, candidate.detectionMethods, candidate.provenance))
+            redText(f"Added {modifiedName} to typosquatted database, detected via {candidate.detectionMethods}")
+        else:
+            notCreatedRows.append((modifiedName, candidate.typosquattedFrom, candidate.detectionMethods, candidate.provenance))
+
+    with store.transaction():
+        store.addTyposquatted(typosquattedRows)
+        store.removeNotCreated([row[0] for row in typosquattedRows]) # Only there when a notCreated name is being rechecked
+        store.addNotCreated(notCreatedRows)
+        if onCommit is not None:
+            onCommit()
+    return len(typosquattedRows), len(notCreatedRows)
+
+'''
+The retry queue as saved in the sweep checkpoint, each batch is {"attempts", "candidates": [[packageName, typosquattedFrom, detectionMethods, provenance, offset], ...]}
+Late provenance for names that haven't been checked yet is saved with them as it isn't in the database
+'''
+def dumpRetryQueue(entries, deduper: CandidateDeduper) -> list:
+    return [{"attempts": attempts, "candidates": [list(deduper.withLateProvenance(candidate)) for candidate in batch]} for batch, attempts in entries]
+
+def loadRetryQueue(entries: list) -> deque:
+    return deque(([Candidate(name, typosquattedFrom, detectionMethods, [tuple(pair) for pair in provenance], offset)
+                   for name, typosquattedFrom, detectionMethods, provenance, offset in entry["candidates"]], entry["attempts"]) for entry in entries)
+
+'''
+Turns a stale notCreated row back into a Candidate, names stored before notCreated kept their seed are attributed with the live typosquatting index
+'''
+def notCreatedCandidate(row) -> Candidate:
+    packageName, typosquattedFrom, detectionMethods, provenance = row
+    if typosquattedFrom is None:
+        matches = getTyposquatIndex().detect(packageName)
+        if matches:
+            typosquattedFrom, _, detectionMethods = matches[0]
+        else:
+            typosquattedFrom, detectionMethods = "unknown", "Unknown - checked before notCreated kept the seed"
+        provenance = [(typosquattedFrom, detectionMethods)]
+    return Candidate(packageName, typosquattedFrom, detectionMethods, provenance or [(typosquattedFrom, detectionMethods)])
+
+'''
+Checks the notCreated names older than ttlDays again, highest recheckPriority first, names that have since been registered move to the typosquatted database
+and the rest get a new checkedAt. Stops once dailyBudget registry requests have been spent today (UTC), or maxRequests in this call
+Batches that fail are left as they are and come up again on the next run. Returns the number of requests spent
+'''
+def recheckNotCreated(ttlDays: float = RECHECK_TTL_DAYS, dailyBudget: int = RECHECK_DAILY_BUDGET, maxRequests: int = None, batchSize: int = 128) -> int:
+    store = getStore()
+    day = time.strftime("%Y-%m-%d", time.gmtime())
+    allowance = dailyBudget - store.recheckRequestsUsed(day)
+    if maxRequests is not None:
+        allowance = min(allowance, maxRequests)
+    print("-----------------------------------------")
+    if allowance <= 0:
+        yellowText(f"Today's recheck budget of {dailyBudget} requests has been spent")
+        return 0
+    candidates = [notCreatedCandidate(row) for row in store.staleNotCreated(ttlDays, allowance * batchSize, recheckPriority)]
+    blueText(f"Rechecking up to {len(candidates)} notCreated names last checked over {ttlDays:g} days ago, {allowance} requests allowed")
+    deduper = CandidateDeduper()
+    registered = 0
+    rechecked = 0
+    failed = 0
+    spent = 0
+    for batch in batched(candidates, batchSize):
+        if spent >= allowance:
+            break
+        counts = checkBatch(store, batch, deduper)
+        requests = 1 # The bulk existence check, names found also cost the two bulk download lookups and one packument each
+        if counts is None:
+            failed += len(batch)
+        else:
+            rechecked += len(batch)
+            registered += counts[0]
+            if counts[0]:
+                requests += 2 + counts[0]
+        spent += requests
+        with store.transaction():
+            store.addRecheckRequests(day, requests)
+    blueText(f"Rechecked {rechecked} names with {spent} requests, {dailyBudget - store.recheckRequestsUsed(day)} left today")
+    if registered:
+        redText(f"{registered} names that didn't exist before have since been registered and were added to the typosquatted database")
+    else:
+        greenText("None of the rechecked names have been registered since.")
+    if failed:
+        yellowText(f"{failed} names couldn't be rechecked and will be tried again on the next run")
+    return spent
+
+'''
+Background recheck of notCreated, wakes RECHECK_SLICES_PER_DAY times a day and spends that share of the daily budget so the requests are spread over the day
+'''
+def recheckScheduler(ttlDays: float = RECHECK_TTL_DAYS, dailyBudget: int = RECHECK_DAILY_BUDGET):
+    createNotCreatedDatabase()
+    while True:
+        recheckNotCreated(ttlDays, dailyBudget, maxRequests=math.ceil(dailyBudget / RECHECK_SLICES_PER_DAY))
+        time.sleep(24 * 60 * 60 / RECHECK_SLICES_PER_DAY)
+
+def peakMemoryMB():
+    try:
+        import resource
+    except ImportError: # not available on Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+'''
+Streams the candidates through dedup -> known name filter -> 128 package batches -> network checks, so the first batch is checked as soon as it is generated
+and memory doesn't grow with the total number of candidates. Batches that fail go onto a retry queue (one retry is taken after every new batch and the rest once
+the candidates run out) rather than being skipped so the sweep finishes with every name checked
+
+Every successful batch saves a checkpoint in the same transaction as its results: the cursor (seed and offset of the last candidate taken from the stream),
+the batch counters and every batch still waiting to be checked. checkpoint is a loaded checkpoint to carry on from, options are saved with it
+Returns the report of batch retries, splits, names that could never be checked (failed) and names skipped as already known
+'''
+def processBatches(candidates, batchSize: int = 128, expectedCandidates: int = 0, checkpoint: dict = None, options: dict = None):
+    store = getStore()
+    report = {"retries": 0, "splits": 0, "failed": [], "known": 0}
+    deduper = CandidateDeduper(expectedCandidates)
+    options = options or {"techniques": None}
+    retryQueue = deque()
+    batchNumber = 0
+    processedPackages = 0
+    cursor = (None, None, 0)
+    if checkpoint is not None:
+        retryQueue = loadRetryQueue(checkpoint["retryQueue"])
+        batchNumber = checkpoint["batchNumber"]
+        processedPackages = checkpoint["processedPackages"]
+        cursor = (checkpoint["seedName"], checkpoint["seedId"], checkpoint["candidateOffset"])
+        for batch, _ in retryQueue: # So they aren't checked a second time if a later seed generates them
+            for candidate in batch:
+                deduper.seen.add(candidate.packageName)
+    batches = batched(filterKnownCandidates(store, deduper.dedupe(candidates), report, deduper.known if checkpoint is not None else None), batchSize)
+
+    def saveCheckpoint(batchNumber: int, processedPackages: int, waiting: list):
+        deduper.settleLateProvenance(store)
+        store.saveCheckpoint(cursor[0], cursor[1], cursor[2], batchNumber, processedPackages, dumpRetryQueue(waiting, deduper), options)
+
+    while True:
+        nextBatch = next(batches, None)
+        if nextBatch is not None:
+            last = nextBatch[-1]
+            cursor = (last.typosquattedFrom, store.legitimateId(last.typosquattedFrom), last.offset)
+            work = [(nextBatch, 0)]
+            if retryQueue:
+                work.append(retryQueue.popleft())
+        elif retryQueue:
+            work = [retryQueue.popleft()]
+        else:
+            break
+
+        for position, (batch, attempts) in enumerate(work):
+            waiting = work[position + 1:] + list(retryQueue)
+            counts = checkBatch(store, batch, deduper, lambda: saveCheckpoint(batchNumber + 1, processedPackages + len(batch), waiting))
+            if counts is None:
+                requeueFailedBatch(retryQueue, batch, attempts, report)
+                continue
+            typosquattedCount, notCreatedCount = counts
+            batchNumber += 1
+            processedPackages += len(batch)
+
+            print("-----------------------------------------")
+            greenText(f"Not created added: {notCreatedCount}")
+            redText(f"Typosquatted added: {typosquattedCount}")
+            blueText(f"Batch {batchNumber} processed, {len(retryQueue)} batches waiting to be retried.")
+            blueText(f"Packages {processedPackages} processed.")
+            print("-----------------------------------------")
+
+    print("-----------------------------------------")
+    mergedRows = store.mergeProvenance(deduper.lateProvenance)
+    store.clearCheckpoint() # The sweep is finished, the next one starts from the beginning
+    blueText(f"Packages checked: {processedPackages}, duplicates skipped: {deduper.duplicates}, already in a database: {report['known']}")
+    blueText(f"Typosquatted rows given extra provenance from duplicates: {mergedRows}")
+    blueText(f"Batch retries: {report['retries']}, batch splits: {report['splits']}")
+    if report["failed"]:
+        redText(f"{len(report['failed'])} names could not be checked: {', '.join(report['failed'])}")
+    else:
+        greenText("Every name was checked.")
+    peak = peakMemoryMB()
+    if peak is not None:
+        blueText(f"Peak memory: {peak:.1f} MB")
+    blueText(dedupSummary())
+    return report
+
+KEYBOARD_NEIGHBORS = {
+    "q": ["w", "a", "s", "1", "2"], 
+    "w": ["1", "2", "3", "q", "e", "a", "s", "d"],
+    "e": ["2", "3", "4", "w", "r", "s", "d", "f"], 
+    "r": ["3", "4", "5", "e", "t", "d", "f", "g"],
+    "t": ["4", "5", "6", "r", "y", "f", "g", "h"], 
+    "y": ["5", "6", "7", "t", "u", "g", "h", "j"], 
+    "u": ["6", "7", "8", "y", "i", "h", "j", "k"], 
+    "i": ["7", "8", "9", "u", "o", "j", "k", "l"],
+    "o": ["8", "9", "0", "i", "p", "k", "l", ";"], 
+    "p": ["o", "l", ";", "'"],
+
+    "a": ["q", "w", "s", "z"], 
+    "s": ["w", "e", "a", "d", "z", "x"], 
+    "d": ["e", "r", "s", "f", "x", "c"],
+    "f": ["r", "t", "d", "g", "c", "v"],
+    "g": ["t", "y", "f", "h", "v", "b"], 
+    "h": ["y", "u", "g", "j", "b", "n"],
+    "j": ["u", "i", "h", "k", "n", "m"], 
+    "k": ["i", "o", "j", "l", "m"], 
+    "l": ["o", "p", "k"],
+
+    "z": ["a", "s", "x"], 
+    "x": ["z", "s", "d", "c"], 
+    "c": ["x", "d", "f", "v"], 
+    "v": ["c", "f", "g", "b"],
+    "b": ["v", "g", "h", "n"], 
+    "n": ["b", "h", "j", "m"], 
+    "m": ["n", "j", "k"],
+
+    "1": ["2", "q"], 
+    "2": ["1", "3", "w"], 
+    "3": ["2", "4", "e"], 
+    "4": ["3", "5", "r"], 
+    "5": ["4", "6", "t"],
+    "6": ["5", "7", "y"],
+    "7": ["6", "8", "u"], 
+    "8": ["7", "9", "i"], 
+    "9": ["8", "0", "o"], 
+    "0": ["9", "-", "p"],
+    "-": ["0", "=", "p"]
+}
+
+'''
+Every check returns a list of (packageName, typosquattedFrom, technique) tuples, technique is the detection method message the name is stored with.
+Plain tuples built in one list comprehension are used rather than a record class as they are several times cheaper to create, and a full sweep creates over a million of them
+'''
+ADDED_S = "Levenshtein distance - added 's'"
+DUPLICATED_CHARACTER = "Levenshtein distance - duplicated character"
+REMOVED_CHARACTER = "Levenshtein distance - Remove character"
+SWAPPED_CHARACTERS = "Levenshtein distance - Swap adjacent characters"
+KEYBOARD_PROXIMITY = "Levenshtein distance - Keyboard Proximity"
+ADDED_PREFIX = "Combosquatting - added prefix"
+ADDED_SUFFIX = "Combosquatting - added suffix"
+HYPHEN_UNDERSCORE = "Hyphen/underscore manipulation"
 
 # Check 1: Levenstein distance 
 def levenshteinCheck(packageName: str):
-    generated = []
-
-    KEYBOARD_NEIGHBORS = {
-        "q": ["w", "a", "s", "1", "2"], 
-        "w": ["1", "2", "3", "q", "e", "a", "s", "d"],
-        "e": ["2", "3", "4", "w", "r", "s", "d", "f"], 
-        "r": ["3", "4", "5", "e", "t", "d", "f", "g"],
-        "t": ["4", "5", "6", "r", "y", "f", "g", "h"], 
-        "y": ["5", "6", "7", "t", "u", "g", "h", "j"], 
-        "u": ["6", "7", "8", "y", "i", "h", "j", "k"], 
-        "i": ["7", "8", "9", "u", "o", "j", "k", "l"],
-        "o": ["8", "9", "0", "i", "p", "k", "l", ";"], 
-        "p": ["o", "l", ";", "'"],
-
-        "a": ["q", "w", "s", "z"], 
-        "s": ["w", "e", "a", "d", "z", "x"], 
-        "d": ["e", "r", "s", "f", "x", "c"],
-        "f": ["r", "t", "d", "g", "c", "v"],
-        "g": ["t", "y", "f", "h", "v", "b"], 
-        "h": ["y", "u", "g", "j", "b", "n"],
-        "j": ["u", "i", "h", "k", "n", "m"], 
-        "k": ["i", "o", "j", "l", "m"], 
-        "l": ["o", "p", "k"],
-
-        "z": ["a", "s", "x"], 
-        "x": ["z", "s", "d", "c"], 
-        "c": ["x", "d", "f", "v"], 
-        "v": ["c", "f", "g", "b"],
-        "b": ["v", "g", "h", "n"], 
-        "n": ["b", "h", "j", "m"], 
-        "m": ["n", "j", "k"],
-
-        "1": ["2", "q"], 
-        "2": ["1", "3", "w"], 
-        "3": ["2", "4", "e"], 
-        "4": ["3", "5", "r"], 
-        "5": ["4", "6", "t"],
-        "6": ["5", "7", "y"],
-        "7": ["6", "8", "u"], 
-        "8": ["7", "9", "i"], 
-        "9": ["8", "0", "o"], 
-        "0": ["9", "-", "p"],
-        "-": ["0", "=", "p"]
-    }
-
-
-    generated.append((packageName + "s", packageName, "Levenshtein distance - added 's'")) # Add an 's' at the end of the package name
-
-    for i in range(len(packageName)):
-        modifiedName = packageName[:i] + packageName[i] + packageName[i:]
-        generated.append((modifiedName, packageName, "Levenshtein distance - duplicated character")) # Duplicate each character one by one
-
-    for i in range(len(packageName)):
-        modifiedName = packageName[:i] + packageName[i+1:]
-        generated.append((modifiedName, packageName, f"Levenshtein distance - Remove character")) # Remove each character one by one
-    
-    for i in range(len(packageName) - 1):
-        if packageName[i] == packageName[i+1]:
-            continue
-        modifiedName = packageName[:i] + packageName[i+1] + packageName[i] + packageName[i+2:]
-        generated.append((modifiedName, packageName, f"Levenshtein distance - Swap adjacent characters")) # Swap adjacent characters
+    generated = [(packageName + "s", packageName, ADDED_S)] # Add an 's' at the end of the package name
+    positions = range(len(packageName))
+    generated += [(packageName[:i] + packageName[i] + packageName[i:], packageName, DUPLICATED_CHARACTER) for i in positions] # Duplicate each character one by one
+    generated += [(packageName[:i] + packageName[i+1:], packageName, REMOVED_CHARACTER) for i in positions] # Remove each character one by one
+    generated += [(packageName[:i] + packageName[i+1] + packageName[i] + packageName[i+2:], packageName, SWAPPED_CHARACTERS)
+                  for i in range(len(packageName) - 1) if packageName[i] != packageName[i+1]] # Swap adjacent characters
+    generated += [(packageName[:i] + neighbour + packageName[i+1:], packageName, KEYBOARD_PROXIMITY)
+                  for i in positions for neighbour in KEYBOARD_NEIGHBORS.get(packageName[i], ()) if neighbour != packageName[i]] # Replace with keyboard neighbor
+    return generated
 
-    for i, char in enumerate(packageName):
-        neighbours = KEYBOARD_NEIGHBORS.get(char, [])
-        for neighbour in neighbours:
-            modifiedName = packageName[:i] + neighbour + packageName[i+1:]
-            if modifiedName != packageName:
-                generated.append((modifiedName, packageName, f"Levenshtein distance - Keyboard Proximity")) # Replace with keyboard neighbor
+HOMOGRAPH_MAP = {
+    "a": ["а \u0430", "ɑ \u0251", "à \u00E0", "á \u00E1", "â \u00E2", "ä \u00E4", "ã \u00E3"],
+    "b": ["Ь \u042C", "Ƅ \u0184", "ƅ \u0185", "Ь \u044C"],
+
+    "c": ["ϲ \u03F2", "с \u0441", "ƈ \u0188"],
+    "d": ["ԁ \u0501", "ɗ \u0257"],
+
+    "e": ["е \u0435", "є \u0454", "℮ \u212E", "é \u00E9", "ê \u00EA", "ë \u00EB"],
+    "f": ["ғ \u0493", "ƒ \u0192"],
+
+    "g": ["ɡ \u0261", "ġ \u0121", "ğ \u011F"],
+    "h": ["һ \u04BB", "հ \u0570"],
+
+    "i": ["ӏ \u04CF", "ı \u0131", "İ \u0130", "¡ \u00A1", "l \u006C", "1 \u0031"],
+    "j": ["ј \u0458"],
+    "k": ["κ \u03BA", "к \u043A"],
+    "l": ["Ɩ \u0196", "ӏ \u04CF", "ⅼ \u217C", "Ι \u0399"],
+
+    "m": ["м \u043C"],
+    "n": ["ո \u0576", "п \u043F"],
+
+    "o": ["ο \u03BF", "о \u043E", "ɵ \u0275", "ö \u00F6", "ò \u00F2", "ó \u00F3"],
+    "p": ["р \u0440", "ρ \u03C1"],
+
+    "q": ["զ \u0566"],
+    "r": ["г \u0433", "ṛ \u1E5B"],
+    "s": ["ѕ \u0455", "ʂ \u0282"],
+    "t": ["τ \u03C4", "т \u0442"],
+
+    "u": ["υ \u03C5", "ü \u00FC", "û \u00FB", "ú \u00FA"],
+    "v": ["ν \u03BD", "ѵ \u0475"],
+    "w": ["ш \u0448", "ԝ \u051D"],
+    "x": ["х \u0445", "χ \u03C7"],
+    "y": ["у \u0443", "ү \u04AF"],
+    "z": ["ʐ \u0290", "ž \u017E"],
+
+    # DIGITS
+    "0": ["O \u004F", "О \u041E", "ο \u03BF", "○ \u25CB"],
+    "1": ["l \u006C", "I \u0049", "ӏ \u04CF"],
+    "2": ["Ƨ \u01A7"],
+    "3": ["З \u0417", "ɜ \u025C"],
+    "4": ["Ꮞ \u13CE"],
+    "5": ["Ƽ \u01BC"],
+    "6": ["б \u0431"],
+    "7": ["Τ \u03A4"],
+    "8": ["੪ \u0A6A"],
+    "9": ["९ \u096F"],
+
+    # PUNCTUATION / SPECIAL
+    "-": ["‐ \u2010", "- \u2011", "– \u2013", "— \u2014", "− \u2212"],
+    ".": ["․ \u2024", "• \u2022", "。 \u3002"],
+    "_": ["﹍ \uFE4D", "＿ \uFF3F"],
+    "/": ["∕ \u2215"],
+    "\\": ["＼ \uFF3C"],
+}
 
-    return generated
+'''
+HOMOGRAPH_MAP split once into (homographic character, detection message) pairs for each letter
+'''
+HOMOGRAPH_REPLACEMENTS = {
+    letter: tuple((homograph.split(" ")[1], f"Homograph attack - replaced {letter} with {homograph.split(' ')[1]}") for homograph in homographs)
+    for letter, homographs in HOMOGRAPH_MAP.items()
+}
 
 # Check 2: Homograph attacks
 def homographCheck(packageName : str):
-    generated = []
-    HOMOGRAPH_MAP = {
-        "a": ["а \u0430", "ɑ \u0251", "à \u00E0", "á \u00E1", "â \u00E2", "ä \u00E4", "ã \u00E3"],
-        "b": ["Ь \u042C", "Ƅ \u0184", "ƅ \u0185", "Ь \u044C"],
-
-        "c": ["ϲ \u03F2", "с \u0441", "ƈ \u0188"],
-        "d": ["ԁ \u0501", "ɗ \u0257"],
-
-        "e": ["е \u0435", "є \u0454", "℮ \u212E", "é \u00E9", "ê \u00EA", "ë \u00EB"],
-        "f": ["ғ \u0493", "ƒ \u0192"],
-
-        "g": ["ɡ \u0261", "ġ \u0121", "ğ \u011F"],
-        "h": ["һ \u04BB", "հ \u0570"],
-
-        "i": ["ӏ \u04CF", "ı \u0131", "İ \u0130", "¡ \u00A1", "l \u006C", "1 \u0031"],
-        "j": ["ј \u0458"],
-        "k": ["κ \u03BA", "к \u043A"],
-        "l": ["Ɩ \u0196", "ӏ \u04CF", "ⅼ \u217C", "Ι \u0399"],
-
-        "m": ["м \u043C"],
-        "n": ["ո \u0576", "п \u043F"],
-
-        "o": ["ο \u03BF", "о \u043E", "ɵ \u0275", "ö \u00F6", "ò \u00F2", "ó \u00F3"],
-        "p": ["р \u0440", "ρ \u03C1"],
-
-        "q": ["զ \u0566"],
-        "r": ["г \u0433", "ṛ \u1E5B"],
-        "s": ["ѕ \u0455", "ʂ \u0282"],
-        "t": ["τ \u03C4", "т \u0442"],
-
-        "u": ["υ \u03C5", "ü \u00FC", "û \u00FB", "ú \u00FA"],
-        "v": ["ν \u03BD", "ѵ \u0475"],
-        "w": ["ш \u0448", "ԝ \u051D"],
-        "x": ["х \u0445", "χ \u03C7"],
-        "y": ["у \u0443", "ү \u04AF"],
-        "z": ["ʐ \u0290", "ž \u017E"],
-
-        # DIGITS
-        "0": ["O \u004F", "О \u041E", "ο \u03BF", "○ \u25CB"],
-        "1": ["l \u006C", "I \u0049", "ӏ \u04CF"],
-        "2": ["Ƨ \u01A7"],
-        "3": ["З \u0417", "ɜ \u025C"],
-        "4": ["Ꮞ \u13CE"],
-        "5": ["Ƽ \u01BC"],
-        "6": ["б \u0431"],
-        "7": ["Τ \u03A4"],
-        "8": ["੪ \u0A6A"],
-        "9": ["९ \u096F"],
-
-        # PUNCTUATION / SPECIAL
-        "-": ["‐ \u2010", "- \u2011", "– \u2013", "— \u2014", "− \u2212"],
-        ".": ["․ \u2024", "• \u2022", "。 \u3002"],
-        "_": ["﹍ \uFE4D", "＿ \uFF3F"],
-        "/": ["∕ \u2215"],
-        "\\": ["＼ \uFF3C"],
-    }
-
-    for letter in packageName:
-        if letter in HOMOGRAPH_MAP:
-            for homograph in HOMOGRAPH_MAP[letter]:
-                homograph_stripped = homograph.split(" ")[1] # gets the actual homographic character
-                modifiedName = packageName.replace(letter,homograph_stripped)
-                generated.append((modifiedName, packageName, f"Homograph attack - replaced {letter} with {homograph_stripped}"))
-    return generated
-
+    # Every occurrence of a letter is replaced at once, so a repeated letter would only generate the same names again
+    return [(packageName.replace(letter, homograph), packageName, message)
+            for letter in dict.fromkeys(packageName) for homograph, message in HOMOGRAPH_REPLACEMENTS.get(letter, ())]
 
-# Check 3: Combosquatting attacks
-def combosquattingCheck(packageName : str):
-    generated = []
-    prefixes = [
+COMBOSQUATTING_PREFIXES = (
     "node-", "js-", "ts-", "ng-", "react-", "vue-", "next-", "express-", "cli-", "utils-", "lib-",
     "crypto-", "secure-", "safe-", "auth-", "jwt-", "npmjs-", "github-", "aws-", "azure-", "gcp-",
     "windows-", "mac-", "limux-", "docker-", "plugin-"
-    ]
+)
 
-    suffixes = [
+COMBOSQUATTING_SUFFIXES = (
     "-js", "-ts", "-node", "-utils", "-helper", "-core", "-service", "-api", "-server", "-cli", "-module",
     "-v1", "-v2", "-v3", "-beta", "-dev", "-next", "-lite", "-min", "-pro", "-plus",
     "-pkg", "-package", "-script", "-lib", "-wrapper", "-official", "-verified", "-secure",
     "-aws", "-azure", "-gcp", "-windows", "-mac", "-linux", "-docker", "-plugin"
-    ]
+)
 
-    for prefix in prefixes:
-        generated.append((prefix + packageName, packageName, f"Combosquatting - added prefix"))
-
-   
-    for suffix in suffixes:
-        generated.append((packageName + suffix, packageName, f"Combosquatting - added suffix"))
-    
+# Check 3: Combosquatting attacks
+def combosquattingCheck(packageName : str):
+    generated = [(prefix + packageName, packageName, ADDED_PREFIX) for prefix in COMBOSQUATTING_PREFIXES]
+    generated += [(packageName + suffix, packageName, ADDED_SUFFIX) for suffix in COMBOSQUATTING_SUFFIXES]
     return generated
 
 # Check 4: Hyphen/underscore manipulation 
 def hyphenUnderscoreCheck(packageName : str):
-    generated = []
     if "-" in packageName:
-        generated.append((packageName.replace("-", "_"), packageName, f"Hyphen/underscore manipulation"))
+        return [(packageName.replace("-", "_"), packageName, HYPHEN_UNDERSCORE)]
     elif "_" in packageName:
-        generated.append((packageName.replace("_", "-"), packageName, f"Hyphen/underscore manipulation"))
-    return generated
+        return [(packageName.replace("_", "-"), packageName, HYPHEN_UNDERSCORE)]
+    return []
+
+'''
+Techniques attackers favour for squats that get installed by mistake, the notCreated names they produced are rechecked first. Anything else has a risk of 1
+'''
+TECHNIQUE_RISK = (
+    ("Homograph attack", 3.0),
+    (KEYBOARD_PROXIMITY, 3.0),
+    (SWAPPED_CHARACTERS, 2.0),
+    (ADDED_S, 2.0),
+    (HYPHEN_UNDERSCORE, 2.0),
+)
+
+def techniqueRisk(detectionMethods: str) -> float:
+    if not detectionMethods:
+        return 1.0
+    return max((risk for technique, risk in TECHNIQUE_RISK if technique in detectionMethods), default=1.0)
+
+'''
+How much a stale notCreated name is worth rechecking: its seed's weekly downloads (on a log scale so the biggest seeds don't starve the rest), the risk of
+the technique that made it and how long it has gone unchecked, so every name gets its turn eventually
+'''
+def recheckPriority(weeklyDownloads, detectionMethods, ageDays) -> float:
+    return techniqueRisk(detectionMethods) * math.log10((weeklyDownloads or 0) + 10) * ageDays
+
+'''
+The techniques a sweep can be limited to with --only-technique, in the order their candidates are generated
+'''
+TECHNIQUE_CHECKS = {
+    "levenshtein": levenshteinCheck,
+    "homograph": homographCheck,
+    "combosquatting": combosquattingCheck,
+    "hyphen-underscore": hyphenUnderscoreCheck,
+}
 
 def redText(text):
     print(f"\033[31m{text}\033[0m")
@@ -379,5 +881,34 @@ def blueText(text):
 def yellowText(text: str):
     print(f"\033[93m{text}\033[0m")
 
+def main():
+    parser = argparse.ArgumentParser(description="Generates typosquatting variations of the legitimate packages and checks which of them exist on npm")
+    parser.add_argument("--workers", type=int, default=1, help="processes used to generate the candidates (default 1, generates in this process)")
+    start = parser.add_mutually_exclusive_group()
+    start.add_argument("--resume", action="store_true", help="carry on from where the last sweep was stopped")
+    start.add_argument("--from-seed", metavar="PACKAGE", help="start a new sweep at this legitimate package, skipping the ones before it")
+    parser.add_argument("--only-technique", action="append", choices=list(TECHNIQUE_CHECKS), help="only generate candidates with this technique (can be given more than once)")
+    parser.add_argument("--incremental", action="store_true", help="only sweep legitimate packages added since the last finished sweep, then recheck old notCreated names")
+    parser.add_argument("--recheck", action="store_true", help="don't sweep, only recheck old notCreated names within today's budget")
+    parser.add_argument("--watch", action="store_true", help="with --recheck, keep running and spread the daily budget over the day")
+    parser.add_argument("--recheck-days", type=float, default=RECHECK_TTL_DAYS, help=f"age in days after which a notCreated name is rechecked (default {RECHECK_TTL_DAYS})")
+    parser.add_argument("--daily-budget", type=int, default=RECHECK_DAILY_BUDGET, help=f"registry requests a day the recheck may spend (default {RECHECK_DAILY_BUDGET})")
+    args = parser.parse_args()
+    if args.recheck:
+        try:
+            if args.watch:
+                recheckScheduler(args.recheck_days, args.daily_budget)
+            else:
+                createNotCreatedDatabase()
+                recheckNotCreated(args.recheck_days, args.daily_budget)
+        except KeyboardInterrupt:
+            yellowText("Recheck stopped")
+        return
+    try:
+        packageNamesFromDatabase(workers=max(1, args.workers), resume=args.resume, fromSeed=args.from_seed, techniques=args.only_technique,
+                                 incremental=args.incremental, recheckDays=args.recheck_days, dailyBudget=args.daily_budget)
+    except KeyboardInterrupt:
+        yellowText("Sweep stopped, run again with --resume to carry on from the last checkpoint")
+
 if __name__ == "__main__":
-    packageNamesFromDatabase()
\ No newline at end of file
+    main()
\ No newline at end of file
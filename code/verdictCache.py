@@ -0,0 +1,188 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+'''
+Persistent cache of scan verdicts, stored in database/verdictCache.db, so scanning a package again skips the registry lookups and the sandboxed npm install
+
+Each verdict is keyed by (package, version, database generation, rules version, scoring version, whether the install scripts were scanned):
+    version is what the install scripts were scanned at, the versions a lockfile pins or the latest version on the registry (checked again on every scan) when no
+    version is pinned or only the live download counts were scored
+    database generation is PackageStore.generation when the package was scored, it changes with every legitimate or typosquatted row that is added, updated or
+    removed (a new typosquat or legitimate seed can change the index score of packages that aren't in the databases themselves)
+    rules version is a hash of ScriptScanner.loadRules (see scanInstallScripts.rulesVersion) and scoring version is nscan.SCORING_VERSION
+so a new release, a database change, a change to the script rules or a change to the scoring all give a key that isn't cached yet. Storing a verdict removes the
+package's verdicts from any other generation, rules version or scoring version, they could never be used again, while the verdicts for its other versions are kept
+for the other projects that pin them. Verdicts also expire after a TTL because the download counts they were scored on change.
+The verdict itself is the result dictionary of a scan: the index score breakdown, the install script findings, the scores and the final state.
+
+Usage: python code/verdictCache.py stats || python code/verdictCache.py purge [--expired] [--package <name>] || python code/verdictCache.py show <package>
+'''
+
+CACHE_PATH = "database/verdictCache.db"
+VERDICT_TTL = 24 * 60 * 60 # Seconds a verdict is used for, the download counts it was scored on come from a cache with a 6 hour TTL anyway
+CACHE_SCHEMA_VERSION = 2 # PRAGMA user_version of the cache, a cache made with another key is dropped since none of its verdicts could be looked up
+VERSION_CHECK_MAX_AGE = 10 * 60 # The latest version is asked for again (a cheap 304 if nothing changed) once the cached packument is older than this, so a new release is seen quickly
+
+class VerdictCache:
+    def __init__(self, path: str = CACHE_PATH, ttl: float = VERDICT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "invalidated": 0}
+        self.connect = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connect.execute("PRAGMA journal_mode=WAL")
+        self.connect.execute("PRAGMA synchronous=NORMAL")
+        if self.connect.execute("PRAGMA user_version").fetchone()[0] != CACHE_SCHEMA_VERSION:
+            self.connect.execute("DROP TABLE IF EXISTS verdictCache")
+            self.connect.execute(f"PRAGMA user_version = {CACHE_SCHEMA_VERSION}")
+        self.connect.execute('''
+        CREATE TABLE IF NOT EXISTS verdictCache(
+                    packageName TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    databaseGeneration TEXT NOT NULL,
+                    rulesVersion TEXT NOT NULL,
+                    scoringVersion INTEGER NOT NULL,
+                    scriptsScanned INTEGER NOT NULL,
+                    verdict TEXT NOT NULL,
+                    createdAt REAL NOT NULL,
+                    PRIMARY KEY (packageName, version, databaseGeneration, rulesVersion, scoringVersion, scriptsScanned))
+                    ''')
+
+    '''
+    Returns the cached verdict dictionary (with "cachedAt" added) if one exists for exactly this key and is within its TTL, otherwise None
+    '''
+    def get(self, packageName: str, version: str, databaseGeneration: str, rulesVersion: str, scoringVersion: int, scriptsScanned: bool):
+        with self.lock:
+            row = self.connect.execute('''
+                SELECT verdict, createdAt FROM verdictCache
+                WHERE packageName = ? AND version = ? AND databaseGeneration = ? AND rulesVersion = ? AND scoringVersion = ? AND scriptsScanned = ?''',
+                (packageName, version, databaseGeneration, rulesVersion, scoringVersion, int(scriptsScanned))).fetchone()
+            if row is None or time.time() - row[1] >= self.ttl:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+        verdict = json.loads(row[0])
+        verdict["cachedAt"] = row[1]
+        return verdict
+
+    '''
+    Stores a verdict and drops the package's verdicts from any other database generation, rules version or scoring version
+    '''
+    def put(self, packageName: str, version: str, databaseGeneration: str, rulesVersion: str, scoringVersion: int, scriptsScanned: bool, verdict: dict):
+        verdict = {key: value for key, value in verdict.items() if key not in ("versions", "cached", "cachedAt", "elapsedMs")} # versions come from the project being scanned, not the package
+        with self.lock:
+            self.connect.execute("BEGIN")
+            removed = self.connect.execute('''
+                DELETE FROM verdictCache WHERE packageName = ? AND scriptsScanned = ? AND NOT (databaseGeneration = ? AND rulesVersion = ? AND scoringVersion = ?)''',
+                (packageName, int(scriptsScanned), databaseGeneration, rulesVersion, scoringVersion)).rowcount
+            self.connect.execute('''
+                INSERT OR REPLACE INTO verdictCache (packageName, version, databaseGeneration, rulesVersion, scoringVersion, scriptsScanned, verdict, createdAt)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', (packageName, version, databaseGeneration, rulesVersion, scoringVersion, int(scriptsScanned), json.dumps(verdict), time.time()))
+            self.connect.execute("COMMIT")
+            self.stats["stores"] += 1
+            self.stats["invalidated"] += removed
+
+    def purge(self, expiredOnly: bool = False, packageName: str = None) -> int:
+        conditions = []
+        parameters = []
+        if expiredOnly:
+            conditions.append("createdAt <= ?")
+            parameters.append(time.time() - self.ttl)
+        if packageName:
+            conditions.append("packageName = ?")
+            parameters.append(packageName)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self.lock:
+            removed = self.connect.execute(f"DELETE FROM verdictCache{where}", parameters).rowcount
+            self.connect.execute("VACUUM")
+        return removed
+
+    def summary(self) -> dict:
+        with self.lock:
+            count, packages, oldest, newest = self.connect.execute("SELECT COUNT(*), COUNT(DISTINCT packageName), MIN(createdAt), MAX(createdAt) FROM verdictCache").fetchone()
+            expired = self.connect.execute("SELECT COUNT(*) FROM verdictCache WHERE createdAt <= ?", (time.time() - self.ttl,)).fetchone()[0]
+        return {"entries": count, "packages": packages, "expired": expired, "oldest": oldest, "newest": newest}
+
+    def close(self):
+        with self.lock:
+            self.connect.close()
+
+_cache = None
+_cacheLock = threading.Lock()
+_cacheDisabled = os.environ.get("NSCAN_VERDICT_CACHE", "1") == "0" # NSCAN_VERDICT_CACHE=0 always scans packages again
+
+'''
+Returns the shared verdict cache, or None if it is turned off or can't be opened (e.g. there is no database/ folder)
+'''
+def getVerdictCache():
+    global _cache, _cacheDisabled
+    if _cacheDisabled:
+        return None
+    with _cacheLock:
+        if _cache is None:
+            try:
+                _cache = VerdictCache()
+            except sqlite3.Error as e:
+                print(f"verdictCache: Could not open {CACHE_PATH}, verdict caching disabled. Error is {e}")
+                _cacheDisabled = True
+                return None
+    return _cache
+
+def setVerdictCacheEnabled(enabled: bool):
+    global _cacheDisabled
+    _cacheDisabled = not enabled
+
+'''
+Closes the shared cache so the next getVerdictCache opens it again (e.g. from another working directory)
+'''
+def closeVerdictCache():
+    global _cache
+    with _cacheLock:
+        if _cache is not None:
+            _cache.close()
+            _cache = None
+
+def formatTimestamp(timestamp):
+    return time.strftime("%d-%m-%Y %H:%M:%S", time.localtime(timestamp)) if timestamp else "-"
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or purge the cache of scan verdicts")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("stats", help="show the number of verdicts and how many have expired")
+    purge = subparsers.add_parser("purge", help="delete cached verdicts (everything by default)")
+    purge.add_argument("--expired", action="store_true", help="only delete verdicts past their TTL")
+    purge.add_argument("--package", help="only delete the verdicts for this package")
+    show = subparsers.add_parser("show", help="show the cached verdicts for a package")
+    show.add_argument("package")
+    args = parser.parse_args()
+
+    cache = VerdictCache()
+    if args.command == "stats":
+        summary = cache.summary()
+        print(f"Verdicts: {summary['entries']} for {summary['packages']} packages ({summary['expired']} expired)")
+        print(f"Oldest: {formatTimestamp(summary['oldest'])}")
+        print(f"Newest: {formatTimestamp(summary['newest'])}")
+    elif args.command == "purge":
+        removed = cache.purge(expiredOnly=args.expired, packageName=args.package)
+        print(f"Removed {removed} verdicts")
+    elif args.command == "show":
+        rows = cache.connect.execute('''
+            SELECT version, databaseGeneration, rulesVersion, scoringVersion, scriptsScanned, verdict, createdAt FROM verdictCache WHERE packageName = ? ORDER BY createdAt''', (args.package,)).fetchall()
+        if not rows:
+            print(f"{args.package} has no cached verdicts")
+        for version, databaseGeneration, rulesVersion, scoringVersion, scriptsScanned, verdict, createdAt in rows:
+            verdict = json.loads(verdict)
+            print(f"{args.package}@{version}: {verdict['state']} (overall {verdict['overallScore']}, index {verdict['indexScore']}, scripts {verdict['scriptScore']})")
+            print(f"  Database generation {databaseGeneration}, rules {rulesVersion}, scoring version {scoringVersion}, install scripts {'scanned' if scriptsScanned else 'not scanned'}, cached {formatTimestamp(createdAt)}")
+            for item in verdict.get("breakdown", []):
+                print(f"  +{item['points']} {item['reason']}")
+            for finding in verdict.get("scriptFindings", []):
+                print(f"  - Script: {finding['scriptName']}, {finding['description']}, severity: {finding['severity']}")
+    cache.close()
+
+if __name__ == "__main__":
+    main()
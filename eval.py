@@ -14,8 +14,8 @@ if sys.platform == 'win32':
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from nscan import (
-    checkInTyposquattedDB,
-    checkInLegitimateDB,
+    resolvePackage,
+    PackageInfo,
     calculateSuspiciousIndexScore,
     calculateIndexScoreForTyposquatting,
     getWeeklyDownloadsBasic,
@@ -51,7 +51,8 @@ def evaluate_package(packageName):
     overallIndexScore = 0
     
     # Logic copied/adapted from nscan.py main()
-    if not checkInTyposquattedDB(packageName) and not checkInLegitimateDB(packageName):
+    resolved = resolvePackage(packageName)
+    if not resolved.inDatabase:
         print(f"Package not in database, getting information...")
         weeklyDownloads = getWeeklyDownloadsBasic(packageName)
         monthlyDownloads = getMonthlyDownloadsBasic(packageName)
@@ -61,33 +62,21 @@ def evaluate_package(packageName):
             return None
             
         lastUpdate = getLastUpdate(packageName)
-        suspiciousIndexScore = calculateSuspiciousIndexScore(weeklyDownloads, monthlyDownloads, lastUpdate)
+        suspiciousIndexScore = calculateSuspiciousIndexScore(PackageInfo(packageName, weeklyDownloads, monthlyDownloads, lastUpdate))
         print(f"Suspicious index score: {suspiciousIndexScore}")
         overallIndexScore += suspiciousIndexScore
         
-    elif checkInTyposquattedDB(packageName):
+    elif resolved.typosquatted:
         print(f"Found in typosquatted database.")
-        packageInfo = checkInTyposquattedDB(packageName)
-        # packageInfo structure: (id, packageName, typosquattedFrom, weekly, monthly, lastUpdate, detectionMethods)
-        # nscan.py uses indices: originalPackage=2, weekly=3, monthly=4, lastUpdate=5, message=6
-        originalPackage = packageInfo[2]
-        weeklyDownloads = packageInfo[3]
-        monthlyDownloads = packageInfo[4]
-        lastUpdate = packageInfo[5]
-        message = packageInfo[6]
+        # resolved.typosquatted is the typosquatted row, resolved.original the legitimate row of the package it typosquats
+        packageInfo = resolved.typosquatted
         
-        typosquattingIndexScore = calculateIndexScoreForTyposquatting(originalPackage, weeklyDownloads, monthlyDownloads, lastUpdate, message)
+        typosquattingIndexScore = calculateIndexScoreForTyposquatting(packageInfo, resolved.original, packageInfo.detectionMethods)
         print(f"Typosquatting index score: {typosquattingIndexScore}")
         overallIndexScore += typosquattingIndexScore
         
-    elif checkInLegitimateDB(packageName):
+    else:
         print(f"Found in legitimate database.")
-        # legitimate table structure: (id, packageName, weekly, monthly, lastUpdate)
-        # nscan.py uses indices: weekly=2, monthly=3, lastUpdate=4
-        packageInfo = checkInLegitimateDB(packageName)
-        weeklyDownloads = packageInfo[2]
-        monthlyDownloads = packageInfo[3]
-        lastUpdate = packageInfo[4]
         print("No index score added.")
 
     if overallIndexScore >= 10:
@@ -0,0 +1,34 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "code"))
+
+import packageStore
+
+'''
+A PackageStore on empty databases in a temporary folder, also used as the shared store (getStore) for the length of the test
+'''
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    temporaryStore = packageStore.PackageStore(str(tmp_path))
+    monkeypatch.setattr(packageStore, "_store", temporaryStore)
+    yield temporaryStore
+    temporaryStore.close()
+
+'''
+A daemon on a free localhost port whose verdicts are stubbed, so only the request handling is tested
+'''
+@pytest.fixture
+def daemon(monkeypatch):
+    from nscanDaemon import makeServer # Imported here as it loads the whole scanner
+    server = makeServer("127.0.0.1", 0, quiet=True)
+    monkeypatch.setattr(server.service, "verdicts", lambda packageNames, scripts="auto": [{"packageName": name, "state": "legitimate"} for name in packageNames])
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    server.service.worker.shutdown()
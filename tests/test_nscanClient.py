@@ -0,0 +1,40 @@
+import socket
+import time
+
+import pytest
+
+import nscanClient
+
+@pytest.fixture
+def pointClientAt(monkeypatch):
+    def point(port: int):
+        monkeypatch.setattr(nscanClient, "DAEMON_URL", f"http://127.0.0.1:{port}")
+        monkeypatch.setattr(nscanClient, "_daemonDisabled", False)
+    return point
+
+def test_verdicts_come_back_from_the_daemon(daemon, pointClientAt):
+    pointClientAt(daemon.server_address[1])
+    assert nscanClient.fetchVerdict("@babel/core") == {"packageName": "@babel/core", "state": "legitimate"}
+    assert nscanClient.fetchVerdicts(["left-pad", "react"]) == [{"packageName": "left-pad", "state": "legitimate"}, {"packageName": "react", "state": "legitimate"}]
+
+def test_connect_timeout_is_short_and_read_timeout_long(daemon, pointClientAt, monkeypatch):
+    pointClientAt(daemon.server_address[1])
+    timeouts = []
+    class RecordingConnection(nscanClient.HTTPConnection):
+        def getresponse(self):
+            timeouts.append((self.timeout, self.sock.gettimeout()))
+            return super().getresponse()
+    monkeypatch.setattr(nscanClient, "HTTPConnection", RecordingConnection)
+    assert nscanClient.fetchVerdict("left-pad") is not None
+    assert timeouts == [(nscanClient.DAEMON_CONNECT_TIMEOUT, nscanClient.DAEMON_TIMEOUT)]
+
+def test_no_daemon_or_a_silent_one_falls_back(pointClientAt):
+    with socket.socket() as listener:
+        listener.bind(("127.0.0.1", 0))
+        port = listener.getsockname()[1]
+        pointClientAt(port)
+        assert nscanClient.fetchVerdict("left-pad") is None # Nothing listening, refused straight away
+        listener.listen() # Accepts the connection but never answers
+        start = time.perf_counter()
+        assert nscanClient.daemonRequest("/health", timeout=0.3) is None
+        assert time.perf_counter() - start < 2
@@ -0,0 +1,32 @@
+import http.client
+import json
+
+import pytest
+
+def request(server, headers: dict, path: str = "/verdict?name=left-pad"):
+    connection = http.client.HTTPConnection(*server.server_address[:2], timeout=5)
+    connection.putrequest("GET", path, skip_host=True, skip_accept_encoding=True)
+    for name, value in headers.items():
+        connection.putheader(name, value)
+    connection.endheaders()
+    response = connection.getresponse()
+    body = json.loads(response.read())
+    connection.close()
+    return response.status, body
+
+def test_localhost_request_is_answered(daemon):
+    port = daemon.server_address[1]
+    for host in (f"localhost:{port}", f"127.0.0.1:{port}"):
+        assert request(daemon, {"Host": host}) == (200, {"packageName": "left-pad", "state": "legitimate"})
+    assert request(daemon, {"Host": f"127.0.0.1:{port}", "Sec-Fetch-Site": "none"})[0] == 200 # The user typed the URL into the browser
+
+def test_foreign_host_is_refused(daemon):
+    port = daemon.server_address[1]
+    for host in (f"attacker.example:{port}", "localhost", f"localhost:{port + 1}"): # A DNS rebinding page sends its own name as the Host
+        assert request(daemon, {"Host": host}) == (403, {"error": "unknown Host"})
+    assert request(daemon, {})[0] == 403
+
+@pytest.mark.parametrize("headers", [{"Origin": "https://attacker.example"}, {"Origin": "null"}, {"Sec-Fetch-Site": "cross-site"}, {"Sec-Fetch-Site": "same-site"}])
+def test_requests_from_web_pages_are_refused(daemon, headers):
+    headers = dict(headers, Host=f"127.0.0.1:{daemon.server_address[1]}")
+    assert request(daemon, headers) == (403, {"error": "requests from web pages are not allowed"})
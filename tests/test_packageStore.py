@@ -0,0 +1,27 @@
+import sqlite3
+
+import packageStore
+from packageStore import PackageStore, SCHEMA_VERSION
+
+def test_legacy_databases_are_migrated_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "database").mkdir()
+    import typosquatting
+    typosquatting.createTyposquattingDatabase() # The old setup scripts create the tables without the newer columns
+    typosquatting.createNotCreatedDatabase()
+    legacy = sqlite3.connect("database/notCreated.db")
+    legacy.execute("INSERT INTO notCreated (packageName) VALUES ('coer')")
+    legacy.commit()
+    legacy.close()
+
+    store = PackageStore("database")
+    columns = {row[1] for row in store.connect.execute("PRAGMA typosquatted.table_info(typosquatted)")}
+    assert "provenance" in columns
+    assert store.connect.execute("SELECT checkedAt IS NOT NULL FROM notCreated.notCreated WHERE packageName = 'coer'").fetchone()[0] == 1
+    assert [store.connect.execute(f"PRAGMA {schema}.user_version").fetchone()[0] for schema in packageStore.SCHEMAS] == [SCHEMA_VERSION] * 3
+    store.close()
+
+    probes = []
+    monkeypatch.setattr(PackageStore, "addColumnIfMissing", lambda self, *arguments: probes.append(arguments))
+    PackageStore("database").close()
+    assert probes == [] # Up to date databases aren't probed for missing columns again
@@ -0,0 +1,26 @@
+import importlib
+
+import pytest
+
+'''
+populateDatabase imports databaseSetup, which opens database/legitimate.db as soon as it is imported, so it is imported from a temporary folder
+'''
+@pytest.fixture
+def populateDatabase(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "database").mkdir()
+    return importlib.import_module("populateDatabase")
+
+@pytest.mark.parametrize("weeklyDownloads, monthlyDownloads, kept", [
+    (2000000, 9000000, True),
+    (10000, 100000, True),
+    (9999, 9000000, False),
+    (2000000, 99999, False),
+    (500, 2000, False), # Used to be kept, then pruned again by removeLowDownloads
+    (None, 9000000, False),
+])
+def test_only_high_impact_packages_are_kept(populateDatabase, weeklyDownloads, monthlyDownloads, kept):
+    row = populateDatabase.highImpactRow("left-pad", weeklyDownloads, monthlyDownloads, "01-01-2026 00:00:00")
+    assert (row is not None) == kept
+    if kept:
+        assert row == ("left-pad", weeklyDownloads, monthlyDownloads, "01-01-2026 00:00:00")
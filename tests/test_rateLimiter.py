@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+
+import rateLimiter
+from rateLimiter import AdaptiveRateLimiter, parseRetryAfter
+
+URL = "https://registry.example/left-pad"
+
+'''
+Stands in for the time module in rateLimiter, sleeping only moves the clock on
+'''
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    fakeClock = FakeClock()
+    monkeypatch.setattr(rateLimiter, "time", fakeClock)
+    return fakeClock
+
+def test_rate_grows_additively_and_halves_once_per_window(clock):
+    limiter = AdaptiveRateLimiter({"registry.example": (10.0, 12.0)})
+    bucket = limiter.bucketFor(URL)
+    for _ in range(5):
+        limiter.onSuccess(URL)
+    assert bucket.rate == pytest.approx(10.5)
+    for _ in range(100):
+        limiter.onSuccess(URL)
+    assert bucket.rate == 12.0 # Capped at the host's maximum
+
+    limiter.onRateLimited(URL, "1")
+    assert bucket.rate == 6.0
+    limiter.onRateLimited(URL, "1") # Another 429 from a request already in flight in the same window
+    assert bucket.rate == 6.0
+    clock.now += rateLimiter.DECREASE_WINDOW
+    limiter.onRateLimited(URL, "1")
+    assert bucket.rate == 3.0
+    for _ in range(10):
+        clock.now += rateLimiter.DECREASE_WINDOW
+        limiter.onRateLimited(URL, "1")
+    assert bucket.rate == rateLimiter.MIN_RATE
+
+def test_acquire_spaces_requests_at_the_rate(clock):
+    limiter = AdaptiveRateLimiter({"registry.example": (2.0, 2.0)})
+    start = clock.now
+    for _ in range(5):
+        limiter.acquire(URL)
+    assert clock.now - start == pytest.approx(2.0) # The bucket starts with one token, then gets one every half second
+
+def test_retry_after_seconds_blocks_the_host(clock):
+    limiter = AdaptiveRateLimiter({"registry.example": (10.0, 10.0)})
+    assert limiter.onRateLimited(URL, "30") == 30.0
+    start = clock.now
+    limiter.acquire(URL)
+    assert clock.now - start >= 30.0
+    assert limiter.bucketFor("https://other.example/x").blockedUntil == 0.0 # Other hosts aren't blocked
+
+def test_retry_after_http_date_blocks_the_host(clock):
+    limiter = AdaptiveRateLimiter({"registry.example": (10.0, 10.0)})
+    retryAt = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=120), usegmt=True)
+    delay = limiter.onRateLimited(URL, retryAt)
+    assert 118.0 <= delay <= 120.0 # HTTP dates only have whole seconds
+    assert limiter.bucketFor(URL).blockedUntil == clock.now + delay
+
+def test_missing_retry_after_uses_jittered_backoff(clock):
+    limiter = AdaptiveRateLimiter({"registry.example": (10.0, 10.0)})
+    delays = []
+    for _ in range(3):
+        clock.now += rateLimiter.DECREASE_WINDOW
+        delays.append(limiter.onRateLimited(URL))
+    for attempt, delay in enumerate(delays): # Half of base * 2^attempt is fixed and half is random
+        full = rateLimiter.BACKOFF_BASE * 2 ** attempt
+        assert full / 2 <= delay <= full
+
+@pytest.mark.parametrize("value, expected", [("0", 0.0), ("45", 45.0), ("-3", 0.0), ("Wed, 21 Oct 2015 07:28:00 GMT", 0.0), ("", None), ("soon", None)])
+def test_parse_retry_after(value, expected):
+    assert parseRetryAfter(value) == expected
@@ -0,0 +1,24 @@
+from typosquatIndex import TyposquatIndex
+
+LEGITIMATE = [("react", 20000000), ("preact", 3000000), ("eslint", 30000000), ("express", 25000000), ("lodash", 40000000),
+              ("webpack", 20000000), ("requests", 100000), ("session", 50000), ("merge", 5000000)]
+
+def makeIndex():
+    return TyposquatIndex(LEGITIMATE)
+
+def test_plugins_and_addons_named_after_a_package_are_not_flagged():
+    index = makeIndex()
+    for name in ["eslint-plugin-x", "eslint-plugin-foo", "@types/x", "@types/react", "express-session", "lodash.merge", "webpack-cli"]:
+        assert index.detect(name) == [], name
+
+def test_combosquat_of_a_misspelt_name_is_flagged():
+    matches = makeIndex().detect("reqeusts-lite")
+    assert [name for name, _, _ in matches] == ["requests"]
+    assert matches[0][1] >= 1
+    assert matches[0][2].startswith("Combosquatting - contains requests misspelt")
+
+def test_whole_name_typo_is_flagged():
+    assert makeIndex().detect("expresss")[0][:2] == ("express", 1)
+
+def test_legitimate_name_is_not_flagged():
+    assert makeIndex().detect("preact") == []
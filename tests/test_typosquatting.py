@@ -0,0 +1,118 @@
+import pytest
+
+import typosquatting
+from packageStore import loadProvenance
+from typosquatting import Candidate, CandidateDeduper
+
+def candidate(packageName: str, seed: str = "core", technique: str = typosquatting.ADDED_S) -> Candidate:
+    return Candidate(packageName, seed, technique, [(seed, technique)])
+
+'''
+Stubs the registry calls checkBatch makes, the bulk existence check fails like the real downloads API does if a scoped name is in a bulk request
+existing is the set of names that exist, returns the list of name lists each existence check was called with
+'''
+def stubRegistry(monkeypatch, existing: set) -> list:
+    calls = []
+    def checkBulkPackageExists(packageNames):
+        calls.append(list(packageNames))
+        if len(packageNames) > 1 and any(name.startswith("@") for name in packageNames):
+            return {}
+        return {name: name in existing for name in packageNames}
+    def batchDownloads(batchString):
+        assert "@" not in batchString
+        return {name: {"downloads": 5} for name in batchString.split(",") if name in existing}
+    monkeypatch.setattr(typosquatting, "checkBulkPackageExists", checkBulkPackageExists)
+    monkeypatch.setattr(typosquatting, "getBatchWeeklyDownloads", batchDownloads)
+    monkeypatch.setattr(typosquatting, "getBatchMonthlyDownloads", batchDownloads)
+    monkeypatch.setattr(typosquatting, "getWeeklyDownloads", lambda name: 5)
+    monkeypatch.setattr(typosquatting, "getMonthlyDownloads", lambda name: 20)
+    monkeypatch.setattr(typosquatting, "getBatchLastUpdate", lambda names: {name: "01-01-2024 00:00:00" for name in names})
+    return calls
+
+def test_batch_with_scoped_names_is_checked_in_one_bulk_call(store, monkeypatch):
+    calls = stubRegistry(monkeypatch, {"cores", "@babel/cores"})
+    batch = [candidate("cores"), candidate("coer"), candidate("@babel/cores", "@babel/core"), candidate("@babel/coer", "@babel/core")]
+
+    assert typosquatting.checkBatch(store, batch, CandidateDeduper()) == (2, 2)
+    assert calls == [["cores", "coer"], ["@babel/cores"], ["@babel/coer"]]
+    typosquatted = {row[0] for row in store.connect.execute("SELECT packageName FROM typosquatted.typosquatted")}
+    notCreated = {row[0] for row in store.connect.execute("SELECT packageName FROM notCreated.notCreated")}
+    assert typosquatted == {"cores", "@babel/cores"}
+    assert notCreated == {"coer", "@babel/coer"}
+
+def test_mixed_batch_is_never_retried_or_split(store, monkeypatch):
+    calls = stubRegistry(monkeypatch, set())
+    monkeypatch.setattr(typosquatting.time, "sleep", lambda seconds: None)
+    names = [f"core{i}" for i in range(6)] + ["@babel/cores", "@types/nodee"]
+    typosquatting.processBatches(iter([candidate(name) for name in names]), batchSize=len(names))
+
+    assert sum(1 for call in calls if len(call) > 1) == 1
+    assert len(calls) == 3
+    assert store.connect.execute("SELECT COUNT(*) FROM notCreated.notCreated").fetchone()[0] == len(names)
+
+def test_rolled_back_batch_resumes_from_the_checkpoint_before_the_last(store, monkeypatch):
+    stubRegistry(monkeypatch, {"cores"})
+    with store.transaction():
+        store.upsertLegitimate([(name, 100000, 400000, "01-01-2026 00:00:00") for name in ("core", "lodash", "react")])
+    options = {"techniques": None, "incremental": False, "firstSeedId": None}
+    for seedName, candidateOffset, batchNumber in (("core", 4, 1), ("lodash", 2, 2)):
+        with store.transaction():
+            store.saveCheckpoint(seedName, store.legitimateId(seedName), candidateOffset, batchNumber, batchNumber * 10, [], options)
+
+    def crash():
+        store.saveCheckpoint("react", store.legitimateId("react"), 7, 3, 30, [], options)
+        raise RuntimeError("killed before the batch was committed")
+    with pytest.raises(RuntimeError):
+        typosquatting.checkBatch(store, [candidate("cores"), candidate("coer")], CandidateDeduper(), crash)
+
+    assert store.connect.execute("SELECT COUNT(*) FROM typosquatted.typosquatted").fetchone()[0] == 0
+    assert store.loadCheckpoint(rewind=False)["seedName"] == "lodash" # The checkpoint written in the batch's transaction was rolled back with it
+    firstSeedId, skipCandidates, checkpoint, resumedOptions = typosquatting.sweepStart(store, True, None, None)
+    assert (firstSeedId, skipCandidates) == (store.legitimateId("core"), 5) # Starts again after the last candidate batched before the last checkpoint
+    assert (checkpoint["seedName"], checkpoint["batchNumber"], checkpoint["processedPackages"]) == ("core", 1, 10)
+    assert resumedOptions == options
+
+def test_single_bad_name_is_isolated_without_a_final_backoff(store, monkeypatch):
+    calls = stubRegistry(monkeypatch, set())
+    def checkBulkPackageExists(packageNames):
+        calls.append(list(packageNames))
+        return {} if "bad" in packageNames else {name: False for name in packageNames} # Any request with the name in it fails
+    monkeypatch.setattr(typosquatting, "checkBulkPackageExists", checkBulkPackageExists)
+    sleeps = []
+    monkeypatch.setattr(typosquatting.time, "sleep", sleeps.append)
+    names = ["corea", "coreb", "corec", "bad"]
+    report = typosquatting.processBatches(iter([candidate(name) for name in names]), batchSize=len(names))
+
+    assert report["failed"] == ["bad"]
+    assert report["splits"] == 2 # 4 -> 2 + 2, then the half with the bad name -> 1 + 1
+    assert calls[-1] == ["bad"]
+    failures = sum(1 for call in calls if "bad" in call)
+    assert failures == 2 * typosquatting.MAX_BATCH_ATTEMPTS + 1 # The whole batch and the bad name get every attempt, the half is split on its first failure
+    assert len(sleeps) == failures - 1 # A backoff after every failure except the one it gave up on
+    notCreated = {row[0] for row in store.connect.execute("SELECT packageName FROM notCreated.notCreated")}
+    assert notCreated == {"corea", "coreb", "corec"}
+
+@pytest.mark.parametrize("expectedCandidates", [0, 11], ids=["set", "bloom"])
+def test_duplicate_candidates_become_one_row_with_all_provenance(store, monkeypatch, expectedCandidates):
+    monkeypatch.setattr(typosquatting, "BLOOM_THRESHOLD", 10)
+    assert isinstance(CandidateDeduper(expectedCandidates).seen, typosquatting.BloomFilter) == (expectedCandidates > 10)
+    calls = stubRegistry(monkeypatch, {"cores", "reacts"})
+    candidates = [
+        candidate("cores", "core", typosquatting.ADDED_S),
+        candidate("cores", "corse", typosquatting.SWAPPED_CHARACTERS), # Duplicate in the same batch, merged before the row is written
+        candidate("reacts", "react", typosquatting.ADDED_S),
+        candidate("coer", "core", typosquatting.SWAPPED_CHARACTERS),
+        candidate("corez", "core", typosquatting.KEYBOARD_PROXIMITY),
+        candidate("cores", "cores", typosquatting.DUPLICATED_CHARACTER), # Duplicate after its row was written, merged into the row afterwards
+        candidate("reacts", "reactss", typosquatting.REMOVED_CHARACTER),
+    ]
+    report = typosquatting.processBatches(iter(candidates), batchSize=2, expectedCandidates=expectedCandidates)
+
+    assert report["failed"] == []
+    assert sorted(name for call in calls for name in call) == ["coer", "cores", "corez", "reacts"] # Every name is checked once
+    rows = store.connect.execute("SELECT packageName, detectionMethods, provenance FROM typosquatted.typosquatted ORDER BY packageName").fetchall()
+    assert [row[0] for row in rows] == ["cores", "reacts"]
+    provenance = {packageName: loadProvenance(value) for packageName, _, value in rows}
+    assert provenance["cores"] == [("core", typosquatting.ADDED_S), ("corse", typosquatting.SWAPPED_CHARACTERS), ("cores", typosquatting.DUPLICATED_CHARACTER)]
+    assert provenance["reacts"] == [("react", typosquatting.ADDED_S), ("reactss", typosquatting.REMOVED_CHARACTER)]
+    assert rows[0][1] == "; ".join([typosquatting.ADDED_S, typosquatting.SWAPPED_CHARACTERS, typosquatting.DUPLICATED_CHARACTER])